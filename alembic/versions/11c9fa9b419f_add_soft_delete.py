@@ -0,0 +1,57 @@
+"""Add soft delete to users and vectorstores
+
+Revision ID: 11c9fa9b419f
+Revises: 453a4000e488
+Create Date: 2026-10-19 18:04:52.330817
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "11c9fa9b419f"
+down_revision: Union[str, None] = "453a4000e488"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "users", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.add_column(
+        "vectorstores",
+        sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.drop_constraint("users_telegram_id_key", "users", type_="unique")
+    op.create_index(
+        "uix_users_telegram_id",
+        "users",
+        ["telegram_id"],
+        unique=True,
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+    op.drop_constraint("uix_user_vectorstore_file_name", "vectorstores", type_="unique")
+    op.create_index(
+        "uix_user_vectorstore_file_name",
+        "vectorstores",
+        ["user_id", "file_name"],
+        unique=True,
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("uix_user_vectorstore_file_name", table_name="vectorstores")
+    op.create_unique_constraint(
+        "uix_user_vectorstore_file_name", "vectorstores", ["user_id", "file_name"]
+    )
+    op.drop_index("uix_users_telegram_id", table_name="users")
+    op.create_unique_constraint("users_telegram_id_key", "users", ["telegram_id"])
+    op.drop_column("vectorstores", "deleted_at")
+    op.drop_column("users", "deleted_at")
@@ -0,0 +1,61 @@
+"""Add embedding summary columns to vectorstores
+
+Revision ID: 2256d35c1888
+Revises: d9365de72368
+Create Date: 2026-10-19 14:21:08.613052
+
+"""
+from typing import Sequence, Union
+
+import pgvector
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "2256d35c1888"
+down_revision: Union[str, None] = "d9365de72368"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "vectorstores",
+        sa.Column("document_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "vectorstores",
+        sa.Column(
+            "embedding_sum", pgvector.sqlalchemy.vector.VECTOR(dim=1024), nullable=True
+        ),
+    )
+    op.add_column(
+        "vectorstores",
+        sa.Column("sq_norm_sum", sa.Float(), server_default="0", nullable=False),
+    )
+    op.execute(
+        """
+        UPDATE vectorstores v
+        SET document_count = s.document_count,
+            embedding_sum = s.embedding_sum,
+            sq_norm_sum = s.sq_norm_sum
+        FROM (
+            SELECT vectorstore_id, count(*) AS document_count,
+                sum(embedding) AS embedding_sum,
+                sum(vector_norm(embedding) ^ 2) AS sq_norm_sum
+            FROM documents
+            WHERE embedding IS NOT NULL
+            GROUP BY vectorstore_id
+        ) s
+        WHERE s.vectorstore_id = v.vectorstore_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("vectorstores", "sq_norm_sum")
+    op.drop_column("vectorstores", "embedding_sum")
+    op.drop_column("vectorstores", "document_count")
@@ -0,0 +1,62 @@
+"""Add storage tiers and vectorstore archives
+
+Revision ID: 453a4000e488
+Revises: 991aea2a3c00
+Create Date: 2026-10-19 17:11:37.502961
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "453a4000e488"
+down_revision: Union[str, None] = "991aea2a3c00"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "vectorstores",
+        sa.Column(
+            "storage_tier", sa.String(length=10), server_default="hot", nullable=False
+        ),
+    )
+    op.add_column(
+        "vectorstores",
+        sa.Column(
+            "last_accessed_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+    )
+    op.create_table(
+        "vectorstore_archives",
+        sa.Column("vectorstore_id", sa.Integer(), nullable=False),
+        sa.Column("document_count", sa.Integer(), nullable=False),
+        sa.Column("dimension", sa.Integer(), nullable=False),
+        sa.Column("documents", sa.LargeBinary(), nullable=False),
+        sa.Column("embeddings", sa.LargeBinary(), nullable=False),
+        sa.Column(
+            "archived_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(
+            ["vectorstore_id"], ["vectorstores.vectorstore_id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("vectorstore_id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("vectorstore_archives")
+    op.drop_column("vectorstores", "last_accessed_at")
+    op.drop_column("vectorstores", "storage_tier")
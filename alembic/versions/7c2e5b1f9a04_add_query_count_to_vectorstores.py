@@ -0,0 +1,31 @@
+"""Add query count to vectorstores
+
+Revision ID: 7c2e5b1f9a04
+Revises: 11c9fa9b419f
+Create Date: 2026-10-19 19:26:13.418205
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7c2e5b1f9a04"
+down_revision: Union[str, None] = "11c9fa9b419f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "vectorstores",
+        sa.Column("query_count", sa.BigInteger(), server_default="0", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("vectorstores", "query_count")
@@ -0,0 +1,93 @@
+"""Add embedding model to vectorstores and re-embedding tables
+
+Revision ID: 991aea2a3c00
+Revises: 2256d35c1888
+Create Date: 2026-10-19 16:02:44.187305
+
+"""
+from typing import Sequence, Union
+
+import pgvector
+import sqlalchemy as sa
+
+from alembic import op
+from app.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = "991aea2a3c00"
+down_revision: Union[str, None] = "2256d35c1888"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "vectorstores",
+        sa.Column("embedding_model", sa.String(length=255), nullable=True),
+    )
+    # Существующие документы посчитаны моделью, настроенной на момент миграции.
+    op.execute(
+        sa.text("UPDATE vectorstores SET embedding_model = :model").bindparams(
+            model=settings.EMBEDDING_MODEL_NAME
+        )
+    )
+    op.create_table(
+        "document_embeddings_shadow",
+        sa.Column("doc_id", sa.Integer(), nullable=False),
+        sa.Column("vectorstore_id", sa.Integer(), nullable=False),
+        sa.Column("embedding_model", sa.String(length=255), nullable=False),
+        sa.Column(
+            "embedding", pgvector.sqlalchemy.vector.VECTOR(dim=1024), nullable=False
+        ),
+        sa.ForeignKeyConstraint(["doc_id"], ["documents.doc_id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(
+            ["vectorstore_id"], ["vectorstores.vectorstore_id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("doc_id"),
+    )
+    op.create_index(
+        op.f("ix_document_embeddings_shadow_vectorstore_id"),
+        "document_embeddings_shadow",
+        ["vectorstore_id"],
+        unique=False,
+    )
+    op.create_table(
+        "reembedding_jobs",
+        sa.Column("vectorstore_id", sa.Integer(), nullable=False),
+        sa.Column("target_model", sa.String(length=255), nullable=False),
+        sa.Column(
+            "status", sa.String(length=20), server_default="running", nullable=False
+        ),
+        sa.Column("documents_total", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("documents_done", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column(
+            "started_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["vectorstore_id"], ["vectorstores.vectorstore_id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("vectorstore_id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("reembedding_jobs")
+    op.drop_index(
+        op.f("ix_document_embeddings_shadow_vectorstore_id"),
+        table_name="document_embeddings_shadow",
+    )
+    op.drop_table("document_embeddings_shadow")
+    op.drop_column("vectorstores", "embedding_model")
@@ -0,0 +1,33 @@
+"""Add content version to vectorstores
+
+Revision ID: a3d81f6c2b57
+Revises: 7c2e5b1f9a04
+Create Date: 2026-10-19 21:04:37.512946
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a3d81f6c2b57"
+down_revision: Union[str, None] = "7c2e5b1f9a04"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "vectorstores",
+        sa.Column(
+            "content_version", sa.BigInteger(), server_default="0", nullable=False
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("vectorstores", "content_version")
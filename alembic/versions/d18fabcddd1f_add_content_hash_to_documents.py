@@ -0,0 +1,44 @@
+"""Add content_hash to documents
+
+Revision ID: d18fabcddd1f
+Revises: c1f85181c904
+Create Date: 2026-10-19 10:12:41.518203
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d18fabcddd1f"
+down_revision: Union[str, None] = "c1f85181c904"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "documents", sa.Column("content_hash", sa.String(length=64), nullable=True)
+    )
+    op.execute(
+        """
+        UPDATE documents
+        SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')
+        WHERE content IS NOT NULL
+        """
+    )
+    op.create_index(
+        "ix_documents_vectorstore_id_content_hash",
+        "documents",
+        ["vectorstore_id", "content_hash"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_documents_vectorstore_id_content_hash", table_name="documents")
+    op.drop_column("documents", "content_hash")
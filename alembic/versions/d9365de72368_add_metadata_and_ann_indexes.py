@@ -0,0 +1,59 @@
+"""Add GIN index on doc_metadata and HNSW index on embedding
+
+Revision ID: d9365de72368
+Revises: d18fabcddd1f
+Create Date: 2026-10-19 12:03:17.402961
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d9365de72368"
+down_revision: Union[str, None] = "d18fabcddd1f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Индексы строятся без блокировки записи в documents.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_documents_doc_metadata",
+            "documents",
+            ["doc_metadata"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_documents_embedding_hnsw",
+            "documents",
+            ["embedding"],
+            unique=False,
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_documents_embedding_hnsw",
+            table_name="documents",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_documents_doc_metadata",
+            table_name="documents",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
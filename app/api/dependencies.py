@@ -1,42 +1,26 @@
-from typing import Any, Generator
+import hmac
+from typing import Any, AsyncGenerator, Generator, Optional
 
-import torch
-from fastapi import Depends, HTTPException, status
-from langchain_huggingface import HuggingFaceEmbeddings
+from fastapi import Depends, Header, HTTPException, status
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
 
 from app.config import settings
+from app.services.model_registry import get_embedding_model
 from app.services.vectorstore import PostgresVectorStoreService
 
 engine = create_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-
-def get_device():
-    if torch.cuda.is_available():
-        return "cuda"
-    elif torch.backends.mps.is_available():
-        return "mps"
-    else:
-        return "cpu"
-
-
-def get_embedding_model():
-    if settings.EMBEDDING_MODEL_TYPE == "sentence_transformers":
-        model_kwargs = {"device": get_device()}
-        encode_kwargs = {"normalize_embeddings": True}
-        embedding_model = HuggingFaceEmbeddings(
-            model_name=settings.EMBEDDING_MODEL_NAME,
-            model_kwargs=model_kwargs,
-            encode_kwargs=encode_kwargs,
-            cache_folder="cache_hf",
-        )
-        return embedding_model
-    else:
-        raise ValueError(
-            f"Unsupported embedding model type: {settings.EMBEDDING_MODEL_TYPE}"
-        )
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    pool_size=settings.DB_POOL_MAX_SIZE,
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
 
 
 embedding_model = get_embedding_model()
@@ -50,6 +34,11 @@ def get_db() -> Generator[Session, Any, None]:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def get_vectorstore_service() -> PostgresVectorStoreService:
     return PostgresVectorStoreService(
         embedding_model=embedding_model,
@@ -57,12 +46,12 @@ def get_vectorstore_service() -> PostgresVectorStoreService:
     )
 
 
-def get_user(
+async def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
 ):
-    user = vectorstore_service.get_user(db, user_id)
+    user = await vectorstore_service.aget_user(db, user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -71,15 +60,35 @@ def get_user(
     return user
 
 
-def get_vectorstore(
+async def get_vectorstore(
     vectorstore_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
 ):
-    vectorstore = vectorstore_service.get_vectorstore(db, vectorstore_id)
+    vectorstore = await vectorstore_service.aget_vectorstore(db, vectorstore_id)
     if vectorstore is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Vector store with ID {vectorstore_id} not found",
         )
     return vectorstore
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Проверяет токен служебных эндпоинтов; без ADMIN_TOKEN не подходит никакой."""
+    if not settings.ADMIN_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token, settings.ADMIN_TOKEN)
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Эндпоинт отключен: не задан ADMIN_TOKEN",
+        )
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Неверный токен администратора",
+        )
@@ -0,0 +1,49 @@
+from typing import Any, Optional
+
+import msgpack
+import numpy as np
+from fastapi.responses import ORJSONResponse, Response
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+
+class MsgpackResponse(Response):
+    """
+    Ответ в формате MessagePack для внутренних клиентов.
+
+    Числа с плавающей точкой (сходство) записываются как float32, эмбеддинги —
+    как двоичные данные float32 little-endian, которые читаются без разбора,
+    например через numpy.frombuffer(data, dtype="<f4").
+    """
+
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, use_single_float=True, default=_pack_default)
+
+
+def search_response(content: Any, accept: Optional[str] = None) -> Response:
+    """
+    Возвращает результаты поиска в формате, запрошенном заголовком Accept.
+
+    Готовый ответ не проходит повторную проверку и сериализацию по
+    response_model эндпоинта.
+
+    Args:
+        content: Результаты поиска
+        accept: Значение заголовка Accept
+
+    Returns:
+        MsgpackResponse для application/x-msgpack, иначе ORJSONResponse
+    """
+    if accept and MSGPACK_MEDIA_TYPE in accept:
+        return MsgpackResponse(content)
+    return ORJSONResponse(content)
+
+
+def _pack_default(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return value.astype("<f4", copy=False).tobytes()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Тип {type(value).__name__} не поддерживается MessagePack")
@@ -0,0 +1,55 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from app.api.dependencies import require_admin_token
+from app.services.admission import ingestion_limiter, query_limiter
+from app.services.memory import process_memory
+from app.services.metrics import metrics
+from app.services.profiler import request_profiler
+
+router = APIRouter(prefix="/service", tags=["Service"])
+
+
+@router.get("/metrics")
+def read_metrics():
+    """Получить метрики текущего процесса"""
+    return metrics.snapshot()
+
+
+@router.get("/load")
+def read_load():
+    """Получить текущую загрузку и длину очередей ограничителей"""
+    return {
+        "ingestion": ingestion_limiter.snapshot(),
+        "query": query_limiter.snapshot(),
+    }
+
+
+@router.get("/memory")
+def read_memory():
+    """Получить потребление памяти процесса воркера в килобайтах (RSS, PSS)"""
+    return {"pid": os.getpid(), **process_memory()}
+
+
+@router.get("/profiles", dependencies=[Depends(require_admin_token)])
+def list_profiles(limit: int = 20):
+    """Получить список последних сохраненных профилей медленных запросов"""
+    return request_profiler.list_profiles(limit)
+
+
+@router.get(
+    "/profiles/{name}",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(require_admin_token)],
+)
+def read_profile(name: str):
+    """Получить профиль запроса в формате folded stacks для flamegraph.pl"""
+    profile = request_profiler.read_profile(name)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Профиль '{name}' не найден",
+        )
+    return profile
@@ -1,13 +1,17 @@
 import logging
+from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from psycopg2.errors import UniqueViolation
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.dependencies import get_db, get_user, get_vectorstore_service
-from app.models import models
+from app.api.dependencies import get_async_db, get_user, get_vectorstore_service
 from app.schemas import schemas
-from app.services.vectorstore import PostgresVectorStoreService
+from app.services.admission import ingestion_limiter
+from app.services.purge import purge_in_background
+from app.services.vectorstore import PostgresVectorStoreService, split_text
 
 router = APIRouter(
     prefix="/users",
@@ -18,22 +22,22 @@ router = APIRouter(
 @router.post(
     "/create_user/", response_model=schemas.User, status_code=status.HTTP_201_CREATED
 )
-def create_user(
+async def create_user(
     request: schemas.UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
 ):
     """Создать нового пользователя"""
     logging.info(f"Попытка создания пользователя с telegram_id: {request.telegram_id}")
     try:
-        new_user = vectorstore_service.create_user(db, request.telegram_id)
+        new_user = await vectorstore_service.acreate_user(db, request.telegram_id)
         logging.info(f"Пользователь успешно создан с ID: {new_user.user_id}")
         return new_user
     except IntegrityError:
         logging.warning(
             f"Попытка создания пользователя с существующим telegram_id: {request.telegram_id}"
         )
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь с таким telegram_id уже существует",
@@ -41,7 +45,7 @@ def create_user(
 
 
 @router.get("/{user_id}", response_model=schemas.User)
-def read_user(request: schemas.User = Depends(get_user)):
+async def read_user(request: schemas.User = Depends(get_user)):
     """Получить информацию о пользователе"""
     logging.info(f"Получение информации о пользователе с ID: {request.user_id}")
     return request
@@ -52,34 +56,204 @@ def read_user(request: schemas.User = Depends(get_user)):
     response_model=schemas.VectorStore,
     status_code=status.HTTP_201_CREATED,
 )
-def create_vectorstore(
+async def create_vectorstore(
     telegram_id: str,
     request: schemas.VectorStoreCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
 ):
     """Создать новое векторное хранилище для пользователя и добвить в него документы"""
     logging.info(
         f"Создание векторного хранилища с именем: {request.file_name} для пользователя с telegram_id: {telegram_id}"
     )
-    user = db.query(models.User).filter(models.User.telegram_id == telegram_id).first()
+    user = await vectorstore_service.aget_user_by_telegram_id(db, telegram_id)
     if not user:
         logging.warning(f"Пользователь с telegram_id {telegram_id} не найден")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Пользователь с telegram_id {telegram_id} не найден",
         )
-    new_vectorstore = vectorstore_service.create_vectorstore(
+    await db.close()
+
+    try:
+        async with ingestion_limiter.acquire():
+            new_vectorstore = await run_in_threadpool(
+                vectorstore_service.create_vectorstore_with_texts,
+                user.user_id,
+                request.file_name,
+                split_text(request.text),
+            )
+    except UniqueViolation:
+        logging.warning(
+            f"Векторное хранилище {request.file_name} уже существует у пользователя {telegram_id}"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Векторное хранилище с таким file_name уже существует",
+        )
+    logging.info(
+        f"Векторное хранилище успешно создано с ID: {new_vectorstore['vectorstore_id']}"
+    )
+    return new_vectorstore
+
+
+@router.post(
+    "/{telegram_id}/update_vectorstore/",
+    response_model=schemas.VectorStoreUpdate,
+)
+async def update_vectorstore(
+    telegram_id: str,
+    request: schemas.VectorStoreCreate,
+    db: AsyncSession = Depends(get_async_db),
+    vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
+):
+    """Загрузить новую версию файла, пересчитав эмбеддинги только измененных чанков"""
+    logging.info(
+        f"Обновление векторного хранилища {request.file_name} для пользователя с telegram_id: {telegram_id}"
+    )
+    user = await vectorstore_service.aget_user_by_telegram_id(db, telegram_id)
+    if not user:
+        logging.warning(f"Пользователь с telegram_id {telegram_id} не найден")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Пользователь с telegram_id {telegram_id} не найден",
+        )
+    vectorstore = await vectorstore_service.aget_vectorstore_by_file_name(
         db, user.user_id, request.file_name
     )
-    metadata = {
-        "file_name": request.file_name,
-        "id": new_vectorstore.vectorstore_id,
-    }
-    vectorstore_service.add_texts(
-        new_vectorstore.vectorstore_id, [request.text], [metadata]
+    if not vectorstore:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Векторное хранилище {request.file_name} не найдено",
+        )
+    await db.close()
+
+    metadata = vectorstore_service.file_metadata(
+        request.file_name, vectorstore.vectorstore_id
     )
+    chunks = split_text(request.text)
+    async with ingestion_limiter.acquire():
+        result = await run_in_threadpool(
+            vectorstore_service.update_texts,
+            vectorstore.vectorstore_id,
+            chunks,
+            [metadata for _ in chunks],
+        )
     logging.info(
-        f"Векторное хранилище успешно создано с ID: {new_vectorstore.vectorstore_id}"
+        f"Векторное хранилище {vectorstore.vectorstore_id} обновлено: "
+        f"добавлено {result['added']}, удалено {result['removed']}, "
+        f"без изменений {result['unchanged']}"
     )
-    return new_vectorstore
+    return {"vectorstore_id": vectorstore.vectorstore_id, **result}
+
+
+@router.get(
+    "/{telegram_id}/vectorstores",
+    response_model=List[schemas.VectorStore],
+)
+async def list_vectorstores(
+    telegram_id: str,
+    consistent_read: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
+):
+    """Получить список векторных хранилищ пользователя (читается с реплики)"""
+    user = await vectorstore_service.aget_user_by_telegram_id(db, telegram_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Пользователь с telegram_id {telegram_id} не найден",
+        )
+    await db.close()
+
+    return await run_in_threadpool(
+        vectorstore_service.get_vectorstores_for_user, user.user_id, consistent_read
+    )
+
+
+@router.delete(
+    "/{telegram_id}",
+    response_model=schemas.DeletionScheduled,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def delete_user(
+    telegram_id: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
+):
+    """Удалить пользователя и все его векторные хранилища"""
+    user = await vectorstore_service.aget_user_by_telegram_id(db, telegram_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Пользователь с telegram_id {telegram_id} не найден",
+        )
+    await db.close()
+
+    # Пользователь и хранилища скрываются сразу, строки удаляются в фоне.
+    vectorstore_ids = await run_in_threadpool(
+        vectorstore_service.delete_user, user.user_id
+    )
+    background_tasks.add_task(
+        purge_in_background,
+        vectorstore_ids,
+        user.user_id,
+        vectorstore_service.connection_config,
+    )
+    logging.info(
+        f"Пользователь {telegram_id} удален, хранилища {vectorstore_ids} "
+        "будут очищены в фоне"
+    )
+    return {"vectorstore_ids": vectorstore_ids}
+
+
+@router.delete(
+    "/{telegram_id}/vectorstores/{file_name}",
+    response_model=schemas.DeletionScheduled,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def delete_vectorstore(
+    telegram_id: str,
+    file_name: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
+):
+    """Удалить векторное хранилище пользователя"""
+    user = await vectorstore_service.aget_user_by_telegram_id(db, telegram_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Пользователь с telegram_id {telegram_id} не найден",
+        )
+    vectorstore = await vectorstore_service.aget_vectorstore_by_file_name(
+        db, user.user_id, file_name
+    )
+    if not vectorstore:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Векторное хранилище {file_name} не найдено",
+        )
+    await db.close()
+
+    deleted = await run_in_threadpool(
+        vectorstore_service.delete_vectorstore, vectorstore.vectorstore_id
+    )
+    if not deleted:
+        # Хранилище удалил параллельный запрос, он же запустил очистку.
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Векторное хранилище {file_name} не найдено",
+        )
+    background_tasks.add_task(
+        purge_in_background,
+        [vectorstore.vectorstore_id],
+        None,
+        vectorstore_service.connection_config,
+    )
+    logging.info(
+        f"Векторное хранилище {vectorstore.vectorstore_id} удалено, "
+        "документы будут очищены в фоне"
+    )
+    return {"vectorstore_ids": [vectorstore.vectorstore_id]}
@@ -1,17 +1,43 @@
+import base64
+import json
 import logging
+from typing import List, Optional
 
 import httpx
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import numpy as np
+import orjson
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Header,
+    HTTPException,
+    Response,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from psycopg2.errors import QueryCanceled
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.dependencies import get_db, get_vectorstore_service
+from app.api.dependencies import get_async_db, get_vectorstore, get_vectorstore_service
+from app.api.responses import search_response
 from app.config import settings
-from app.models import models
 from app.schemas import schemas
+from app.services.access_tracker import access_tracker
+from app.services.admission import AdmissionRejected, query_limiter
+from app.services.answer_cache import answer_cache
+from app.services.context_packing import pack_context
+from app.services.llm_client import LLMServiceUnavailable, llm_client
+from app.services.metadata_filter import MetadataFilterError
+from app.services.resilience import CircuitOpen, Deadline, DeadlineExceeded
+from app.services.singleflight import SingleFlight
 from app.services.vectorstore import PostgresVectorStoreService
 
 router = APIRouter(prefix="/vectorstores", tags=["Vectorstores"])
 
+rag_query_flight = SingleFlight("rag_query")
+
 
 async def send_to_llm_service(payload, url):
     logging.info(f"Отправка запроса в LLM-сервис: {url}")
@@ -34,7 +60,7 @@ async def rag_query(
     request: schemas.RagQueryRequest,
     background_tasks: BackgroundTasks,
     vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     RAG (Retrieval-Augmented Generation) эндпоинт для обработки запросов пользователя.
@@ -53,8 +79,11 @@ async def rag_query(
     - Статус обработки запроса
     - Сообщение о текущем состоянии
     """
+    # Срок отсчитывается от начала запроса и ограничивает каждый следующий этап.
+    deadline = Deadline(settings.RAG_DEADLINE)
+
     # Проверяем наличие пользователя
-    user = db.query(models.User).filter(models.User.telegram_id == telegram_id).first()
+    user = await vectorstore_service.aget_user_by_telegram_id(db, telegram_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -68,36 +97,257 @@ async def rag_query(
         )
 
     # Проверяем, что хранилище принадлежит запрашивающему пользователю
-    vectorstore = (
-        db.query(models.VectorStore)
-        .filter(
-            models.VectorStore.file_name == request.file_name,
-            models.VectorStore.user_id == user.user_id,
-        )
-        .first()
+    vectorstore = await vectorstore_service.aget_vectorstore_by_file_name(
+        db, user.user_id, request.file_name
     )
+    if not vectorstore:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Векторное хранилище '{request.file_name}' не найдено",
+        )
+    # Соединение с БД больше не нужно: возвращаем его в пул до поиска и
+    # обращения к LLM-сервису, которые занимают основное время запроса.
+    await db.close()
+    # Частота запросов используется для выбора хранилищ при прогреве.
+    access_tracker.record_query(vectorstore.vectorstore_id)
 
-    results = vectorstore_service.similarity_search(
-        vectorstore.vectorstore_id, request.query, settings.K_RESULTS
+    # Одинаковые одновременные запросы (повторы бота, одинаковые вопросы
+    # участников группы) выполняются один раз и получают общий ответ.
+    key = (
+        telegram_id,
+        vectorstore.vectorstore_id,
+        vectorstore.content_version,
+        request.query,
+        json.dumps(request.metadata_filter, sort_keys=True),
+        request.consistent_read,
+    )
+    answer = await rag_query_flight.do(
+        key,
+        lambda: answer_rag_query(
+            vectorstore_service,
+            vectorstore.vectorstore_id,
+            vectorstore.content_version,
+            vectorstore.embedding_model,
+            telegram_id,
+            request,
+            deadline,
+        ),
     )
+    return Response(content=answer, media_type="application/json")
+
+
+async def answer_rag_query(
+    vectorstore_service: PostgresVectorStoreService,
+    vectorstore_id: int,
+    content_version: int,
+    embedding_model_name: Optional[str],
+    telegram_id: str,
+    request: schemas.RagQueryRequest,
+    deadline: Deadline,
+) -> bytes:
+    """Находит релевантные документы и получает тело ответа LLM-сервиса."""
+    # Эмбеддинг запроса и поиск синхронные, поэтому выполняются в пуле потоков,
+    # чтобы не блокировать цикл событий.
+    try:
+        async with query_limiter.acquire(deadline.remaining()):
+            deadline.check("admission")
+            # Запрос кодируется той же моделью, что и документы хранилища;
+            # прежняя модель при первом обращении загружается с диска.
+            embedding_model = await run_in_threadpool(
+                vectorstore_service.model_for, embedding_model_name
+            )
+            query_embedding = await run_in_threadpool(
+                embedding_model.embed_query, request.query
+            )
+            deadline.check("embedding")
+            # Версия прочитана с основного сервера вместе со строкой хранилища,
+            # поэтому ответы, полученные до последней записи в хранилище
+            # любым процессом, не находятся. Запрос с consistent_read кеш
+            # не использует.
+            if not request.consistent_read:
+                cached_answer = answer_cache.get(
+                    vectorstore_id,
+                    content_version,
+                    query_embedding,
+                    request.metadata_filter,
+                    embedding_model_name,
+                )
+                if cached_answer is not None:
+                    logging.info(f"Ответ для хранилища {vectorstore_id} взят из кеша")
+                    return cached_answer
+            results, searched_version = await run_in_threadpool(
+                vectorstore_service.similarity_search_with_version,
+                vectorstore_id,
+                query_embedding,
+                settings.K_RESULTS,
+                request.metadata_filter,
+                request.consistent_read,
+                True,
+                deadline.remaining(),
+            )
+            candidates, _ = await run_in_threadpool(
+                pack_context,
+                embedding_model,
+                results,
+                settings.CONTEXT_TOKEN_BUDGET,
+                settings.CONTEXT_DUPLICATE_THRESHOLD,
+            )
+    except MetadataFilterError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Некорректный фильтр по метаданным: {str(e)}",
+        )
+    except QueryCanceled as e:
+        raise DeadlineExceeded("search") from e
+    except AdmissionRejected:
+        # Ожидание места ограничено остатком срока: если истек он, а не
+        # ADMISSION_QUEUE_TIMEOUT, клиент получает 504, а не 429.
+        deadline.check("admission")
+        raise
     payload = {
         "query": request.query,
-        "candidates": [result["content"] for result in results],
+        "candidates": [candidate["content"] for candidate in candidates],
         "telegram_id": telegram_id,
-        "similarity": sum(result["similarity"] for result in results) / len(results)
-        if results
+        "similarity": sum(c["similarity"] for c in candidates) / len(candidates)
+        if candidates
         else 0,
     }
 
-    external_url = "http://llm-nginx:80/api/rag/process"
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(external_url, json=payload)
-            response.raise_for_status()
-            return response.json()
+        # Ответ LLM-сервиса возвращается клиенту как есть, без разбора
+        # и повторной сериализации.
+        answer = await llm_client.post(payload, deadline)
+    except (DeadlineExceeded, CircuitOpen):
+        raise
+    except LLMServiceUnavailable as e:
+        logging.error(f"LLM-сервис не ответил после повторов: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="LLM-сервис вернул ошибку, повторите запрос позже",
+        )
+    except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+        logging.error(f"Не удалось подключиться к LLM-сервису: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="LLM-сервис недоступен, повторите запрос позже",
+        )
     except Exception as e:
         logging.error(f"Ошибка при отправке запроса в LLM-сервис: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при обработке запроса: {str(e)}",
         )
+
+    answer_cache.put(
+        vectorstore_id,
+        searched_version,
+        query_embedding,
+        answer,
+        request.metadata_filter,
+        embedding_model_name,
+    )
+    return answer
+
+
+@router.post(
+    "/{telegram_id}/search/",
+    response_model=List[schemas.CrossFileSearchResult],
+    summary="Поиск по всем файлам пользователя",
+)
+async def search_user_vectorstores(
+    telegram_id: str,
+    request: schemas.CrossFileSearchRequest,
+    accept: Optional[str] = Header(None),
+    vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Ищет релевантные документы во всех векторных хранилищах пользователя.
+
+    Хранилища предварительно ранжируются по сводке эмбеддингов (центроид и
+    разброс), и поиск выполняется только в ROUTING_TOP_M лучших из них; если
+    там нашлось меньше k документов, поиск повторяется по всем хранилищам.
+
+    Параметры:
+    - telegram_id: Идентификатор пользователя Telegram
+    - request: Запрос, количество результатов и фильтр по метаданным
+    - accept: application/x-msgpack — ответ в MessagePack со сходством float32
+      и эмбеддингами в виде двоичных float32
+    """
+    user = await vectorstore_service.aget_user_by_telegram_id(db, telegram_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Пользователь с telegram_id '{telegram_id}' не найден",
+        )
+    await db.close()
+
+    try:
+        async with query_limiter.acquire():
+            results = await run_in_threadpool(
+                vectorstore_service.search_user_vectorstores,
+                user.user_id,
+                request.query,
+                request.k,
+                request.metadata_filter,
+                request.consistent_read,
+                request.exhaustive,
+                None,
+                request.include_embeddings,
+            )
+    except MetadataFilterError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Некорректный фильтр по метаданным: {str(e)}",
+        )
+    return search_response(results, accept)
+
+
+@router.get(
+    "/{vectorstore_id}/export",
+    summary="Потоковая выгрузка документов хранилища в формате NDJSON",
+)
+async def export_vectorstore(
+    include_embeddings: bool = False,
+    vectorstore: schemas.VectorStore = Depends(get_vectorstore),
+    vectorstore_service: PostgresVectorStoreService = Depends(get_vectorstore_service),
+):
+    """
+    Выгружает документы хранилища построчно в формате NDJSON.
+
+    Документы читаются серверным курсором порциями по EXPORT_FETCH_SIZE строк
+    и сразу отправляются клиенту, поэтому потребление памяти не зависит от
+    размера хранилища.
+
+    Параметры:
+    - vectorstore_id: ID хранилища
+    - include_embeddings: Добавить эмбеддинги в виде base64 от float32 (little-endian)
+    """
+    logging.info(f"Экспорт векторного хранилища {vectorstore.vectorstore_id}")
+
+    def generate():
+        lines = []
+        for document in vectorstore_service.iter_documents(
+            vectorstore.vectorstore_id, include_embeddings
+        ):
+            document["created_at"] = document["created_at"].isoformat()
+            if include_embeddings:
+                document["embedding"] = base64.b64encode(
+                    np.asarray(document["embedding"], dtype="<f4").tobytes()
+                ).decode("ascii")
+            lines.append(orjson.dumps(document))
+            if len(lines) >= settings.EXPORT_FETCH_SIZE:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+        if lines:
+            yield b"\n".join(lines) + b"\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="vectorstore_{vectorstore.vectorstore_id}.ndjson"'
+            )
+        },
+    )
@@ -0,0 +1,197 @@
+"""
+Служебные команды ChatRAG.
+
+    python -m app.cli snapshot --vectorstore-id 42 --output /backups/vs-42
+    python -m app.cli snapshot --telegram-id 123456 --output /backups/user-123456
+    python -m app.cli restore --input /backups/vs-42 [--telegram-id 654321]
+    python -m app.cli reembed --model BAAI/bge-m3 [--vectorstore-id 42]
+    python -m app.cli reembed-status
+    python -m app.cli tier [--idle-days 30] [--limit 100]
+    python -m app.cli rehydrate --vectorstore-id 42
+    python -m app.cli purge [--no-vacuum]
+    python -m app.cli prewarm [--budget-mb 1024] [--limit 50] [--strategy recent]
+"""
+import argparse
+import logging
+import sys
+
+from app.config import settings
+from app.services.prewarm import STRATEGY_ORDER, prewarm_all
+from app.services.purge import purge_deleted
+from app.services.reembedding import (
+    ReembeddingError,
+    reembed_all,
+    reembed_vectorstore,
+    reembedding_status,
+)
+from app.services.snapshot import SnapshotError, create_snapshot, restore_snapshot
+from app.services.tiering import archive_idle_vectorstores, rehydrate_vectorstore
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_command(args: argparse.Namespace) -> None:
+    manifest = create_snapshot(
+        args.output, vectorstore_id=args.vectorstore_id, telegram_id=args.telegram_id
+    )
+    logger.info(
+        f"Снапшот сохранен в {args.output}: хранилищ "
+        f"{len(manifest['vectorstores'])}, документов {manifest['document_count']}"
+    )
+
+
+def restore_command(args: argparse.Namespace) -> None:
+    vectorstore_ids = restore_snapshot(args.input, telegram_id=args.telegram_id)
+    logger.info(f"Восстановлены хранилища: {vectorstore_ids}")
+
+
+def reembed_command(args: argparse.Namespace) -> None:
+    if args.vectorstore_id is not None:
+        jobs = [
+            reembed_vectorstore(
+                args.vectorstore_id, args.model, None, args.batch_size, args.throttle_ms
+            )
+        ]
+    else:
+        jobs = reembed_all(args.model, args.batch_size, args.throttle_ms)
+    logger.info(f"Переключено на {args.model} хранилищ: {len(jobs)}")
+
+
+def reembed_status_command(args: argparse.Namespace) -> None:
+    for job in reembedding_status():
+        line = (
+            f"{job['vectorstore_id']:>8}  {job['status']:<9} "
+            f"{job['documents_done']:>8}/{job['documents_total']:<8} "
+            f"{job['embedding_model']} -> {job['target_model']}"
+        )
+        if job["error"]:
+            line += f"  ({job['error']})"
+        print(line)
+
+
+def tier_command(args: argparse.Namespace) -> None:
+    archived = archive_idle_vectorstores(args.idle_days, args.limit)
+    logger.info(f"Перенесено в архив хранилищ: {len(archived)} {archived}")
+
+
+def rehydrate_command(args: argparse.Namespace) -> None:
+    if rehydrate_vectorstore(args.vectorstore_id):
+        logger.info(f"Хранилище {args.vectorstore_id} восстановлено из архива")
+    else:
+        logger.info(f"Хранилище {args.vectorstore_id} не в архиве")
+
+
+def purge_command(args: argparse.Namespace) -> None:
+    removed = purge_deleted(vacuum=not args.no_vacuum)
+    logger.info(f"Удалено документов удаленных хранилищ: {removed}")
+
+
+def prewarm_command(args: argparse.Namespace) -> None:
+    prewarm_all(args.budget_mb, args.limit, args.strategy)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = subparsers.add_parser(
+        "snapshot", help="Сохранить хранилища вместе с эмбеддингами"
+    )
+    scope = snapshot.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--vectorstore-id", type=int)
+    scope.add_argument("--telegram-id")
+    snapshot.add_argument("--output", required=True, help="Каталог снапшота")
+    snapshot.set_defaults(handler=snapshot_command)
+
+    restore = subparsers.add_parser("restore", help="Восстановить хранилища")
+    restore.add_argument("--input", required=True, help="Каталог снапшота")
+    restore.add_argument(
+        "--telegram-id", help="Владелец восстановленных хранилищ вместо исходного"
+    )
+    restore.set_defaults(handler=restore_command)
+
+    reembed = subparsers.add_parser(
+        "reembed", help="Пересчитать эмбеддинги хранилищ новой моделью"
+    )
+    reembed.add_argument(
+        "--model",
+        default=settings.EMBEDDING_MODEL_NAME,
+        help="Новая модель, по умолчанию EMBEDDING_MODEL_NAME",
+    )
+    reembed.add_argument(
+        "--vectorstore-id",
+        type=int,
+        help="Только это хранилище, по умолчанию все, еще не переведенные на модель",
+    )
+    reembed.add_argument("--batch-size", type=int, default=settings.REEMBED_BATCH_SIZE)
+    reembed.add_argument(
+        "--throttle-ms",
+        type=float,
+        default=settings.REEMBED_THROTTLE_MS,
+        help="Пауза между батчами, чтобы не мешать запросам пользователей",
+    )
+    reembed.set_defaults(handler=reembed_command)
+
+    reembed_status = subparsers.add_parser(
+        "reembed-status", help="Прогресс пересчета эмбеддингов по хранилищам"
+    )
+    reembed_status.set_defaults(handler=reembed_status_command)
+
+    tier = subparsers.add_parser(
+        "tier", help="Перенести давно не используемые хранилища в архив"
+    )
+    tier.add_argument(
+        "--idle-days",
+        type=float,
+        default=settings.TIERING_IDLE_DAYS,
+        help="Срок без обращений, по умолчанию TIERING_IDLE_DAYS",
+    )
+    tier.add_argument("--limit", type=int, help="Не больше хранилищ за запуск")
+    tier.set_defaults(handler=tier_command)
+
+    rehydrate = subparsers.add_parser(
+        "rehydrate", help="Восстановить хранилище из архива"
+    )
+    rehydrate.add_argument("--vectorstore-id", type=int, required=True)
+    rehydrate.set_defaults(handler=rehydrate_command)
+
+    purge = subparsers.add_parser(
+        "purge", help="Дочистить удаленные хранилища и пользователей"
+    )
+    purge.add_argument(
+        "--no-vacuum", action="store_true", help="Не запускать VACUUM после удаления"
+    )
+    purge.set_defaults(handler=purge_command)
+
+    prewarm_parser = subparsers.add_parser(
+        "prewarm", help="Загрузить в кеш PostgreSQL популярные хранилища"
+    )
+    prewarm_parser.add_argument(
+        "--budget-mb",
+        type=float,
+        default=settings.PREWARM_BUDGET_MB,
+        help="Сколько мегабайт прочитать, по умолчанию PREWARM_BUDGET_MB",
+    )
+    prewarm_parser.add_argument(
+        "--limit", type=int, default=settings.PREWARM_MAX_VECTORSTORES
+    )
+    prewarm_parser.add_argument(
+        "--strategy", choices=list(STRATEGY_ORDER), default=settings.PREWARM_STRATEGY
+    )
+    prewarm_parser.set_defaults(handler=prewarm_command)
+
+    return parser
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args()
+    try:
+        args.handler(args)
+    except (SnapshotError, ReembeddingError) as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,87 @@
+import asyncio
 import logging
 import os
+import random
+import time
+from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
+from app.api.dependencies import async_engine, is_admin_token
+from app.api.service_router import router as service_router
 from app.api.user_router import router as user_router
 from app.api.vectorstore_router import router as vectorstore_router
+from app.config import settings
+from app.services.access_tracker import access_tracker
+from app.services.admission import AdmissionRejected
+from app.services.llm_client import llm_client
+from app.services.prewarm import run_prewarm_schedule
+from app.services.profiler import request_profiler
+from app.services.resilience import CircuitOpen, DeadlineExceeded
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Прогрев идет в фоне: приложение принимает запросы, не дожидаясь его.
+    prewarm_task = None
+    if settings.PREWARM_ENABLED:
+        prewarm_task = asyncio.create_task(run_prewarm_schedule())
+    yield
+    if prewarm_task is not None:
+        prewarm_task.cancel()
+    await llm_client.aclose()
+    # Соединения пула привязаны к текущему циклу событий.
+    await async_engine.dispose()
+    await run_in_threadpool(access_tracker.flush)
+
 
 app = FastAPI(
     title="Vector Store API",
     description="API для работы с векторными хранилищами текстовых данных",
     version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.include_router(user_router, prefix="/api/v1")
 app.include_router(vectorstore_router, prefix="/api/v1")
+app.include_router(service_router, prefix="/api/v1")
+
+
+async def profile_request(request: Request, call_next):
+    """
+    Снимает статистический профиль доли запросов и запросов с заголовком
+    X-Debug-Profile, равным ADMIN_TOKEN; профили медленных запросов доступны
+    через /api/v1/service/profiles.
+    """
+    debug_header = request.headers.get("X-Debug-Profile")
+    forced = debug_header is not None and is_admin_token(debug_header)
+    if not forced and random.random() >= request_profiler.sample_rate:
+        return await call_next(request)
+    sampler = request_profiler.start()
+    if sampler is None:
+        return await call_next(request)
+
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        await run_in_threadpool(
+            request_profiler.finish,
+            sampler,
+            request.method,
+            request.url.path,
+            (time.perf_counter() - started) * 1000,
+            forced,
+        )
+
+
+if settings.PROFILER_ENABLED:
+    app.middleware("http")(profile_request)
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,15 +98,44 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request, exc: AdmissionRejected):
+    logging.warning(f"Запрос отклонен ограничителем '{exc.name}'")
+    return ORJSONResponse(
+        status_code=429,
+        content={"detail": "Сервис перегружен, повторите запрос позже"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request, exc: CircuitOpen):
+    logging.warning(f"Запрос отклонен: цепь '{exc.name}' разомкнута")
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": "Внешний сервис временно недоступен, повторите позже"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request, exc: DeadlineExceeded):
+    logging.warning(f"Срок выполнения запроса истек на этапе '{exc.stage}'")
+    return ORJSONResponse(
+        status_code=504,
+        content={"detail": "Превышено время выполнения запроса"},
+    )
+
+
 @app.exception_handler(Exception)
 async def generic_exception_handler(request, exc):
     logging.error(f"Произошла ошибка: {str(exc)}", exc_info=True)
     if isinstance(exc, HTTPException):
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=exc.status_code,
             content={"detail": exc.detail},
         )
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "Внутренняя ошибка сервера"},
     )
@@ -1,12 +1,16 @@
 from pgvector.sqlalchemy import Vector
 from sqlalchemy import (
+    BigInteger,
     Column,
     DateTime,
+    Float,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     Text,
-    UniqueConstraint,
+    text,
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
@@ -20,12 +24,24 @@ class User(Base):
     __tablename__ = "users"
 
     user_id = Column(Integer, primary_key=True, index=True)
-    telegram_id = Column(String(255), unique=True, nullable=True)
+    telegram_id = Column(String(255), nullable=True)
+    # Удаленный пользователь скрыт сразу, а строки удаляются в фоне
+    # (app.services.purge).
+    deleted_at = Column(DateTime(timezone=True))
 
     vectorstores = relationship(
         "VectorStore", back_populates="user", cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        Index(
+            "uix_users_telegram_id",
+            "telegram_id",
+            unique=True,
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+    )
+
 
 class VectorStore(Base):
     __tablename__ = "vectorstores"
@@ -35,14 +51,42 @@ class VectorStore(Base):
     file_name = Column(String(255), nullable=False)
     description = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Сводка по эмбеддингам документов для выбора хранилищ при поиске по всем
+    # файлам: центроид = embedding_sum / document_count, разброс вычисляется
+    # из sq_norm_sum. Суммы, а не средние, позволяют точно учитывать удаление.
+    document_count = Column(Integer, nullable=False, server_default="0")
+    embedding_sum = Column(Vector(1024))
+    sq_norm_sum = Column(Float, nullable=False, server_default="0")
+    # Модель, которой посчитаны эмбеддинги документов; запросы к хранилищу
+    # кодируются той же моделью.
+    embedding_model = Column(String(255))
+    # Давно не используемые хранилища переносятся в vectorstore_archives
+    # (storage_tier = "archived") и возвращаются при первом поиске.
+    storage_tier = Column(String(10), nullable=False, server_default="hot")
+    last_accessed_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Количество RAG-запросов к хранилищу; по нему выбираются хранилища для
+    # прогрева после перезапуска PostgreSQL.
+    query_count = Column(BigInteger, nullable=False, server_default="0")
+    # Увеличивается в той же транзакции, что и каждое изменение документов;
+    # по нему кеш ответов отличает устаревшие записи во всех процессах.
+    content_version = Column(BigInteger, nullable=False, server_default="0")
+    deleted_at = Column(DateTime(timezone=True))
 
     user = relationship("User", back_populates="vectorstores")
     documents = relationship(
         "Document", back_populates="vectorstore", cascade="all, delete-orphan"
     )
 
+    # Имя файла освобождается сразу после удаления хранилища,
+    # не дожидаясь фоновой очистки.
     __table_args__ = (
-        UniqueConstraint("user_id", "file_name", name="uix_user_vectorstore_file_name"),
+        Index(
+            "uix_user_vectorstore_file_name",
+            "user_id",
+            "file_name",
+            unique=True,
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
     )
 
 
@@ -52,9 +96,77 @@ class Document(Base):
     doc_id = Column(Integer, primary_key=True, index=True)
     vectorstore_id = Column(Integer, ForeignKey("vectorstores.vectorstore_id"))
     content = Column(Text)
+    content_hash = Column(String(64))
     doc_metadata = Column(JSONB)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     embedding = Column(Vector(1024))
 
     vectorstore = relationship("VectorStore", back_populates="documents")
+
+    __table_args__ = (
+        Index(
+            "ix_documents_vectorstore_id_content_hash", "vectorstore_id", "content_hash"
+        ),
+        Index("ix_documents_doc_metadata", "doc_metadata", postgresql_using="gin"),
+        Index(
+            "ix_documents_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
+
+
+class DocumentEmbeddingShadow(Base):
+    """Эмбеддинги документов новой моделью до переключения хранилища на нее."""
+
+    __tablename__ = "document_embeddings_shadow"
+
+    doc_id = Column(
+        Integer, ForeignKey("documents.doc_id", ondelete="CASCADE"), primary_key=True
+    )
+    vectorstore_id = Column(
+        Integer,
+        ForeignKey("vectorstores.vectorstore_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    embedding_model = Column(String(255), nullable=False)
+    embedding = Column(Vector(1024), nullable=False)
+
+
+class ReembeddingJob(Base):
+    __tablename__ = "reembedding_jobs"
+
+    vectorstore_id = Column(
+        Integer,
+        ForeignKey("vectorstores.vectorstore_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    target_model = Column(String(255), nullable=False)
+    status = Column(String(20), nullable=False, server_default="running")
+    documents_total = Column(Integer, nullable=False, server_default="0")
+    documents_done = Column(Integer, nullable=False, server_default="0")
+    error = Column(Text)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True))
+
+
+class VectorStoreArchive(Base):
+    """Документы архивного хранилища: jsonl и матрица float16, сжатые zstd."""
+
+    __tablename__ = "vectorstore_archives"
+
+    vectorstore_id = Column(
+        Integer,
+        ForeignKey("vectorstores.vectorstore_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    document_count = Column(Integer, nullable=False)
+    dimension = Column(Integer, nullable=False)
+    documents = Column(LargeBinary, nullable=False)
+    embeddings = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
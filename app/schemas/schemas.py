@@ -40,6 +40,18 @@ class VectorStore(BaseModel):
         from_attributes = True
 
 
+class VectorStoreUpdate(BaseModel):
+    vectorstore_id: int
+    added: int
+    removed: int
+    unchanged: int
+
+
+class DeletionScheduled(BaseModel):
+    vectorstore_ids: List[int]
+    status: str = "scheduled"
+
+
 class DocumentBase(BaseModel):
     content: str
     metadata: Optional[Dict[str, Any]] = Field(default_factory=dict)
@@ -61,6 +73,8 @@ class Document(DocumentBase):
 class SimilaritySearchRequest(BaseModel):
     query: str
     k: int = 4
+    metadata_filter: Optional[Dict[str, Any]] = None
+    consistent_read: bool = False
 
 
 class SimilaritySearchResult(BaseModel):
@@ -70,6 +84,32 @@ class SimilaritySearchResult(BaseModel):
     similarity: float
 
 
+class CrossFileSearchRequest(BaseModel):
+    """Схема запроса поиска по всем файлам пользователя"""
+
+    query: str = Field(..., description="Запрос пользователя")
+    k: int = Field(4, description="Количество результатов")
+    metadata_filter: Optional[Dict[str, Any]] = Field(
+        None, description="Фильтр по метаданным документов"
+    )
+    consistent_read: bool = Field(
+        False, description="Искать на основном сервере БД, а не на реплике"
+    )
+    exhaustive: bool = Field(
+        False,
+        description="Искать во всех хранилищах, а не только в наиболее подходящих",
+    )
+    include_embeddings: bool = Field(
+        False, description="Возвращать эмбеддинги найденных документов"
+    )
+
+
+class CrossFileSearchResult(SimilaritySearchResult):
+    vectorstore_id: int
+    file_name: str
+    embedding: Optional[List[float]] = None
+
+
 class AddTextsRequest(BaseModel):
     texts: List[str]
     metadatas: Optional[List[Dict[str, Any]]] = None
@@ -95,6 +135,16 @@ class RagQueryRequest(BaseModel):
 
     query: str = Field(..., description="Запрос пользователя")
     file_name: str = Field(..., description="Имя файла векторного хранилища для поиска")
+    metadata_filter: Optional[Dict[str, Any]] = Field(
+        None,
+        description="Фильтр по метаданным документов, например "
+        '{"page": {"$gte": 3, "$lte": 10}}',
+    )
+    consistent_read: bool = Field(
+        False,
+        description="Искать на основном сервере БД, а не на реплике, "
+        "чтобы увидеть только что загруженные документы",
+    )
 
 
 class SelectCurrentVectorStore(BaseModel):
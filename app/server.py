@@ -0,0 +1,215 @@
+"""
+Продакшен-запуск API с несколькими воркерами и общей моделью эмбеддингов.
+
+Мастер-процесс один раз загружает приложение вместе с моделью, открывает
+сокет и форкает воркеры. Веса модели остаются в страницах мастера и делятся
+между воркерами по copy-on-write, поэтому добавление воркера не добавляет
+еще одну копию модели в память.
+
+    python -m app.server --host 0.0.0.0 --port 7860 --workers 4
+
+Модель на GPU так разделить нельзя (CUDA не переживает fork) — в этом случае
+используйте сервер эмбеддингов (EMBEDDING_MODEL_TYPE=embedding_server).
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+import uvicorn
+
+from app.config import settings
+from app.services.memory import process_memory
+
+logger = logging.getLogger(__name__)
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load_application():
+    """
+    Импортирует приложение в мастере: при импорте загружается модель эмбеддингов.
+
+    Returns:
+        Приложение FastAPI
+    """
+    from app.main import app
+
+    if settings.EMBEDDING_MODEL_TYPE == "sentence_transformers":
+        import torch
+
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            raise RuntimeError(
+                "Модель загружена на GPU, а CUDA нельзя разделить между "
+                "форкнутыми воркерами. Используйте EMBEDDING_MODEL_TYPE=embedding_server"
+            )
+    return app
+
+
+def reset_after_fork(threads: int) -> None:
+    """
+    Сбрасывает в воркере ресурсы, унаследованные от мастера.
+
+    Соединения с БД нельзя использовать из нескольких процессов, поэтому
+    пулы забываются без закрытия (закрытие оборвало бы соединения мастера).
+    """
+    from app.api.dependencies import async_engine, engine
+    from app.services import db
+
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    db._pools.clear()
+    db._read_routers.clear()
+
+    if settings.EMBEDDING_MODEL_TYPE == "sentence_transformers":
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def run_worker(app, sock: socket.socket, threads: int) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    reset_after_fork(threads)
+
+    config = uvicorn.Config(app, lifespan="on", log_level="info")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def spawn_worker(app, sock: socket.socket, threads: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(app, sock, threads)
+        except BaseException:
+            logger.exception("Воркер завершился с ошибкой")
+            os._exit(1)
+        os._exit(0)
+    logger.info(f"Запущен воркер {pid}")
+    return pid
+
+
+def log_memory(workers: Dict[int, float]) -> None:
+    master = process_memory()
+    lines = [f"мастер {os.getpid()}: RSS {master.get('rss', 0) // 1024} МБ"]
+    total_pss = master.get("pss", 0)
+    for pid in workers:
+        memory = process_memory(pid)
+        total_pss += memory.get("pss", 0)
+        # Страницы, унаследованные от мастера, учитываются как Shared_Dirty.
+        shared = memory.get("shared_clean", 0) + memory.get("shared_dirty", 0)
+        lines.append(
+            f"воркер {pid}: RSS {memory.get('rss', 0) // 1024} МБ, "
+            f"PSS {memory.get('pss', 0) // 1024} МБ, "
+            f"общие {shared // 1024} МБ"
+        )
+    logger.info(
+        "Память процессов: " + "; ".join(lines) + f"; всего PSS {total_pss // 1024} МБ"
+    )
+
+
+def serve(host: str, port: int, workers: int, threads: int, backlog: int) -> None:
+    app = load_application()
+    sock = bind_socket(host, port, backlog)
+    logger.info(
+        f"Приложение загружено, запуск {workers} воркеров на {host}:{port} "
+        f"по {threads} потоков torch"
+    )
+
+    # Объекты, созданные до fork (в первую очередь модель), переносятся
+    # в постоянное поколение: сборщик мусора воркеров не будет их обходить
+    # и изменять счетчики ссылок, копируя страницы мастера.
+    gc.collect()
+    gc.freeze()
+
+    children: Dict[int, float] = {}
+    for _ in range(workers):
+        children[spawn_worker(app, sock, threads)] = time.monotonic()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    next_report = time.monotonic() + settings.SERVER_MEMORY_REPORT_INTERVAL
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.5)
+            if time.monotonic() >= next_report:
+                log_memory(children)
+                next_report = time.monotonic() + settings.SERVER_MEMORY_REPORT_INTERVAL
+            continue
+
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        logger.warning(
+            f"Воркер {pid} завершился с кодом {os.waitstatus_to_exitcode(status)}"
+        )
+        # Воркер, падающий сразу после старта, перезапускается с паузой,
+        # чтобы не форкать процессы в цикле.
+        if time.monotonic() - started < 1:
+            time.sleep(1)
+        children[spawn_worker(app, sock, threads)] = time.monotonic()
+
+    sock.close()
+    logger.info("Все воркеры остановлены")
+
+
+def main() -> None:
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(prog="python -m app.server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=settings.SERVER_TORCH_THREADS,
+        help="Потоков torch на воркер, по умолчанию ядра / воркеры",
+    )
+    parser.add_argument("--backlog", type=int, default=2048)
+    args = parser.parse_args()
+
+    threads = args.threads or max(1, cpu_count // args.workers)
+    # Ограничение должно действовать до импорта torch в мастере.
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("MKL_NUM_THREADS", str(threads))
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        serve(args.host, args.port, args.workers, threads, args.backlog)
+    except RuntimeError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional
+
+from psycopg2.extras import execute_values
+
+from app.config import settings
+from app.services.db import pooled_connection
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AccessTracker:
+    """
+    Учет обращений к хранилищам.
+
+    Обращения копятся в памяти процесса и записываются в
+    vectorstores.last_accessed_at (и количество RAG-запросов в query_count)
+    одним UPDATE не чаще раза в flush_interval секунд, поэтому поиск не пишет
+    в БД на каждый запрос.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, float] = {}
+        self._queries: Counter = Counter()
+        self._last_flush = time.monotonic()
+        self._flushing = False
+        self._lock = threading.Lock()
+
+    def touch(
+        self,
+        vectorstore_ids: Iterable[int],
+        connection_config: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Отмечает обращение к хранилищам.
+
+        Если с последней записи прошло больше flush_interval секунд,
+        накопленные обращения записываются в текущем потоке.
+
+        Args:
+            vectorstore_ids: ID хранилищ
+            connection_config: Конфигурация подключения к PostgreSQL
+        """
+        now = time.time()
+        with self._lock:
+            for vectorstore_id in vectorstore_ids:
+                self._pending[vectorstore_id] = now
+            due = (
+                not self._flushing
+                and time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            if due:
+                self._flushing = True
+        if due:
+            self.flush(connection_config)
+
+    def record_query(self, vectorstore_id: int) -> None:
+        """
+        Учитывает RAG-запрос к хранилищу, в том числе ответ из кеша.
+
+        Только обновляет счетчики в памяти и не обращается к БД, поэтому
+        вызывается из цикла событий; запись выполнит следующий touch или flush.
+
+        Args:
+            vectorstore_id: ID хранилища
+        """
+        with self._lock:
+            self._pending[vectorstore_id] = time.time()
+            self._queries[vectorstore_id] += 1
+
+    def flush(self, connection_config: Optional[Dict[str, Any]] = None) -> None:
+        """Записывает накопленные обращения в БД."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            queries, self._queries = self._queries, Counter()
+        try:
+            if pending:
+                self._write(pending, queries, connection_config)
+                metrics.increment("access_tracker_flushes_total")
+        except Exception:
+            logger.exception("Не удалось записать время обращения к хранилищам")
+            with self._lock:
+                for vectorstore_id, accessed_at in pending.items():
+                    self._pending.setdefault(vectorstore_id, accessed_at)
+                self._queries.update(queries)
+        finally:
+            with self._lock:
+                self._last_flush = time.monotonic()
+                self._flushing = False
+
+    @staticmethod
+    def _write(
+        pending: Dict[int, float],
+        queries: Counter,
+        connection_config: Optional[Dict[str, Any]],
+    ) -> None:
+        with pooled_connection(
+            connection_config or settings.DATABASE_CONNECTION_CONFIG
+        ) as conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    """
+                    UPDATE vectorstores v
+                    SET last_accessed_at = GREATEST(
+                            v.last_accessed_at, to_timestamp(a.accessed_at)
+                        ),
+                        query_count = v.query_count + a.queries
+                    FROM (VALUES %s) AS a (vectorstore_id, accessed_at, queries)
+                    WHERE v.vectorstore_id = a.vectorstore_id
+                    """,
+                    [
+                        (vectorstore_id, accessed_at, queries[vectorstore_id])
+                        for vectorstore_id, accessed_at in sorted(pending.items())
+                    ],
+                )
+            conn.commit()
+
+
+access_tracker = AccessTracker(flush_interval=settings.ACCESS_FLUSH_INTERVAL)
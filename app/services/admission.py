@@ -0,0 +1,107 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from app.config import settings
+from app.services.metrics import metrics
+
+
+class AdmissionRejected(Exception):
+    """Запрос отклонен, потому что очередь ограничителя заполнена."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"Очередь '{name}' переполнена")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """
+    Ограничивает число одновременно выполняемых операций в процессе
+    и длину очереди ожидающих.
+
+    Если очередь заполнена или место не освободилось за queue_timeout секунд,
+    запрос сразу отклоняется с AdmissionRejected, а не копится в памяти.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        retry_after: int,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Занимает место на время блока async with.
+
+        Args:
+            timeout: Максимальное ожидание места, если оно меньше queue_timeout,
+                например остаток срока выполнения запроса
+        """
+        queue_timeout = (
+            self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+        )
+        if self.active + self.waiting >= self.max_concurrency + self.max_queue:
+            self._reject()
+
+        self.waiting += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self._update_gauges()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            self._update_gauges()
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
+
+    def _reject(self) -> None:
+        metrics.increment(f"admission_{self.name}_rejected_total")
+        raise AdmissionRejected(self.name, self.retry_after)
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge(f"admission_{self.name}_active", self.active)
+        metrics.set_gauge(f"admission_{self.name}_waiting", self.waiting)
+
+
+ingestion_limiter = AdmissionLimiter(
+    "ingestion",
+    max_concurrency=settings.INGESTION_MAX_CONCURRENCY,
+    max_queue=settings.INGESTION_MAX_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    retry_after=settings.ADMISSION_RETRY_AFTER,
+)
+query_limiter = AdmissionLimiter(
+    "query",
+    max_concurrency=settings.QUERY_MAX_CONCURRENCY,
+    max_queue=settings.QUERY_MAX_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    retry_after=settings.ADMISSION_RETRY_AFTER,
+)
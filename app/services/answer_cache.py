@@ -0,0 +1,190 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.metrics import metrics
+
+
+class SemanticAnswerCache:
+    """
+    Кеш ответов LLM-сервиса с поиском по смыслу запроса.
+
+    Ответ переиспользуется, если косинусное сходство эмбеддинга нового запроса
+    с эмбеддингом закешированного не меньше threshold, а хранилище, версия
+    его содержимого (vectorstores.content_version), фильтр по метаданным
+    и модель эмбеддингов совпадают. Версия увеличивается в транзакции
+    каждой записи в хранилище, поэтому после изменения, сделанного любым
+    процессом, прежние ответы больше не находятся. Размер кеша ограничен
+    max_entries (вытесняются давно не использованные записи), записи
+    живут ttl секунд.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._by_scope: Dict[Tuple[int, int, str, str], List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(
+        self,
+        vectorstore_id: int,
+        version: int,
+        query_embedding: List[float],
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        embedding_model: Optional[str] = None,
+    ) -> Optional[Any]:
+        """
+        Ищет ответ на близкий по смыслу запрос к тому же хранилищу.
+
+        Args:
+            vectorstore_id: ID хранилища
+            version: Текущая версия содержимого хранилища
+            query_embedding: Эмбеддинг запроса
+            metadata_filter: Фильтр по метаданным документов
+            embedding_model: Модель, которой посчитан эмбеддинг запроса
+
+        Returns:
+            Закешированный ответ или None
+        """
+        if not self.enabled:
+            return None
+
+        scope = self._scope(vectorstore_id, version, metadata_filter, embedding_model)
+        query = self._normalize(query_embedding)
+        now = time.monotonic()
+        with self._lock:
+            entry_ids = [
+                entry_id
+                for entry_id in self._by_scope.get(scope, [])
+                if self._entries[entry_id]["expires_at"] > now
+            ]
+            for entry_id in set(self._by_scope.get(scope, [])) - set(entry_ids):
+                self._remove(entry_id)
+
+            response = None
+            if entry_ids:
+                matrix = np.stack([self._entries[i]["embedding"] for i in entry_ids])
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(entry_ids[best])
+                    response = self._entries[entry_ids[best]]["response"]
+
+        metrics.increment(
+            "answer_cache_hits_total"
+            if response is not None
+            else "answer_cache_misses_total"
+        )
+        return response
+
+    def put(
+        self,
+        vectorstore_id: int,
+        version: int,
+        query_embedding: List[float],
+        response: Any,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        embedding_model: Optional[str] = None,
+    ) -> None:
+        """
+        Сохраняет ответ LLM-сервиса на запрос к хранилищу.
+
+        Args:
+            vectorstore_id: ID хранилища
+            version: Версия содержимого, прочитанная на том же сервере
+                до поиска документов для ответа
+            query_embedding: Эмбеддинг запроса
+            response: Ответ LLM-сервиса
+            metadata_filter: Фильтр по метаданным документов
+            embedding_model: Модель, которой посчитан эмбеддинг запроса
+        """
+        if not self.enabled:
+            return
+
+        scope = self._scope(vectorstore_id, version, metadata_filter, embedding_model)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "scope": scope,
+                "embedding": self._normalize(query_embedding),
+                "response": response,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            self._by_scope.setdefault(scope, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            metrics.set_gauge("answer_cache_entries", len(self._entries))
+
+    def invalidate(self, vectorstore_id: int) -> None:
+        """
+        Освобождает память от ответов по хранилищу после записи в него.
+
+        Корректность обеспечивает версия содержимого: ответы прежних версий
+        не находятся и без вызова invalidate, который действует только
+        в текущем процессе.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            scopes = [scope for scope in self._by_scope if scope[0] == vectorstore_id]
+            for scope in scopes:
+                for entry_id in list(self._by_scope.get(scope, [])):
+                    self._remove(entry_id)
+            metrics.set_gauge("answer_cache_entries", len(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_scope.clear()
+            metrics.set_gauge("answer_cache_entries", 0)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        entry_ids = self._by_scope[entry["scope"]]
+        entry_ids.remove(entry_id)
+        if not entry_ids:
+            del self._by_scope[entry["scope"]]
+
+    @staticmethod
+    def _scope(
+        vectorstore_id: int,
+        version: int,
+        metadata_filter: Optional[Dict[str, Any]],
+        embedding_model: Optional[str],
+    ) -> Tuple[int, int, str, str]:
+        # Эмбеддинги разных моделей несравнимы: после перехода хранилища
+        # на новую модель (в том числе в другом процессе) старые ответы
+        # не должны находиться по запросам, закодированным новой моделью.
+        return (
+            vectorstore_id,
+            version,
+            embedding_model or settings.EMBEDDING_MODEL_NAME,
+            json.dumps(metadata_filter or {}, sort_keys=True),
+        )
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+answer_cache = SemanticAnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl=settings.ANSWER_CACHE_TTL,
+    threshold=settings.ANSWER_CACHE_THRESHOLD,
+)
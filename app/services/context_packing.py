@@ -0,0 +1,96 @@
+import logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from app.services.embeddings import count_tokens
+from app.services.metrics import metrics
+
+
+def prune_near_duplicates(
+    candidates: List[Dict[str, Any]], threshold: float
+) -> List[Dict[str, Any]]:
+    """
+    Удаляет кандидатов, почти совпадающих с более релевантными.
+
+    Попарные косинусные сходства считаются одним матричным умножением по уже
+    полученным из БД эмбеддингам. Кандидат отбрасывается, если его сходство
+    с любым оставленным кандидатом не ниже threshold.
+
+    Args:
+        candidates: Результаты поиска с полем embedding, по убыванию сходства
+        threshold: Порог косинусного сходства для дубликатов
+
+    Returns:
+        Оставленные кандидаты в исходном порядке
+    """
+    if len(candidates) < 2:
+        return list(candidates)
+
+    matrix = np.asarray([c["embedding"] for c in candidates], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    similarities = matrix @ matrix.T
+
+    kept: List[int] = []
+    for index in range(len(candidates)):
+        if not kept or similarities[index, kept].max() < threshold:
+            kept.append(index)
+    return [candidates[index] for index in kept]
+
+
+def pack_context(
+    model: Embeddings,
+    candidates: List[Dict[str, Any]],
+    token_budget: int,
+    duplicate_threshold: float,
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Готовит кандидатов для LLM: удаляет почти дубликаты и укладывает
+    оставшиеся в бюджет токенов.
+
+    Кандидаты добавляются по убыванию сходства; не поместившийся кандидат
+    пропускается, а следующие, более короткие, еще могут поместиться. Самый
+    релевантный кандидат остается, даже если он один превышает бюджет.
+
+    Args:
+        model: Модель эмбеддингов, чей токенизатор используется для подсчета
+        candidates: Результаты поиска с полем embedding, по убыванию сходства
+        token_budget: Бюджет токенов на все кандидаты
+        duplicate_threshold: Порог косинусного сходства для дубликатов
+
+    Returns:
+        Отобранные кандидаты и статистика: токены до и после, количество
+        удаленных дубликатов и не поместившихся в бюджет кандидатов
+    """
+    lengths = count_tokens(model, [c["content"] for c in candidates], truncate=False)
+    for candidate, length in zip(candidates, lengths):
+        candidate["tokens"] = length
+
+    unique = prune_near_duplicates(candidates, duplicate_threshold)
+    packed, used = [], 0
+    for candidate in unique:
+        if not packed or used + candidate["tokens"] <= token_budget:
+            packed.append(candidate)
+            used += candidate["tokens"]
+
+    stats = {
+        "tokens_before": sum(lengths),
+        "tokens_after": used,
+        "duplicates_removed": len(candidates) - len(unique),
+        "over_budget": len(unique) - len(packed),
+    }
+    metrics.increment("context_tokens_before_total", stats["tokens_before"])
+    metrics.increment(
+        "context_tokens_saved_total", stats["tokens_before"] - stats["tokens_after"]
+    )
+    metrics.increment("context_duplicates_removed_total", stats["duplicates_removed"])
+    metrics.increment("context_over_budget_total", stats["over_budget"])
+    logging.info(
+        f"Контекст для LLM: {len(packed)} из {len(candidates)} кандидатов, "
+        f"{stats['tokens_after']} из {stats['tokens_before']} токенов "
+        f"(дубликатов {stats['duplicates_removed']}, "
+        f"вне бюджета {stats['over_budget']})"
+    )
+    return packed, stats
@@ -0,0 +1,280 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import orjson
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+from pgvector.psycopg2 import register_vector
+from psycopg2.pool import ThreadedConnectionPool
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class VectorConnection(psycopg2.extensions.connection):
+    """
+    Соединение с зарегистрированным типом vector.
+
+    Значения json и jsonb разбираются драйвером через orjson, поэтому
+    doc_metadata приходит готовым словарем без повторного json.loads.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        register_vector(self)
+        psycopg2.extras.register_default_json(self, loads=orjson.loads)
+        psycopg2.extras.register_default_jsonb(self, loads=orjson.loads)
+        self.commit()
+
+
+class ConnectionPool:
+    """
+    Пул соединений psycopg2, который ждет освобождения соединения,
+    а не падает с PoolError при исчерпании.
+    """
+
+    def __init__(self, connection_config: Dict[str, Any], minconn: int, maxconn: int):
+        self._pool = ThreadedConnectionPool(
+            minconn, maxconn, connection_factory=VectorConnection, **connection_config
+        )
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[VectorConnection]:
+        timeout = settings.DB_POOL_TIMEOUT if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(
+                "Не удалось получить соединение из пула за отведенное время"
+            )
+        try:
+            conn = self._pool.getconn()
+            try:
+                yield conn
+            finally:
+                # Незавершенная транзакция откатывается пулом, а разорванные
+                # соединения закрываются, а не возвращаются в пул.
+                self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+_pools: Dict[Tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(connection_config: Dict[str, Any]) -> ConnectionPool:
+    """
+    Возвращает пул соединений для конфигурации, создавая его при первом обращении.
+
+    Args:
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        Пул соединений
+    """
+    key = tuple(sorted(connection_config.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(
+                    connection_config,
+                    minconn=settings.DB_POOL_MIN_SIZE,
+                    maxconn=settings.DB_POOL_MAX_SIZE,
+                )
+                _pools[key] = pool
+    return pool
+
+
+_pgvector_versions: Dict[str, Tuple[int, ...]] = {}
+
+
+def pgvector_version(conn: psycopg2.extensions.connection) -> Tuple[int, ...]:
+    """
+    Возвращает версию расширения pgvector в базе соединения (кешируется).
+
+    Args:
+        conn: Соединение psycopg2
+
+    Returns:
+        Версия в виде кортежа чисел, например (0, 8, 0)
+    """
+    version = _pgvector_versions.get(conn.dsn)
+    if version is None:
+        with conn.cursor() as cur:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cur.fetchone()
+        version = tuple(int(part) for part in row[0].split(".")) if row else ()
+        _pgvector_versions[conn.dsn] = version
+    return version
+
+
+@contextmanager
+def pooled_connection(connection_config: Dict[str, Any]) -> Iterator[VectorConnection]:
+    """Берет соединение из пула на время блока with."""
+    with get_pool(connection_config).connection() as conn:
+        yield conn
+
+
+class ReadRouter:
+    """
+    Направляет читающие запросы на реплики по кругу с откатом на основной сервер.
+
+    Реплика, к которой не удалось подключиться или на которой запрос упал
+    с OperationalError, исключается из ротации на DB_REPLICA_RETRY_INTERVAL
+    секунд, после чего снова получает запросы. Если все реплики недоступны,
+    чтение выполняется на основном сервере.
+
+    Чтобы запрос сразу после записи видел свои изменения, хранилища,
+    в которые недавно писали, READ_YOUR_WRITES_WINDOW секунд читаются
+    с основного сервера. Окно действует в пределах процесса; для чтения
+    из другого процесса используется флаг consistent.
+    """
+
+    def __init__(
+        self,
+        primary_config: Dict[str, Any],
+        replica_configs: List[Dict[str, Any]],
+        retry_interval: float,
+        read_your_writes_window: float,
+    ):
+        self.primary_config = primary_config
+        self.replica_configs = replica_configs
+        self.retry_interval = retry_interval
+        self.read_your_writes_window = read_your_writes_window
+        self._next = 0
+        self._unhealthy_until: Dict[int, float] = {}
+        self._recent_writes: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def mark_write(self, vectorstore_id: int) -> None:
+        """Отмечает запись в хранилище, чтобы следующие чтения шли на основной сервер."""
+        if not self.replica_configs:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[vectorstore_id] = now + self.read_your_writes_window
+            # Просроченные отметки удаляются, чтобы словарь не рос бесконечно.
+            expired = [key for key, until in self._recent_writes.items() if until < now]
+            for key in expired:
+                del self._recent_writes[key]
+
+    def read(
+        self,
+        fn: Callable[[VectorConnection], T],
+        vectorstore_id: Optional[int] = None,
+        consistent: bool = False,
+    ) -> T:
+        """
+        Выполняет читающую функцию на реплике или на основном сервере.
+
+        Args:
+            fn: Функция, получающая соединение и возвращающая результат
+            vectorstore_id: ID хранилища, из которого читаются данные
+            consistent: Читать с основного сервера
+
+        Returns:
+            Результат fn
+        """
+        for index in self._replica_order(vectorstore_id, consistent):
+            try:
+                with get_pool(self.replica_configs[index]).connection() as conn:
+                    result = fn(conn)
+                metrics.increment("db_replica_reads_total")
+                return result
+            except psycopg2.errors.QueryCanceled:
+                raise
+            except psycopg2.OperationalError as e:
+                # Ошибки подключения и разрыв соединения: запрос повторяется
+                # на следующей реплике или на основном сервере.
+                self._mark_unhealthy(index, e)
+
+        with get_pool(self.primary_config).connection() as conn:
+            result = fn(conn)
+        metrics.increment("db_primary_reads_total")
+        return result
+
+    def _replica_order(
+        self, vectorstore_id: Optional[int], consistent: bool
+    ) -> List[int]:
+        if not self.replica_configs or consistent:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            if self._recent_writes.get(vectorstore_id, 0) > now:
+                return []
+            start = self._next
+            self._next = (self._next + 1) % len(self.replica_configs)
+            count = len(self.replica_configs)
+            order = [(start + offset) % count for offset in range(count)]
+            return [
+                index for index in order if self._unhealthy_until.get(index, 0) <= now
+            ]
+
+    def _mark_unhealthy(self, index: int, error: Exception) -> None:
+        logger.warning(
+            f"Реплика {index} недоступна, исключена на {self.retry_interval} с: {error}"
+        )
+        metrics.increment("db_replica_failures_total")
+        now = time.monotonic()
+        with self._lock:
+            self._unhealthy_until[index] = now + self.retry_interval
+            unhealthy = sum(
+                1 for until in self._unhealthy_until.values() if until > now
+            )
+        healthy = len(self.replica_configs) - unhealthy
+        metrics.set_gauge("db_replicas_healthy", healthy)
+
+
+_read_routers: Dict[Tuple, ReadRouter] = {}
+
+
+def get_read_router(
+    primary_config: Dict[str, Any],
+    replica_configs: Optional[List[Dict[str, Any]]] = None,
+) -> ReadRouter:
+    """
+    Возвращает маршрутизатор чтения для основного сервера и набора реплик.
+
+    Маршрутизатор общий для процесса, чтобы отметки о записях и состояние
+    реплик видели все экземпляры сервиса.
+
+    Args:
+        primary_config: Конфигурация подключения к основному серверу
+        replica_configs: Конфигурации реплик, по умолчанию из DB_REPLICA_URLS
+
+    Returns:
+        Маршрутизатор чтения
+    """
+    if replica_configs is None:
+        replica_configs = settings.DB_REPLICA_CONNECTION_CONFIGS
+    key = (
+        tuple(sorted(primary_config.items())),
+        tuple(tuple(sorted(config.items())) for config in replica_configs),
+    )
+    router = _read_routers.get(key)
+    if router is None:
+        with _pools_lock:
+            router = _read_routers.setdefault(
+                key,
+                ReadRouter(
+                    primary_config,
+                    replica_configs,
+                    retry_interval=settings.DB_REPLICA_RETRY_INTERVAL,
+                    read_your_writes_window=settings.READ_YOUR_WRITES_WINDOW,
+                ),
+            )
+    return router
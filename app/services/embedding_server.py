@@ -0,0 +1,270 @@
+"""
+Сервер эмбеддингов для многопроцессных развертываний.
+
+Модель загружается один раз в отдельном процессе, а воркеры API обращаются
+к ней через Unix-сокет (`EMBEDDING_MODEL_TYPE=embedding_server`). Запросы всех
+воркеров собираются в общие батчи: сервер ждет не дольше
+EMBEDDING_SERVER_MAX_WAIT_MS и набирает до EMBEDDING_SERVER_MAX_BATCH текстов.
+
+Запуск:
+    python -m app.services.embedding_server --socket /tmp/chatrag-embeddings.sock
+
+Протокол: каждое сообщение — 4 байта длины (big-endian) и тело. Запрос —
+JSON `{"kind": "documents" | "query", "texts": [...]}`. Ответ — JSON-заголовок
+`{"count": n, "dim": d}` и кадр с матрицей float32 (little-endian) либо
+`{"error": "..."}`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from app.config import settings
+
+_FRAME_HEADER = struct.Struct("!I")
+KIND_DOCUMENTS = "documents"
+KIND_QUERY = "query"
+
+
+def _encode_frame(payload: bytes) -> bytes:
+    return _FRAME_HEADER.pack(len(payload)) + payload
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError("Сервер эмбеддингов закрыл соединение")
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
+    (size,) = _FRAME_HEADER.unpack(_recv_exact(sock, _FRAME_HEADER.size))
+    return _recv_exact(sock, size)
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    (size,) = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+    return await reader.readexactly(size)
+
+
+class EmbeddingServerClient(Embeddings):
+    """Адаптер Embeddings, который отправляет тексты на сервер эмбеддингов."""
+
+    def __init__(
+        self, socket_path: Optional[str] = None, timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            socket_path: Путь к Unix-сокету сервера
+            timeout: Таймаут ожидания ответа в секундах
+        """
+        self.socket_path = socket_path or settings.EMBEDDING_SERVER_SOCKET
+        self.timeout = timeout or settings.EMBEDDING_SERVER_TIMEOUT
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _request(self, kind: str, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        payload = _encode_frame(
+            json.dumps({"kind": kind, "texts": texts}, ensure_ascii=False).encode()
+        )
+        # Соединение на поток переиспользуется; если сервер перезапускался,
+        # первая попытка упадет на разорванном сокете и будет повторена.
+        for attempt in range(2):
+            try:
+                sock = self._connect()
+                sock.sendall(payload)
+                header = json.loads(_recv_frame(sock))
+                if "error" in header:
+                    raise RuntimeError(f"Ошибка сервера эмбеддингов: {header['error']}")
+                data = _recv_frame(sock)
+                break
+            except ConnectionError:
+                self._close()
+                if attempt:
+                    raise
+            except BaseException:
+                self._close()
+                raise
+
+        vectors = np.frombuffer(data, dtype="<f4").reshape(
+            header["count"], header["dim"]
+        )
+        return vectors.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._request(KIND_DOCUMENTS, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._request(KIND_QUERY, [text])[0]
+
+
+class EmbeddingBatcher:
+    """Собирает запросы от всех клиентов в батчи и прогоняет их через модель."""
+
+    def __init__(self, model: Embeddings, max_batch: int, max_wait_ms: float):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # Модель вызывается из одного потока: параллелизм обеспечивает сам torch.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def embed(self, kind: str, texts: List[str]) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((kind, texts, future))
+        return await future
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            total = len(batch[0][1])
+            deadline = loop.time() + self.max_wait
+            while total < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                total += len(item[1])
+
+            for kind in (KIND_QUERY, KIND_DOCUMENTS):
+                group = [item for item in batch if item[0] == kind]
+                if group:
+                    await self._run_group(kind, group)
+
+    async def _run_group(
+        self, kind: str, group: List[Tuple[str, List[str], asyncio.Future]]
+    ) -> None:
+        texts = [text for _, item_texts, _ in group for text in item_texts]
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._embed, kind, texts
+            )
+        except Exception as e:
+            logging.error(f"Ошибка при вычислении эмбеддингов: {str(e)}")
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for _, item_texts, future in group:
+            end = offset + len(item_texts)
+            if not future.done():
+                future.set_result(vectors[offset:end])
+            offset = end
+
+    def _embed(self, kind: str, texts: List[str]) -> np.ndarray:
+        # Запросы батчатся через embed_documents, только если модель кодирует
+        # запросы так же, как документы (нет отдельных query_encode_kwargs).
+        if kind == KIND_QUERY and getattr(self.model, "query_encode_kwargs", None):
+            vectors = [self.model.embed_query(text) for text in texts]
+        else:
+            vectors = self.model.embed_documents(texts)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+async def serve(socket_path: str, model: Embeddings) -> None:
+    batcher = EmbeddingBatcher(
+        model,
+        max_batch=settings.EMBEDDING_SERVER_MAX_BATCH,
+        max_wait_ms=settings.EMBEDDING_SERVER_MAX_WAIT_MS,
+    )
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = json.loads(await _read_frame(reader))
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    vectors = await batcher.embed(request["kind"], request["texts"])
+                    header = {"count": vectors.shape[0], "dim": vectors.shape[1]}
+                    writer.write(
+                        _encode_frame(json.dumps(header).encode())
+                        + _encode_frame(vectors.astype("<f4").tobytes())
+                    )
+                except Exception as e:
+                    writer.write(_encode_frame(json.dumps({"error": str(e)}).encode()))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    batcher_task = asyncio.create_task(batcher.run())
+    logging.info(f"Сервер эмбеддингов слушает {socket_path}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher_task.cancel()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сервер эмбеддингов")
+    parser.add_argument("--socket", default=settings.EMBEDDING_SERVER_SOCKET)
+    parser.add_argument(
+        "--model-type",
+        default="sentence_transformers",
+        choices=["sentence_transformers", "fake"],
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.model_type == "fake":
+        from app.services.embeddings import DeterministicFakeEmbeddings
+
+        model = DeterministicFakeEmbeddings(
+            latency_ms=settings.FAKE_EMBEDDING_LATENCY_MS
+        )
+    else:
+        from app.services.embeddings import create_huggingface_embeddings
+
+        model = create_huggingface_embeddings()
+
+    try:
+        asyncio.run(serve(args.socket, model))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import re
+import time
+from typing import List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from app.config import settings
+from app.services.metrics import metrics
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def get_device():
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    elif torch.backends.mps.is_available():
+        return "mps"
+    else:
+        return "cpu"
+
+
+def create_huggingface_embeddings(model_name: Optional[str] = None) -> Embeddings:
+    """
+    Загружает локальную модель sentence-transformers.
+
+    torch и langchain_huggingface импортируются внутри функции, чтобы процессы,
+    которые обращаются к модели через сервер эмбеддингов, их не загружали.
+
+    Args:
+        model_name: Имя модели HuggingFace, по умолчанию EMBEDDING_MODEL_NAME
+
+    Returns:
+        Модель эмбеддингов
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=model_name or settings.EMBEDDING_MODEL_NAME,
+        model_kwargs={"device": get_device()},
+        encode_kwargs={
+            "normalize_embeddings": True,
+            "batch_size": settings.EMBEDDING_MAX_BATCH_SIZE,
+        },
+        cache_folder="cache_hf",
+    )
+
+
+def count_tokens(
+    model: Embeddings, texts: List[str], truncate: bool = True
+) -> List[int]:
+    """
+    Считает длину текстов в токенах модели.
+
+    Если токенизатор модели недоступен (сервер эмбеддингов, заглушка),
+    длина оценивается по количеству слов.
+
+    Args:
+        model: Модель эмбеддингов
+        texts: Список текстов
+        truncate: Учитывать обрезку до max_seq_length, как при расчете эмбеддингов
+
+    Returns:
+        Список длин в токенах
+    """
+    if not texts:
+        # Быстрый токенизатор HuggingFace не принимает пустой батч.
+        return []
+    client = getattr(model, "_client", None)
+    tokenizer = getattr(client, "tokenizer", None)
+    if tokenizer is None:
+        return [len(_TOKEN_RE.findall(text)) + 2 for text in texts]
+
+    if truncate:
+        max_length = (
+            getattr(client, "max_seq_length", None) or tokenizer.model_max_length
+        )
+        encoded = tokenizer(
+            texts, add_special_tokens=True, truncation=True, max_length=max_length
+        )
+    else:
+        encoded = tokenizer(texts, add_special_tokens=False, verbose=False)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def embed_documents_bucketed(
+    model: Embeddings,
+    texts: List[str],
+    token_budget: Optional[int] = None,
+    max_batch_size: Optional[int] = None,
+) -> List[List[float]]:
+    """
+    Вычисляет эмбеддинги документов батчами из текстов близкой длины.
+
+    Тексты сортируются по длине, и батч растет, пока его размер с учетом
+    паддинга до самого длинного элемента укладывается в бюджет токенов.
+    Короткие тексты идут большими батчами, длинные — маленькими. Порядок
+    результатов совпадает с порядком `texts`.
+
+    Args:
+        model: Модель эмбеддингов
+        texts: Список текстов
+        token_budget: Бюджет токенов на батч, по умолчанию EMBEDDING_TOKEN_BUDGET
+        max_batch_size: Максимум текстов в батче, по умолчанию EMBEDDING_MAX_BATCH_SIZE
+
+    Returns:
+        Список эмбеддингов в исходном порядке
+    """
+    if not texts:
+        return []
+    token_budget = token_budget or settings.EMBEDDING_TOKEN_BUDGET
+    max_batch_size = max_batch_size or settings.EMBEDDING_MAX_BATCH_SIZE
+
+    started = time.perf_counter()
+    lengths = count_tokens(model, texts)
+    # Сначала самые длинные: первый элемент батча задает его паддинг.
+    order = sorted(range(len(texts)), key=lengths.__getitem__, reverse=True)
+
+    batches: List[List[int]] = []
+    for index in order:
+        batch = batches[-1] if batches else None
+        if (
+            batch is None
+            or len(batch) >= max_batch_size
+            or (len(batch) + 1) * lengths[batch[0]] > token_budget
+        ):
+            batches.append([index])
+        else:
+            batch.append(index)
+
+    embeddings: List[Optional[List[float]]] = [None] * len(texts)
+    padded_tokens = 0
+    for batch in batches:
+        padded_tokens += len(batch) * lengths[batch[0]]
+        vectors = model.embed_documents([texts[index] for index in batch])
+        for index, vector in zip(batch, vectors):
+            embeddings[index] = vector
+
+    elapsed = time.perf_counter() - started
+    tokens = sum(lengths)
+    tokens_per_second = tokens / elapsed if elapsed > 0 else 0.0
+    metrics.increment("embedding_documents_total", len(texts))
+    metrics.increment("embedding_tokens_total", tokens)
+    metrics.increment("embedding_padded_tokens_total", padded_tokens)
+    metrics.increment("embedding_seconds_total", elapsed)
+    metrics.set_gauge("embedding_tokens_per_second", tokens_per_second)
+    logging.info(
+        f"Эмбеддинги для {len(texts)} текстов ({tokens} токенов, "
+        f"{len(batches)} батчей) за {elapsed:.2f} с: {tokens_per_second:.0f} токенов/с"
+    )
+    return embeddings
+
+
+class DeterministicFakeEmbeddings(Embeddings):
+    """
+    Детерминированная модель эмбеддингов для тестов и бенчмарков.
+
+    Каждый токен хешируется в одну из координат вектора (feature hashing),
+    поэтому тексты с общими словами получают близкие векторы, а один и тот же
+    текст всегда даёт один и тот же вектор. Модель не требует загрузки весов.
+    """
+
+    def __init__(self, size: int = 1024, latency_ms: float = 0.0):
+        """
+        Args:
+            size: Размерность эмбеддингов
+            latency_ms: Искусственная задержка на один текст в миллисекундах
+        """
+        self.size = size
+        self.latency_ms = latency_ms
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in _TOKEN_RE.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value & 1 else -1.0
+            vector[(value >> 1) % self.size] += sign
+
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+        else:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms * len(texts) / 1000)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+import orjson
+
+from app.config import settings
+from app.services.resilience import (
+    CircuitBreaker,
+    Deadline,
+    DeadlineExceeded,
+    retry_with_backoff,
+)
+
+logger = logging.getLogger(__name__)
+
+# Ответы балансировщика, при которых запрос не был обработан LLM-сервисом
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+
+class LLMServiceUnavailable(Exception):
+    """LLM-сервис вернул ответ, после которого запрос можно повторить."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"LLM-сервис недоступен: HTTP {status_code}")
+        self.status_code = status_code
+
+
+class LLMClient:
+    """
+    Клиент LLM-сервиса с общим пулом соединений.
+
+    Таймаут каждой попытки ограничен оставшимся сроком запроса. Повторяются
+    только ошибки, при которых запрос заведомо не обработан: сбой
+    подключения, ожидание соединения из пула и ответы 502/503/504.
+    Таймаут чтения не повторяется, потому что сервис мог уже начать
+    генерацию ответа. Отказы учитываются размыкателем цепи, и при
+    недоступном сервисе запросы отклоняются сразу с CircuitOpen.
+    """
+
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url
+        self.breaker = breaker
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def post(self, payload: Dict[str, Any], deadline: Deadline) -> bytes:
+        """
+        Отправляет запрос в LLM-сервис с повторами в пределах срока.
+
+        Args:
+            payload: Тело запроса
+            deadline: Срок выполнения запроса
+
+        Returns:
+            Тело JSON-ответа сервиса без разбора
+
+        Raises:
+            DeadlineExceeded: Если срок истек до получения ответа
+            CircuitOpen: Если цепь разомкнута
+        """
+        try:
+            return await retry_with_backoff(
+                lambda: self._attempt(payload, deadline),
+                deadline,
+                attempts=settings.LLM_RETRY_ATTEMPTS,
+                base_delay=settings.LLM_RETRY_BASE_DELAY,
+                max_delay=settings.LLM_RETRY_MAX_DELAY,
+                retryable=(
+                    httpx.ConnectError,
+                    httpx.ConnectTimeout,
+                    httpx.PoolTimeout,
+                    LLMServiceUnavailable,
+                ),
+                name="llm",
+            )
+        except httpx.TimeoutException as e:
+            if deadline.remaining() <= 0:
+                raise DeadlineExceeded("llm") from e
+            raise
+
+    async def aclose(self) -> None:
+        """Закрывает пул соединений."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _attempt(self, payload: Dict[str, Any], deadline: Deadline) -> bytes:
+        deadline.check("llm")
+        self.breaker.allow()
+        timeout = httpx.Timeout(
+            deadline.remaining(),
+            connect=deadline.timeout(settings.LLM_CONNECT_TIMEOUT),
+        )
+        try:
+            response = await self._get_client().post(
+                self.url,
+                content=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"},
+                timeout=timeout,
+            )
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            raise
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                raise LLMServiceUnavailable(response.status_code)
+        else:
+            # Ошибки 4xx вызваны самим запросом, а не состоянием сервиса.
+            self.breaker.record_success()
+        response.raise_for_status()
+        return response.content
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Соединения клиента привязаны к циклу событий, в котором созданы.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient()
+            self._loop = loop
+        return self._client
+
+
+llm_client = LLMClient(
+    settings.LLM_SERVICE_URL,
+    CircuitBreaker(
+        "llm",
+        failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=settings.LLM_CIRCUIT_RESET_TIMEOUT,
+    ),
+)
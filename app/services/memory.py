@@ -0,0 +1,46 @@
+import os
+from typing import Dict, Optional
+
+_SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, int]:
+    """
+    Возвращает потребление памяти процесса в килобайтах.
+
+    PSS делит общие страницы между процессами, которые их используют,
+    поэтому сумма PSS воркеров показывает реальный расход памяти, а RSS
+    учитывает общие страницы модели в каждом воркере целиком. Данные берутся
+    из /proc/<pid>/smaps_rollup (Linux 4.14+), иначе только RSS из
+    /proc/<pid>/status.
+
+    Args:
+        pid: ID процесса, по умолчанию текущий
+
+    Returns:
+        Словарь rss, pss, shared_*, private_* в килобайтах
+    """
+    pid = pid or os.getpid()
+    memory: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in _SMAPS_FIELDS:
+                    memory[_SMAPS_FIELDS[name]] = int(value.split()[0])
+    except OSError:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        memory["rss"] = int(line.split()[1])
+        except OSError:
+            pass
+    return memory
@@ -0,0 +1,117 @@
+"""
+Преобразование фильтра по метаданным документов в условие SQL.
+
+Фильтр — словарь в стиле MongoDB, условия верхнего уровня объединяются через AND:
+
+    {"section": "intro"}                      равенство
+    {"page": {"$gte": 3, "$lte": 10}}         диапазон
+    {"tag": {"$in": ["a", "b"]}}              одно из значений
+    {"draft": {"$exists": False}}             наличие ключа
+    {"$or": [{"page": 1}, {"section": "x"}]}  логические комбинации
+
+Равенство и $in превращаются в `doc_metadata @> ...`, а $exists — в
+`doc_metadata ? ...`, поэтому используют GIN-индекс по doc_metadata.
+Сравнения выполняются через jsonpath и не падают на значениях другого типа.
+"""
+import json
+from typing import Any, Dict, List, Tuple
+
+_COMPARISONS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_SCALAR_TYPES = (str, int, float, bool)
+
+
+class MetadataFilterError(ValueError):
+    """Некорректное выражение фильтра по метаданным."""
+
+
+def build_metadata_filter(
+    metadata_filter: Dict[str, Any], column: str = "doc_metadata"
+) -> Tuple[str, List[Any]]:
+    """
+    Строит условие WHERE по фильтру метаданных.
+
+    Args:
+        metadata_filter: Выражение фильтра
+        column: Имя JSONB-колонки с метаданными
+
+    Returns:
+        SQL-условие с плейсхолдерами %s и список параметров
+    """
+    if not isinstance(metadata_filter, dict):
+        raise MetadataFilterError("Фильтр должен быть объектом")
+
+    clauses, params = [], []
+    for key, condition in metadata_filter.items():
+        if key in ("$and", "$or"):
+            clause, clause_params = _build_logical(key, condition, column)
+        elif key.startswith("$"):
+            raise MetadataFilterError(f"Неизвестный оператор {key}")
+        else:
+            clause, clause_params = _build_field(key, condition, column)
+        clauses.append(clause)
+        params.extend(clause_params)
+
+    if not clauses:
+        return "TRUE", []
+    return "(" + " AND ".join(clauses) + ")", params
+
+
+def _build_logical(
+    operator: str, conditions: Any, column: str
+) -> Tuple[str, List[Any]]:
+    if not isinstance(conditions, list) or not conditions:
+        raise MetadataFilterError(f"{operator} ожидает непустой список условий")
+
+    clauses, params = [], []
+    for condition in conditions:
+        clause, clause_params = build_metadata_filter(condition, column)
+        clauses.append(clause)
+        params.extend(clause_params)
+    joiner = " AND " if operator == "$and" else " OR "
+    return "(" + joiner.join(clauses) + ")", params
+
+
+def _build_field(key: str, condition: Any, column: str) -> Tuple[str, List[Any]]:
+    if not isinstance(condition, dict):
+        return _contains(key, condition, column)
+
+    clauses, params = [], []
+    for operator, value in condition.items():
+        if operator == "$eq":
+            clause, clause_params = _contains(key, value, column)
+        elif operator == "$ne":
+            clause, clause_params = _contains(key, value, column)
+            clause = f"NOT ({clause})"
+        elif operator in ("$in", "$nin"):
+            if not isinstance(value, list) or not value:
+                raise MetadataFilterError(f"{operator} ожидает непустой список")
+            parts = [_contains(key, item, column) for item in value]
+            clause = "(" + " OR ".join(part for part, _ in parts) + ")"
+            clause_params = [param for _, part_params in parts for param in part_params]
+            if operator == "$nin":
+                clause = f"NOT ({clause})"
+        elif operator in _COMPARISONS:
+            if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+                raise MetadataFilterError(f"{operator} ожидает число или строку")
+            path = f"$.{json.dumps(key)} ? (@ {_COMPARISONS[operator]} $value)"
+            clause = f"jsonb_path_exists({column}, %s::jsonpath, %s::jsonb)"
+            clause_params = [path, json.dumps({"value": value})]
+        elif operator == "$exists":
+            clause = f"{column} ? %s"
+            clause_params = [key]
+            if not value:
+                clause = f"NOT ({clause})"
+        else:
+            raise MetadataFilterError(f"Неизвестный оператор {operator}")
+        clauses.append(clause)
+        params.extend(clause_params)
+
+    if not clauses:
+        raise MetadataFilterError(f"Пустое условие для поля {key}")
+    return "(" + " AND ".join(clauses) + ")", params
+
+
+def _contains(key: str, value: Any, column: str) -> Tuple[str, List[Any]]:
+    if value is not None and not isinstance(value, _SCALAR_TYPES):
+        raise MetadataFilterError(f"Недопустимое значение для поля {key}")
+    return f"{column} @> %s::jsonb", [json.dumps({key: value})]
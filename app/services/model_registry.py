@@ -0,0 +1,67 @@
+import threading
+from typing import Dict, Optional
+
+from langchain.embeddings.base import Embeddings
+
+from app.config import settings
+from app.services.embedding_server import EmbeddingServerClient
+from app.services.embeddings import (
+    DeterministicFakeEmbeddings,
+    create_huggingface_embeddings,
+)
+
+_models: Dict[str, Embeddings] = {}
+_lock = threading.Lock()
+
+
+def create_embedding_model(model_name: str) -> Embeddings:
+    """
+    Создает модель эмбеддингов типа EMBEDDING_MODEL_TYPE.
+
+    Args:
+        model_name: Имя модели HuggingFace
+
+    Returns:
+        Модель эмбеддингов
+    """
+    if settings.EMBEDDING_MODEL_TYPE == "sentence_transformers":
+        return create_huggingface_embeddings(model_name)
+    elif settings.EMBEDDING_MODEL_TYPE == "embedding_server":
+        if model_name != settings.EMBEDDING_MODEL_NAME:
+            raise ValueError(
+                f"Сервер эмбеддингов обслуживает только модель "
+                f"{settings.EMBEDDING_MODEL_NAME}, модель {model_name} недоступна"
+            )
+        return EmbeddingServerClient(
+            socket_path=settings.EMBEDDING_SERVER_SOCKET,
+            timeout=settings.EMBEDDING_SERVER_TIMEOUT,
+        )
+    elif settings.EMBEDDING_MODEL_TYPE == "fake":
+        return DeterministicFakeEmbeddings(
+            latency_ms=settings.FAKE_EMBEDDING_LATENCY_MS
+        )
+    else:
+        raise ValueError(
+            f"Unsupported embedding model type: {settings.EMBEDDING_MODEL_TYPE}"
+        )
+
+
+def get_embedding_model(model_name: Optional[str] = None) -> Embeddings:
+    """
+    Возвращает модель эмбеддингов, загружая ее при первом обращении.
+
+    Во время перехода на новую модель хранилища, которые еще не пересчитаны,
+    обслуживаются прежней моделью, поэтому в процессе может быть загружено
+    несколько моделей.
+
+    Args:
+        model_name: Имя модели, по умолчанию EMBEDDING_MODEL_NAME
+
+    Returns:
+        Модель эмбеддингов
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    with _lock:
+        if model_name not in _models:
+            _models[model_name] = create_embedding_model(model_name)
+        return _models[model_name]
@@ -0,0 +1,287 @@
+"""
+Прогрев кеша PostgreSQL для часто используемых хранилищ.
+
+После перезапуска PostgreSQL или переключения на реплику страницы ANN-индекса
+и документов отсутствуют в shared buffers, и первые запросы к каждому
+хранилищу читают их с диска. Прогрев выбирает до PREWARM_MAX_VECTORSTORES
+хранилищ по количеству RAG-запросов (query_count) или по времени последнего
+обращения и заранее читает их страницы в пределах бюджета PREWARM_BUDGET_MB.
+У каждого сервера свой кеш, поэтому прогреваются основной сервер и каждая
+реплика из DB_REPLICA_URLS, каждый со своим бюджетом.
+
+ANN-индексы таблицы documents загружаются целиком через pg_prewarm, если
+расширение установлено и индекс укладывается в бюджет. Для каждого хранилища
+читаются его строки вместе с TOAST (содержимое и эмбеддинги) и выполняется
+поиск по центроиду хранилища, который проходит по нужной части ANN-индекса,
+даже если pg_prewarm недоступен. Размер хранилища оценивается заранее
+(document_count на средний размер строки documents), и хранилища, которые
+не помещаются в остаток бюджета, пропускаются.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.access_tracker import access_tracker
+from app.services.db import pooled_connection
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки: прогрев выполняет один процесс из всех воркеров.
+PREWARM_LOCK_KEY = 0x70726577
+
+STRATEGY_ORDER = {
+    "frequent": "query_count DESC, last_accessed_at DESC NULLS LAST",
+    "recent": "last_accessed_at DESC NULLS LAST, query_count DESC",
+}
+
+
+def prewarm(
+    budget_mb: Optional[float] = None,
+    limit: Optional[int] = None,
+    strategy: Optional[str] = None,
+    connection_config: Optional[Dict[str, Any]] = None,
+    target: str = "основной сервер",
+) -> Optional[Dict[str, Any]]:
+    """
+    Загружает в кеш одного сервера PostgreSQL индексы и документы популярных
+    хранилищ.
+
+    Args:
+        budget_mb: Сколько мегабайт прочитать, по умолчанию PREWARM_BUDGET_MB
+        limit: Максимальное количество хранилищ, по умолчанию
+            PREWARM_MAX_VECTORSTORES
+        strategy: "frequent" — по количеству запросов, "recent" — по времени
+            последнего обращения; по умолчанию PREWARM_STRATEGY
+        connection_config: Конфигурация подключения к PostgreSQL
+        target: Название сервера для логов
+
+    Returns:
+        Итоги прогрева (прогретые и пропущенные хранилища, индексы,
+        прочитанные байты, время) или None, если прогрев этого сервера уже
+        выполняет другой процесс
+    """
+    budget = settings.PREWARM_BUDGET_MB if budget_mb is None else budget_mb
+    budget_bytes = int(budget * 1024 * 1024)
+    limit = settings.PREWARM_MAX_VECTORSTORES if limit is None else limit
+    strategy = strategy or settings.PREWARM_STRATEGY
+    if strategy not in STRATEGY_ORDER:
+        raise ValueError(
+            f"Неизвестная стратегия прогрева '{strategy}', "
+            f"допустимы: {', '.join(STRATEGY_ORDER)}"
+        )
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    started = time.perf_counter()
+
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (PREWARM_LOCK_KEY,))
+            locked = cur.fetchone()[0]
+        conn.commit()
+        if not locked:
+            logger.info(f"Прогрев ({target}) уже выполняется другим процессом")
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT vectorstore_id, embedding_sum, document_count
+                    FROM vectorstores
+                    WHERE storage_tier = 'hot' AND deleted_at IS NULL
+                        AND document_count > 0
+                    ORDER BY {STRATEGY_ORDER[strategy]}
+                    LIMIT %s
+                    """,
+                    (limit,),
+                )
+                candidates = cur.fetchall()
+                row_size = _average_row_size(cur)
+                indexes = _prewarm_ann_indexes(cur, budget_bytes)
+            conn.commit()
+
+            spent = sum(size for _, size in indexes)
+            warmed: List[int] = []
+            skipped: List[int] = []
+            metrics.set_gauge("prewarm_vectorstores_total", len(candidates))
+            for vectorstore_id, centroid, document_count in candidates:
+                if spent >= budget_bytes:
+                    logger.info(
+                        f"Прогрев ({target}) остановлен: израсходован бюджет "
+                        f"{budget} МБ"
+                    )
+                    break
+                estimate = int(document_count * row_size)
+                if spent + estimate > budget_bytes:
+                    skipped.append(vectorstore_id)
+                    logger.info(
+                        f"Прогрев ({target}): хранилище {vectorstore_id} "
+                        f"(~{estimate / 1024 / 1024:.1f} МБ) не помещается "
+                        "в остаток бюджета"
+                    )
+                    continue
+                with conn.cursor() as cur:
+                    spent += _prewarm_vectorstore(cur, vectorstore_id, centroid)
+                conn.commit()
+                warmed.append(vectorstore_id)
+                metrics.set_gauge("prewarm_vectorstores_done", len(warmed))
+                metrics.set_gauge("prewarm_bytes", spent)
+                logger.info(
+                    f"Прогрев ({target}): хранилище {vectorstore_id} "
+                    f"({len(warmed)}/{len(candidates)}), "
+                    f"прочитано {spent / 1024 / 1024:.1f} из {budget} МБ"
+                )
+        finally:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (PREWARM_LOCK_KEY,))
+            conn.commit()
+
+    elapsed = time.perf_counter() - started
+    metrics.increment("prewarm_runs_total")
+    metrics.increment("prewarm_seconds_total", elapsed)
+    logger.info(
+        f"Прогрев ({target}) завершен за {elapsed:.1f} с: хранилищ {len(warmed)}, "
+        f"пропущено {len(skipped)}, индексов {len(indexes)}, "
+        f"прочитано {spent / 1024 / 1024:.1f} МБ"
+    )
+    return {
+        "target": target,
+        "vectorstore_ids": warmed,
+        "skipped_vectorstore_ids": skipped,
+        "indexes": [name for name, _ in indexes],
+        "bytes": spent,
+        "seconds": elapsed,
+    }
+
+
+def prewarm_all(
+    budget_mb: Optional[float] = None,
+    limit: Optional[int] = None,
+    strategy: Optional[str] = None,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Прогревает основной сервер и каждую реплику для чтения.
+
+    Ошибка прогрева одного сервера (например, недоступная реплика)
+    логируется и не мешает прогреву остальных.
+
+    Args:
+        budget_mb: Бюджет каждого сервера в мегабайтах
+        limit: Максимальное количество хранилищ
+        strategy: Стратегия выбора хранилищ
+
+    Returns:
+        Итоги prewarm по серверам; None для сервера, который прогревает
+        другой процесс или который не удалось прогреть
+    """
+    targets = [("основной сервер", settings.DATABASE_CONNECTION_CONFIG)] + [
+        (f"реплика {index}", config)
+        for index, config in enumerate(settings.DB_REPLICA_CONNECTION_CONFIGS)
+    ]
+    results = []
+    for target, connection_config in targets:
+        try:
+            results.append(
+                prewarm(budget_mb, limit, strategy, connection_config, target)
+            )
+        except Exception:
+            logger.exception(f"Не удалось выполнить прогрев ({target})")
+            results.append(None)
+    return results
+
+
+async def run_prewarm_schedule(interval: Optional[float] = None) -> None:
+    """
+    Фоновая задача приложения: прогрев после запуска и затем каждые
+    interval секунд.
+
+    Перед каждым прогревом записываются накопленные обращения к хранилищам,
+    чтобы выбор учитывал последние запросы. Ошибки только логируются.
+
+    Args:
+        interval: Период прогрева, по умолчанию PREWARM_INTERVAL;
+            0 — только при запуске
+    """
+    interval = settings.PREWARM_INTERVAL if interval is None else interval
+    while True:
+        try:
+            await asyncio.to_thread(access_tracker.flush)
+            await asyncio.to_thread(prewarm_all)
+        except Exception:
+            logger.exception("Не удалось выполнить прогрев хранилищ")
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+
+
+def _prewarm_ann_indexes(cur, budget_bytes: int) -> List[Tuple[str, int]]:
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'")
+    if cur.fetchone() is None:
+        return []
+    cur.execute(
+        """
+        SELECT c.oid::regclass::text, pg_relation_size(c.oid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am a ON a.oid = c.relam
+        WHERE i.indrelid = 'documents'::regclass
+            AND a.amname IN ('hnsw', 'ivfflat')
+        ORDER BY c.oid
+        """
+    )
+    warmed, spent = [], 0
+    for name, size in cur.fetchall():
+        if spent + size > budget_bytes:
+            logger.info(
+                f"Индекс {name} ({size / 1024 / 1024:.1f} МБ) не помещается "
+                "в бюджет прогрева, прогревается по хранилищам"
+            )
+            continue
+        cur.execute("SELECT pg_prewarm(%s::regclass)", (name,))
+        warmed.append((name, size))
+        spent += size
+        logger.info(f"Прогрев: индекс {name} загружен ({size / 1024 / 1024:.1f} МБ)")
+    return warmed
+
+
+def _average_row_size(cur) -> float:
+    # Размер таблицы с TOAST на один документ. Количество документов берется
+    # из сводок хранилищ: reltuples до первого ANALYZE не заполнен.
+    cur.execute(
+        """
+        SELECT pg_table_size('documents'),
+            (SELECT coalesce(sum(document_count), 0) FROM vectorstores)
+        """
+    )
+    size, count = cur.fetchone()
+    return size / count if count else 0.0
+
+
+def _prewarm_vectorstore(cur, vectorstore_id: int, centroid) -> int:
+    # Сборка строки целиком читает и значения из TOAST.
+    cur.execute(
+        """
+        SELECT coalesce(sum(pg_column_size(d.*)), 0)
+        FROM documents d WHERE d.vectorstore_id = %s
+        """,
+        (vectorstore_id,),
+    )
+    size = int(cur.fetchone()[0])
+    if centroid is not None:
+        # Косинусное расстояние не зависит от длины вектора, поэтому сумма
+        # эмбеддингов хранилища годится как центроид.
+        cur.execute(
+            """
+            SELECT count(*) FROM (
+                SELECT doc_id FROM documents
+                WHERE vectorstore_id = %s
+                ORDER BY embedding <=> %s::vector
+                LIMIT %s
+            ) nearest
+            """,
+            (vectorstore_id, centroid, settings.PREWARM_SEARCH_K),
+        )
+        cur.fetchone()
+    return size
@@ -0,0 +1,244 @@
+"""
+Статистический профилировщик отдельных запросов.
+
+Для профилируемого запроса запускается поток, который каждые
+PROFILER_INTERVAL_MS миллисекунд снимает стеки потоков через
+sys._current_frames. Поток цикла событий, обрабатывающий запрос, учитывается
+всегда, остальные потоки (пул run_in_threadpool, где выполняются эмбеддинг
+и поиск) — только когда они не простаивают. Одновременные запросы других
+клиентов в тех же потоках тоже попадают в профиль.
+
+Профиль сохраняется в PROFILER_DIR в формате folded stacks
+("кадр;кадр;кадр количество"), который читают flamegraph.pl, speedscope
+и inferno.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Верхние кадры простаивающих потоков: ожидание блокировки, очереди или сокета
+IDLE_MODULES = {"threading.py", "queue.py", "selectors.py"}
+
+PROFILE_NAME_PATTERN = re.compile(
+    r"^(?P<created_ms>\d+)-(?P<method>[A-Z]+)-(?P<path>[\w.-]*)-"
+    r"(?P<duration_ms>\d+)ms\.folded$"
+)
+
+
+class StackSampler:
+    """Поток, собирающий стеки процесса, пока обрабатывается запрос."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        """Останавливает сбор и возвращает количество попаданий по стекам."""
+        self._stopped.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id != self.thread_id and _is_idle(frame):
+                    continue
+                thread_name = names.get(thread_id, str(thread_id))
+                self.samples[_fold(thread_name, frame)] += 1
+
+
+class RequestProfiler:
+    """
+    Решает, какие запросы профилировать, и хранит последние профили.
+
+    Профилируется доля sample_rate запросов и запросы с заголовком
+    X-Debug-Profile. Профиль случайно выбранного запроса сохраняется, только
+    если запрос выполнялся не меньше slow_ms миллисекунд; профиль,
+    запрошенный заголовком, сохраняется всегда. В каталоге хранится не более
+    max_files последних профилей.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: float,
+        interval_ms: float,
+        slow_ms: float,
+        max_files: int,
+        max_concurrent: int,
+    ):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.slow_ms = slow_ms
+        self.max_files = max_files
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> Optional[StackSampler]:
+        """
+        Запускает сбор стеков для запроса в текущем потоке.
+
+        Returns:
+            Запущенный сборщик или None, если уже профилируется max_concurrent
+            запросов
+        """
+        with self._lock:
+            if self.active >= self.max_concurrent:
+                metrics.increment("profiler_skipped_total")
+                return None
+            self.active += 1
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        return sampler
+
+    def finish(
+        self,
+        sampler: StackSampler,
+        method: str,
+        path: str,
+        duration_ms: float,
+        forced: bool,
+    ) -> Optional[str]:
+        """
+        Останавливает сбор стеков и сохраняет профиль медленного запроса.
+
+        Args:
+            sampler: Сборщик, возвращенный start
+            method: HTTP-метод запроса
+            path: Путь запроса
+            duration_ms: Время обработки запроса в миллисекундах
+            forced: Профиль запрошен заголовком и сохраняется всегда
+
+        Returns:
+            Имя файла профиля или None, если профиль не сохранен
+        """
+        try:
+            samples = sampler.stop()
+        finally:
+            with self._lock:
+                self.active -= 1
+        metrics.increment("profiler_requests_total")
+        if not samples or (not forced and duration_ms < self.slow_ms):
+            return None
+
+        slug = re.sub(r"[^\w.-]+", "_", path.strip("/"))[:80]
+        name = f"{int(time.time() * 1000)}-{method}-{slug}-{int(duration_ms)}ms.folded"
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self._rotate()
+        metrics.increment("profiler_saved_total")
+        logger.info(
+            f"Сохранен профиль запроса {method} {path} ({duration_ms:.0f} мс): {name}"
+        )
+        return name
+
+    def list_profiles(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Возвращает последние сохраненные профили, начиная с самого нового.
+
+        Args:
+            limit: Максимальное количество профилей
+
+        Returns:
+            Список с именем файла, методом, временем создания и длительностью
+        """
+        profiles = []
+        for name in self._profile_names()[:limit]:
+            match = PROFILE_NAME_PATTERN.match(name)
+            profiles.append(
+                {
+                    "name": name,
+                    "method": match["method"],
+                    "created_at": int(match["created_ms"]) / 1000,
+                    "duration_ms": int(match["duration_ms"]),
+                }
+            )
+        return profiles
+
+    def read_profile(self, name: str) -> Optional[str]:
+        """
+        Читает профиль в формате folded stacks.
+
+        Args:
+            name: Имя файла профиля
+
+        Returns:
+            Содержимое файла или None, если профиля нет
+        """
+        if not PROFILE_NAME_PATTERN.match(name):
+            return None
+        try:
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _profile_names(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # Имя начинается с времени создания в миллисекундах.
+        return sorted(
+            (name for name in names if PROFILE_NAME_PATTERN.match(name)),
+            key=lambda name: int(name.split("-", 1)[0]),
+            reverse=True,
+        )
+
+    def _rotate(self) -> None:
+        for name in islice(self._profile_names(), self.max_files, None):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def _is_idle(frame) -> bool:
+    return os.path.basename(frame.f_code.co_filename) in IDLE_MODULES
+
+
+def _fold(thread_name: str, frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+request_profiler = RequestProfiler(
+    settings.PROFILER_DIR,
+    sample_rate=settings.PROFILER_SAMPLE_RATE,
+    interval_ms=settings.PROFILER_INTERVAL_MS,
+    slow_ms=settings.PROFILER_SLOW_MS,
+    max_files=settings.PROFILER_MAX_FILES,
+    max_concurrent=settings.PROFILER_MAX_CONCURRENT,
+)
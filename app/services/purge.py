@@ -0,0 +1,267 @@
+"""
+Фоновая очистка удаленных хранилищ и пользователей.
+
+Удаление через API только помечает строку (deleted_at), после чего хранилище
+сразу скрыто от поиска и списков. Документы удаляются порциями по
+PURGE_BATCH_SIZE строк в отдельных коротких транзакциях, чтобы не держать
+долгих блокировок и не раздувать WAL одной транзакцией. После крупных
+удалений выполняется VACUUM (ANALYZE) documents, который возвращает место
+в таблице и убирает удаленные строки из ANN-индекса.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+
+from app.config import settings
+from app.services.db import pooled_connection
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_vacuum_lock = threading.Lock()
+
+
+def purge_vectorstore(
+    vectorstore_id: int,
+    batch_size: Optional[int] = None,
+    throttle_ms: Optional[float] = None,
+    connection_config: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Удаляет документы и строку удаленного хранилища.
+
+    Args:
+        vectorstore_id: ID хранилища с заполненным deleted_at
+        batch_size: Документов за транзакцию, по умолчанию PURGE_BATCH_SIZE
+        throttle_ms: Пауза между порциями, по умолчанию PURGE_THROTTLE_MS
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        Количество удаленных документов
+    """
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    throttle_ms = settings.PURGE_THROTTLE_MS if throttle_ms is None else throttle_ms
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    started = time.perf_counter()
+    removed = 0
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM vectorstores "
+                "WHERE vectorstore_id = %s AND deleted_at IS NOT NULL",
+                (vectorstore_id,),
+            )
+            tombstoned = cur.fetchone() is not None
+        conn.commit()
+        if not tombstoned:
+            logger.warning(f"Хранилище {vectorstore_id} не помечено как удаленное")
+            return 0
+
+        while True:
+            with conn.cursor() as cur:
+                deleted = _delete_batch(cur, vectorstore_id, batch_size)
+            conn.commit()
+            removed += deleted
+            if deleted < batch_size:
+                break
+            if throttle_ms > 0:
+                time.sleep(throttle_ms / 1000)
+
+        with conn.cursor() as cur:
+            # Загрузка, начатая до удаления, могла добавить документы;
+            # блокировка дожидается ее окончания.
+            cur.execute(
+                "SELECT 1 FROM vectorstores WHERE vectorstore_id = %s FOR UPDATE",
+                (vectorstore_id,),
+            )
+            while True:
+                deleted = _delete_batch(cur, vectorstore_id, batch_size)
+                removed += deleted
+                if deleted < batch_size:
+                    break
+            cur.execute(
+                "DELETE FROM vectorstores WHERE vectorstore_id = %s",
+                (vectorstore_id,),
+            )
+        conn.commit()
+
+    metrics.increment("purge_vectorstores_total")
+    metrics.increment("purge_documents_total", removed)
+    logger.info(
+        f"Хранилище {vectorstore_id} удалено: документов {removed} "
+        f"за {time.perf_counter() - started:.1f} с"
+    )
+    return removed
+
+
+def purge_user(user_id: int, connection_config: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Удаляет хранилища удаленного пользователя, а затем его строку.
+
+    Args:
+        user_id: ID пользователя с заполненным deleted_at
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        Количество удаленных документов
+    """
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT vectorstore_id FROM vectorstores
+                WHERE user_id = %s AND deleted_at IS NOT NULL
+                ORDER BY vectorstore_id
+                """,
+                (user_id,),
+            )
+            vectorstore_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+
+    removed = sum(
+        purge_vectorstore(vectorstore_id, connection_config=connection_config)
+        for vectorstore_id in vectorstore_ids
+    )
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM users u
+                WHERE u.user_id = %s AND u.deleted_at IS NOT NULL
+                    AND NOT EXISTS (
+                        SELECT 1 FROM vectorstores v WHERE v.user_id = u.user_id
+                    )
+                """,
+                (user_id,),
+            )
+        conn.commit()
+    return removed
+
+
+def purge_in_background(
+    vectorstore_ids: List[int],
+    user_id: Optional[int] = None,
+    connection_config: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Фоновая задача эндпоинтов удаления: очищает хранилища (и пользователя)
+    и при необходимости запускает VACUUM.
+
+    Ошибки только логируются: помеченные строки остаются скрытыми,
+    а их очистку завершит `python -m app.cli purge`.
+    """
+    try:
+        removed = 0
+        for vectorstore_id in vectorstore_ids:
+            removed += purge_vectorstore(
+                vectorstore_id, connection_config=connection_config
+            )
+        if user_id is not None:
+            removed += purge_user(user_id, connection_config)
+        maybe_vacuum(removed, connection_config)
+    except Exception:
+        logger.exception(
+            f"Фоновая очистка хранилищ {vectorstore_ids} прервана, "
+            "остаток удалит python -m app.cli purge"
+        )
+
+
+def purge_deleted(
+    vacuum: bool = True, connection_config: Optional[Dict[str, Any]] = None
+) -> int:
+    """
+    Дочищает все удаленные хранилища и пользователей, например после
+    перезапуска, прервавшего фоновую очистку.
+
+    Args:
+        vacuum: Выполнить VACUUM (ANALYZE) documents, если удалено не меньше
+            PURGE_VACUUM_THRESHOLD документов
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        Количество удаленных документов
+    """
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT vectorstore_id FROM vectorstores
+                WHERE deleted_at IS NOT NULL ORDER BY vectorstore_id
+                """
+            )
+            vectorstore_ids = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT user_id FROM users WHERE deleted_at IS NOT NULL")
+            user_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+
+    removed = 0
+    for vectorstore_id in vectorstore_ids:
+        removed += purge_vectorstore(
+            vectorstore_id, connection_config=connection_config
+        )
+    for user_id in user_ids:
+        removed += purge_user(user_id, connection_config)
+    if vacuum:
+        maybe_vacuum(removed, connection_config)
+    return removed
+
+
+def maybe_vacuum(
+    removed: int, connection_config: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Запускает VACUUM (ANALYZE) documents после крупного удаления.
+
+    Autovacuum дошел бы до таблицы сам, но не сразу; до этого удаленные
+    строки занимают место, а ANN-индекс продолжает обходить их при поиске.
+
+    Args:
+        removed: Количество удаленных документов
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        True, если VACUUM выполнен
+    """
+    if removed < settings.PURGE_VACUUM_THRESHOLD:
+        return False
+    # Параллельные VACUUM одной таблицы ждут друг друга; достаточно одного.
+    if not _vacuum_lock.acquire(blocking=False):
+        return False
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    started = time.perf_counter()
+    try:
+        # VACUUM нельзя выполнить в транзакции, поэтому используется отдельное
+        # соединение в режиме autocommit, а не соединение из пула.
+        conn = psycopg2.connect(**connection_config)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("VACUUM (ANALYZE) documents")
+        finally:
+            conn.close()
+    finally:
+        _vacuum_lock.release()
+    metrics.increment("purge_vacuums_total")
+    logger.info(
+        f"VACUUM (ANALYZE) documents после удаления {removed} документов "
+        f"за {time.perf_counter() - started:.1f} с"
+    )
+    return True
+
+
+def _delete_batch(cur, vectorstore_id: int, batch_size: int) -> int:
+    cur.execute(
+        """
+        DELETE FROM documents
+        WHERE doc_id IN (
+            SELECT doc_id FROM documents WHERE vectorstore_id = %s LIMIT %s
+        )
+        """,
+        (vectorstore_id, batch_size),
+    )
+    return cur.rowcount
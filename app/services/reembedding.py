@@ -0,0 +1,405 @@
+"""
+Пересчет эмбеддингов хранилищ новой моделью без остановки поиска.
+
+Новые эмбеддинги пишутся батчами в теневую таблицу document_embeddings_shadow,
+а поиск тем временем продолжает работать по старым. Прогресс каждого хранилища
+хранится в reembedding_jobs, поэтому прерванный пересчет продолжается с места
+остановки. Когда все документы хранилища пересчитаны, эмбеддинги переносятся
+в documents одной транзакцией и vectorstores.embedding_model переключается
+на новую модель: с этого момента запросы к хранилищу кодируются ею.
+"""
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from psycopg2.extras import execute_values
+
+from app.config import settings
+from app.models.models import Document
+from app.services.db import pooled_connection
+from app.services.embeddings import embed_documents_bucketed
+from app.services.metrics import metrics
+from app.services.model_registry import get_embedding_model
+from app.services.summaries import refresh_summaries
+from app.services.tiering import rehydrate_vectorstore
+
+logger = logging.getLogger(__name__)
+
+
+class ReembeddingError(Exception):
+    """Пересчет эмбеддингов невозможен с текущими параметрами."""
+
+
+def load_model(model_name: str) -> Embeddings:
+    """
+    Загружает новую модель и проверяет размерность ее эмбеддингов.
+
+    Столбец embedding имеет фиксированную размерность, поэтому модель
+    с другой размерностью требует миграции схемы, а не пересчета.
+    """
+    try:
+        model = get_embedding_model(model_name)
+    except ValueError as e:
+        raise ReembeddingError(str(e))
+    dimension = len(model.embed_query("проверка размерности"))
+    if dimension != Document.embedding.type.dim:
+        raise ReembeddingError(
+            f"Модель {model_name} возвращает эмбеддинги размерности {dimension}, "
+            f"а в базе используется {Document.embedding.type.dim}"
+        )
+    return model
+
+
+def reembed_vectorstore(
+    vectorstore_id: int,
+    model_name: str,
+    model: Optional[Embeddings] = None,
+    batch_size: Optional[int] = None,
+    throttle_ms: Optional[float] = None,
+    connection_config: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Пересчитывает эмбеддинги хранилища и переключает его на новую модель.
+
+    Документы, добавленные во время пересчета, досчитываются при
+    переключении под блокировкой строки хранилища; загрузки в хранилище
+    ждут окончания переключения, поиск не блокируется.
+
+    Args:
+        vectorstore_id: ID хранилища
+        model_name: Имя новой модели
+        model: Загруженная модель, по умолчанию load_model(model_name)
+        batch_size: Документов в батче, по умолчанию REEMBED_BATCH_SIZE
+        throttle_ms: Пауза между батчами, по умолчанию REEMBED_THROTTLE_MS
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        Состояние задачи пересчета
+    """
+    model = model or load_model(model_name)
+    batch_size = batch_size or settings.REEMBED_BATCH_SIZE
+    throttle_ms = settings.REEMBED_THROTTLE_MS if throttle_ms is None else throttle_ms
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+
+    # Документы архивного хранилища пересчитываются после восстановления.
+    rehydrate_vectorstore(vectorstore_id, connection_config)
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            current_model = _start_job(cur, vectorstore_id, model_name)
+        conn.commit()
+        if current_model == model_name:
+            logger.info(f"Хранилище {vectorstore_id} уже использует {model_name}")
+            return _finish_job(conn, vectorstore_id)
+
+        try:
+            while True:
+                with conn.cursor() as cur:
+                    written = _reembed_batch(
+                        cur, vectorstore_id, model_name, model, batch_size
+                    )
+                    if not written:
+                        break
+                    cur.execute(
+                        """
+                        UPDATE reembedding_jobs j
+                        SET documents_done = documents_done + %s,
+                            documents_total = v.document_count,
+                            updated_at = now()
+                        FROM vectorstores v
+                        WHERE j.vectorstore_id = %s
+                            AND v.vectorstore_id = j.vectorstore_id
+                        RETURNING j.documents_done, j.documents_total
+                        """,
+                        (written, vectorstore_id),
+                    )
+                    done, total = cur.fetchone()
+                conn.commit()
+                metrics.increment("reembedding_documents_total", written)
+                logger.info(
+                    f"Хранилище {vectorstore_id}: пересчитано {done} из {total}"
+                )
+                if throttle_ms > 0:
+                    time.sleep(throttle_ms / 1000)
+
+            return _cutover(conn, vectorstore_id, model_name, model, batch_size)
+        except Exception as e:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE reembedding_jobs
+                    SET status = 'failed', error = %s, updated_at = now()
+                    WHERE vectorstore_id = %s
+                    """,
+                    (str(e), vectorstore_id),
+                )
+            conn.commit()
+            raise
+
+
+def reembed_all(
+    model_name: str,
+    batch_size: Optional[int] = None,
+    throttle_ms: Optional[float] = None,
+    connection_config: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Переводит на новую модель все хранилища, которые еще ее не используют.
+
+    Хранилища обрабатываются по одному; ошибка в одном хранилище
+    записывается в его задачу и не останавливает остальные. Выборка
+    повторяется, пока в ней остаются необработанные хранилища, поэтому
+    хранилища, созданные прежней моделью во время пересчета, тоже
+    переводятся. Хранилища с ошибкой повторно не выбираются и перечисляются
+    в логе в конце.
+
+    Returns:
+        Состояния задач пересчета
+    """
+    model = load_model(model_name)
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    jobs: List[Dict[str, Any]] = []
+    attempted: List[int] = []
+    failed: List[int] = []
+    while True:
+        vectorstore_ids = _select_for_reembedding(
+            model_name, attempted, connection_config
+        )
+        if not vectorstore_ids:
+            break
+        logger.info(f"Хранилищ для перехода на {model_name}: {len(vectorstore_ids)}")
+        for vectorstore_id in vectorstore_ids:
+            attempted.append(vectorstore_id)
+            try:
+                jobs.append(
+                    reembed_vectorstore(
+                        vectorstore_id,
+                        model_name,
+                        model,
+                        batch_size,
+                        throttle_ms,
+                        connection_config,
+                    )
+                )
+            except Exception:
+                failed.append(vectorstore_id)
+                logger.exception(f"Не удалось пересчитать хранилище {vectorstore_id}")
+
+    if failed:
+        logger.warning(
+            f"Не переведены на {model_name} хранилища {failed}, "
+            "подробности в python -m app.cli reembed-status"
+        )
+    return jobs
+
+
+def reembedding_status(
+    connection_config: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Возвращает состояние задач пересчета по всем хранилищам."""
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT j.vectorstore_id, v.embedding_model, j.target_model,
+                    j.status, j.documents_done, j.documents_total, j.error,
+                    j.started_at, j.updated_at, j.completed_at
+                FROM reembedding_jobs j
+                JOIN vectorstores v ON v.vectorstore_id = j.vectorstore_id
+                ORDER BY j.vectorstore_id
+                """
+            )
+            rows = cur.fetchall()
+        conn.commit()
+    return [_job_row(row) for row in rows]
+
+
+def _select_for_reembedding(
+    model_name: str, exclude: List[int], connection_config: Dict[str, Any]
+) -> List[int]:
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT vectorstore_id FROM vectorstores
+                WHERE coalesce(embedding_model, %s) <> %s AND deleted_at IS NULL
+                    AND vectorstore_id <> ALL(%s)
+                ORDER BY vectorstore_id
+                """,
+                (settings.EMBEDDING_MODEL_NAME, model_name, exclude),
+            )
+            vectorstore_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    return vectorstore_ids
+
+
+def _start_job(cur, vectorstore_id: int, model_name: str) -> str:
+    cur.execute(
+        "SELECT coalesce(embedding_model, %s) FROM vectorstores "
+        "WHERE vectorstore_id = %s",
+        (settings.EMBEDDING_MODEL_NAME, vectorstore_id),
+    )
+    row = cur.fetchone()
+    if row is None:
+        raise ReembeddingError(f"Хранилище {vectorstore_id} не найдено")
+
+    # Эмбеддинги, оставшиеся от прерванного перехода на другую модель.
+    cur.execute(
+        """
+        DELETE FROM document_embeddings_shadow
+        WHERE vectorstore_id = %s AND embedding_model <> %s
+        """,
+        (vectorstore_id, model_name),
+    )
+    cur.execute(
+        """
+        INSERT INTO reembedding_jobs
+            (vectorstore_id, target_model, status, documents_total, documents_done)
+        SELECT v.vectorstore_id, %s, 'running', v.document_count,
+            (SELECT count(*) FROM document_embeddings_shadow s
+             WHERE s.vectorstore_id = v.vectorstore_id)
+        FROM vectorstores v
+        WHERE v.vectorstore_id = %s
+        ON CONFLICT (vectorstore_id) DO UPDATE SET
+            started_at = CASE
+                WHEN reembedding_jobs.target_model = EXCLUDED.target_model
+                    AND reembedding_jobs.status <> 'complete'
+                THEN reembedding_jobs.started_at
+                ELSE now()
+            END,
+            target_model = EXCLUDED.target_model,
+            status = 'running',
+            documents_total = EXCLUDED.documents_total,
+            documents_done = EXCLUDED.documents_done,
+            error = NULL,
+            updated_at = now(),
+            completed_at = NULL
+        """,
+        (model_name, vectorstore_id),
+    )
+    return row[0]
+
+
+def _next_batch(cur, vectorstore_id: int, batch_size: int) -> List[Tuple[int, str]]:
+    cur.execute(
+        """
+        SELECT d.doc_id, d.content
+        FROM documents d
+        WHERE d.vectorstore_id = %s
+            AND NOT EXISTS (
+                SELECT 1 FROM document_embeddings_shadow s WHERE s.doc_id = d.doc_id
+            )
+        ORDER BY d.doc_id
+        LIMIT %s
+        """,
+        (vectorstore_id, batch_size),
+    )
+    return cur.fetchall()
+
+
+def _reembed_batch(
+    cur, vectorstore_id: int, model_name: str, model: Embeddings, batch_size: int
+) -> int:
+    batch = _next_batch(cur, vectorstore_id, batch_size)
+    if not batch:
+        return 0
+
+    embeddings = embed_documents_bucketed(model, [content for _, content in batch])
+    data = [
+        (doc_id, vectorstore_id, model_name, np.asarray(embedding, dtype=np.float32))
+        for (doc_id, _), embedding in zip(batch, embeddings)
+    ]
+    # Документы, удаленные во время вычисления эмбеддингов, пропускаются.
+    execute_values(
+        cur,
+        """
+        INSERT INTO document_embeddings_shadow
+            (doc_id, vectorstore_id, embedding_model, embedding)
+        SELECT v.doc_id, v.vectorstore_id, v.embedding_model, v.embedding
+        FROM (VALUES %s) AS v (doc_id, vectorstore_id, embedding_model, embedding)
+        JOIN documents d ON d.doc_id = v.doc_id
+        ON CONFLICT (doc_id) DO NOTHING
+        """,
+        data,
+        template="(%s, %s, %s, %s::vector)",
+    )
+    return len(batch)
+
+
+def _cutover(
+    conn, vectorstore_id: int, model_name: str, model: Embeddings, batch_size: int
+) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT 1 FROM vectorstores WHERE vectorstore_id = %s FOR UPDATE",
+            (vectorstore_id,),
+        )
+        # Документы, загруженные после последнего батча.
+        while _reembed_batch(cur, vectorstore_id, model_name, model, batch_size):
+            pass
+
+        cur.execute(
+            """
+            UPDATE documents d
+            SET embedding = s.embedding
+            FROM document_embeddings_shadow s
+            WHERE s.doc_id = d.doc_id AND s.vectorstore_id = %s
+            """,
+            (vectorstore_id,),
+        )
+        swapped = cur.rowcount
+        cur.execute(
+            "UPDATE vectorstores SET embedding_model = %s WHERE vectorstore_id = %s",
+            (model_name, vectorstore_id),
+        )
+        refresh_summaries(cur, [vectorstore_id])
+        cur.execute(
+            "DELETE FROM document_embeddings_shadow WHERE vectorstore_id = %s",
+            (vectorstore_id,),
+        )
+    conn.commit()
+    metrics.increment("reembedding_cutovers_total")
+    logger.info(
+        f"Хранилище {vectorstore_id} переключено на {model_name}, "
+        f"документов {swapped}"
+    )
+    return _finish_job(conn, vectorstore_id)
+
+
+def _finish_job(conn, vectorstore_id: int) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE reembedding_jobs j
+            SET status = 'complete', documents_done = v.document_count,
+                documents_total = v.document_count, updated_at = now(),
+                completed_at = now()
+            FROM vectorstores v
+            WHERE j.vectorstore_id = %s AND v.vectorstore_id = j.vectorstore_id
+            RETURNING j.vectorstore_id, v.embedding_model, j.target_model,
+                j.status, j.documents_done, j.documents_total, j.error,
+                j.started_at, j.updated_at, j.completed_at
+            """,
+            (vectorstore_id,),
+        )
+        row = cur.fetchone()
+    conn.commit()
+    return _job_row(row)
+
+
+def _job_row(row) -> Dict[str, Any]:
+    return {
+        "vectorstore_id": row[0],
+        "embedding_model": row[1],
+        "target_model": row[2],
+        "status": row[3],
+        "documents_done": row[4],
+        "documents_total": row[5],
+        "error": row[6],
+        "started_at": row[7],
+        "updated_at": row[8],
+        "completed_at": row[9],
+    }
@@ -0,0 +1,215 @@
+"""
+Политика отказоустойчивости обращений к внешним сервисам.
+
+Deadline задает общий срок выполнения запроса, который передается каждому
+этапу (ожидание в очереди, поиск, обращение к LLM-сервису), чтобы запрос
+не выполнялся дольше, чем клиент готов ждать. CircuitBreaker перестает
+обращаться к сервису после серии отказов и пропускает пробный запрос
+только по истечении reset_timeout, поэтому при деградации сервиса запросы
+сразу завершаются ошибкой, а не копятся в воркерах.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional, Tuple, Type, TypeVar
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_HALF_OPEN = "half_open"
+CIRCUIT_OPEN = "open"
+
+# Значения gauge-метрики circuit_<name>_state
+CIRCUIT_STATE_CODES = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1, CIRCUIT_OPEN: 2}
+
+
+class DeadlineExceeded(Exception):
+    """Срок выполнения запроса истек на этапе stage."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Срок выполнения запроса истек на этапе '{stage}'")
+        self.stage = stage
+
+
+class CircuitOpen(Exception):
+    """Сервис помечен недоступным, обращение к нему не выполняется."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"Сервис '{name}' временно недоступен")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """Срок выполнения запроса, отсчитываемый от момента создания."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Оставшееся время в секундах, не меньше нуля."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, limit: Optional[float] = None) -> float:
+        """
+        Таймаут этапа: оставшееся время, ограниченное собственным лимитом этапа.
+
+        Args:
+            limit: Собственный таймаут этапа
+
+        Returns:
+            Таймаут в секундах
+        """
+        remaining = self.remaining()
+        return remaining if limit is None else min(remaining, limit)
+
+    def check(self, stage: str) -> None:
+        """
+        Проверяет, что срок еще не истек.
+
+        Args:
+            stage: Название этапа для сообщения об ошибке и метрики
+
+        Raises:
+            DeadlineExceeded: Если срок истек
+        """
+        if self.remaining() <= 0:
+            metrics.increment(f"deadline_exceeded_{stage}_total")
+            raise DeadlineExceeded(stage)
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи для обращений к внешнему сервису.
+
+    После failure_threshold отказов подряд цепь размыкается, и обращения
+    отклоняются с CircuitOpen в течение reset_timeout секунд. Затем цепь
+    переходит в полуоткрытое состояние и пропускает один пробный запрос:
+    успех замыкает цепь, отказ снова размыкает ее. Состояние публикуется
+    в метрике circuit_<name>_state (0 — замкнута, 1 — полуоткрыта,
+    2 — разомкнута).
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._update_gauge()
+
+    def allow(self) -> None:
+        """
+        Проверяет, можно ли обратиться к сервису.
+
+        Raises:
+            CircuitOpen: Если цепь разомкнута или пробный запрос уже выполняется
+        """
+        with self._lock:
+            if self.state == CIRCUIT_OPEN:
+                elapsed = time.monotonic() - self._opened_at
+                if elapsed < self.reset_timeout:
+                    self._reject(self.reset_timeout - elapsed)
+                self._set_state(CIRCUIT_HALF_OPEN)
+            if self.state == CIRCUIT_HALF_OPEN:
+                now = time.monotonic()
+                # Пробный запрос, прерванный отменой, не вызвал record_*;
+                # через reset_timeout разрешается следующий.
+                if (
+                    self._probe_started_at is not None
+                    and now - self._probe_started_at < self.reset_timeout
+                ):
+                    self._reject(self.reset_timeout)
+                self._probe_started_at = now
+
+    def record_success(self) -> None:
+        """Отмечает успешное обращение."""
+        with self._lock:
+            self.failures = 0
+            self._probe_started_at = None
+            if self.state != CIRCUIT_CLOSED:
+                logger.info(f"Цепь '{self.name}' замкнута: сервис снова отвечает")
+                self._set_state(CIRCUIT_CLOSED)
+
+    def record_failure(self) -> None:
+        """Отмечает отказ сервиса."""
+        with self._lock:
+            self.failures += 1
+            self._probe_started_at = None
+            if self.state == CIRCUIT_HALF_OPEN or (
+                self.state == CIRCUIT_CLOSED and self.failures >= self.failure_threshold
+            ):
+                logger.warning(
+                    f"Цепь '{self.name}' разомкнута после {self.failures} "
+                    f"отказов подряд на {self.reset_timeout} с"
+                )
+                self._opened_at = time.monotonic()
+                self._set_state(CIRCUIT_OPEN)
+                metrics.increment(f"circuit_{self.name}_opened_total")
+
+    def _reject(self, retry_after: float) -> None:
+        metrics.increment(f"circuit_{self.name}_rejected_total")
+        raise CircuitOpen(self.name, max(1, int(retry_after + 0.5)))
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        self._update_gauge()
+
+    def _update_gauge(self) -> None:
+        metrics.set_gauge(f"circuit_{self.name}_state", CIRCUIT_STATE_CODES[self.state])
+
+
+async def retry_with_backoff(
+    fn: Callable[[], Awaitable[T]],
+    deadline: Deadline,
+    attempts: int,
+    base_delay: float,
+    max_delay: float,
+    retryable: Tuple[Type[BaseException], ...],
+    name: str,
+) -> T:
+    """
+    Выполняет fn с повторами при временных ошибках.
+
+    Пауза перед повтором выбирается случайно от нуля до
+    min(max_delay, base_delay * 2 ** номер_попытки) ("full jitter"), чтобы
+    повторы разных запросов не приходили в сервис одновременно. Повтор
+    не выполняется, если пауза не укладывается в оставшийся срок.
+
+    Args:
+        fn: Функция, возвращающая корутину с обращением к сервису
+        deadline: Срок выполнения запроса
+        attempts: Максимальное количество попыток, включая первую
+        base_delay: Базовая пауза перед повтором в секундах
+        max_delay: Максимальная пауза перед повтором в секундах
+        retryable: Исключения, после которых обращение можно повторить
+        name: Название сервиса для логов и метрик
+
+    Returns:
+        Результат fn
+    """
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except retryable as e:
+            attempt += 1
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            if attempt >= attempts or delay >= deadline.remaining():
+                raise
+            logger.warning(
+                f"Временная ошибка '{name}' (попытка {attempt} из {attempts}), "
+                f"повтор через {delay:.2f} с: {e}"
+            )
+            metrics.increment(f"retry_{name}_total")
+            await asyncio.sleep(delay)
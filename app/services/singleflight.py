@@ -0,0 +1,51 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from app.services.metrics import metrics
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые вызовы в одно вычисление.
+
+    Первый вызов с ключом запускает задачу, остальные вызовы с тем же ключом,
+    пришедшие до ее завершения, ждут ее результат или исключение. Задача
+    защищена от отмены: если клиент первого запроса отключился, остальные
+    все равно получат ответ.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполняет fn или присоединяется к уже выполняющемуся вызову с тем же ключом.
+
+        Args:
+            key: Ключ вызова
+            fn: Функция, возвращающая корутину с вычислением
+
+        Returns:
+            Результат общего вычисления
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            metrics.increment(f"singleflight_{self.name}_leaders_total")
+        else:
+            metrics.increment(f"singleflight_{self.name}_coalesced_total")
+        metrics.set_gauge(f"singleflight_{self.name}_in_flight", len(self._calls))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        metrics.set_gauge(f"singleflight_{self.name}_in_flight", len(self._calls))
+        # Исключение помечается полученным, даже если все ожидающие отменены.
+        if not task.cancelled():
+            task.exception()
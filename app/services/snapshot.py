@@ -0,0 +1,330 @@
+"""
+Снапшоты векторных хранилищ для переноса между окружениями без пересчета эмбеддингов.
+
+Снапшот — каталог из трех файлов:
+- manifest.json: размерность эмбеддингов и список хранилищ с их моделями;
+- documents.jsonl.zst: документы (содержимое, хеш и метаданные), сжатые zstd;
+- embeddings.npy: матрица эмбеддингов float32 в порядке строк documents.jsonl.zst.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import zstandard
+
+from app.config import settings
+from app.models.models import Document
+from app.services.db import pooled_connection
+from app.services.model_registry import get_embedding_model
+from app.services.summaries import refresh_summaries
+from app.services.tiering import rehydrate_vectorstore
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+DOCUMENTS_FILE = "documents.jsonl.zst"
+EMBEDDINGS_FILE = "embeddings.npy"
+COPY_BATCH_SIZE = 2000
+
+
+class SnapshotError(Exception):
+    """Снапшот поврежден или несовместим с текущей конфигурацией."""
+
+
+def embedding_dimension() -> int:
+    return Document.embedding.type.dim
+
+
+def create_snapshot(
+    output_dir: str,
+    vectorstore_id: Optional[int] = None,
+    telegram_id: Optional[str] = None,
+    connection_config: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Сохраняет хранилище или все хранилища пользователя в каталог снапшота.
+
+    Данные читаются в одной транзакции REPEATABLE READ серверным курсором,
+    эмбеддинги пишутся в memory-mapped .npy, поэтому память не зависит от
+    объема хранилища.
+
+    Args:
+        output_dir: Каталог снапшота (создается, должен быть пустым)
+        vectorstore_id: ID хранилища
+        telegram_id: Идентификатор пользователя, чьи хранилища сохраняются
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        Манифест снапшота
+    """
+    if (vectorstore_id is None) == (telegram_id is None):
+        raise SnapshotError("Нужно указать ровно одно: vectorstore_id или telegram_id")
+    os.makedirs(output_dir, exist_ok=True)
+    if os.listdir(output_dir):
+        raise SnapshotError(f"Каталог {output_dir} не пуст")
+
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    dimension = embedding_dimension()
+    # Документы архивных хранилищ возвращаются в documents до начала чтения.
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            archived = _fetch_archived_ids(cur, vectorstore_id, telegram_id)
+        conn.commit()
+    for archived_id in archived:
+        rehydrate_vectorstore(archived_id, connection_config)
+
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            vectorstores = _fetch_vectorstores(cur, vectorstore_id, telegram_id)
+        if not vectorstores:
+            raise SnapshotError("Не найдено ни одного векторного хранилища")
+
+        total = sum(vs["document_count"] for vs in vectorstores)
+        embeddings = np.lib.format.open_memmap(
+            os.path.join(output_dir, EMBEDDINGS_FILE),
+            mode="w+",
+            dtype=np.float32,
+            shape=(total, dimension),
+        )
+        written = 0
+        compressor = zstandard.ZstdCompressor()
+        with open(os.path.join(output_dir, DOCUMENTS_FILE), "wb") as raw:
+            with compressor.stream_writer(raw) as documents:
+                with conn.cursor(name="snapshot_documents") as cur:
+                    cur.itersize = settings.EXPORT_FETCH_SIZE
+                    cur.execute(
+                        """
+                        SELECT vectorstore_id, content, content_hash,
+                            doc_metadata, embedding
+                        FROM documents
+                        WHERE vectorstore_id = ANY(%s)
+                        ORDER BY vectorstore_id, doc_id
+                        """,
+                        ([vs["vectorstore_id"] for vs in vectorstores],),
+                    )
+                    for store_id, content, content_hash, metadata, embedding in cur:
+                        line = {
+                            "vectorstore_id": store_id,
+                            "content": content,
+                            "content_hash": content_hash,
+                            "metadata": metadata,
+                        }
+                        documents.write(
+                            (json.dumps(line, ensure_ascii=False) + "\n").encode()
+                        )
+                        embeddings[written] = embedding
+                        written += 1
+        conn.commit()
+
+    embeddings.flush()
+    del embeddings
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "dimension": dimension,
+        "document_count": written,
+        "vectorstores": vectorstores,
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def restore_snapshot(
+    input_dir: str,
+    telegram_id: Optional[str] = None,
+    connection_config: Optional[Dict[str, Any]] = None,
+) -> List[int]:
+    """
+    Восстанавливает хранилища из снапшота через COPY в одной транзакции.
+
+    Каждое хранилище восстанавливается со своей моделью эмбеддингов. Перед
+    загрузкой проверяется, что размерность совпадает с текущей, а модель
+    каждого хранилища доступна для запросов в этом окружении.
+
+    Args:
+        input_dir: Каталог снапшота
+        telegram_id: Владелец восстановленных хранилищ; по умолчанию исходный
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        Список ID созданных хранилищ
+    """
+    with open(os.path.join(input_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    _validate_manifest(manifest)
+
+    embeddings = np.load(os.path.join(input_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    if embeddings.shape != (manifest["document_count"], manifest["dimension"]):
+        raise SnapshotError(
+            f"Размер {EMBEDDINGS_FILE} {embeddings.shape} не совпадает с манифестом"
+        )
+
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            new_ids = {}
+            for vs in manifest["vectorstores"]:
+                new_ids[vs["vectorstore_id"]] = _create_vectorstore(
+                    cur, telegram_id or vs["telegram_id"], vs
+                )
+
+            restored = 0
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            with open(os.path.join(input_dir, DOCUMENTS_FILE), "rb") as raw:
+                reader = io.TextIOWrapper(
+                    zstandard.ZstdDecompressor().stream_reader(raw), encoding="utf-8"
+                )
+                for line in reader:
+                    if restored >= len(embeddings):
+                        raise SnapshotError("Документов больше, чем эмбеддингов")
+                    document = json.loads(line)
+                    old_id = document["vectorstore_id"]
+                    metadata = document["metadata"]
+                    # Метаданные чанков ссылаются на ID исходного хранилища.
+                    if isinstance(metadata, dict) and metadata.get("id") == old_id:
+                        metadata = {**metadata, "id": new_ids[old_id]}
+                    writer.writerow(
+                        [
+                            new_ids[old_id],
+                            document["content"],
+                            document["content_hash"],
+                            json.dumps(metadata),
+                            str(embeddings[restored].tolist()),
+                        ]
+                    )
+                    restored += 1
+                    if restored % COPY_BATCH_SIZE == 0:
+                        _copy_documents(cur, buffer)
+                        buffer = io.StringIO()
+                        writer = csv.writer(buffer)
+            if buffer.tell():
+                _copy_documents(cur, buffer)
+            refresh_summaries(cur, list(new_ids.values()))
+
+            if restored != manifest["document_count"]:
+                raise SnapshotError("Количество документов не совпадает с манифестом")
+        conn.commit()
+
+    return list(new_ids.values())
+
+
+def _fetch_vectorstores(
+    cur, vectorstore_id: Optional[int], telegram_id: Optional[str]
+) -> List[Dict[str, Any]]:
+    scope = "v.vectorstore_id = %s" if vectorstore_id else "u.telegram_id = %s"
+    cur.execute(
+        f"""
+        SELECT v.vectorstore_id, v.file_name, v.description, u.telegram_id,
+            (SELECT count(*) FROM documents d
+             WHERE d.vectorstore_id = v.vectorstore_id),
+            coalesce(v.embedding_model, %s)
+        FROM vectorstores v
+        JOIN users u ON u.user_id = v.user_id
+        WHERE {scope} AND v.deleted_at IS NULL AND u.deleted_at IS NULL
+        ORDER BY v.vectorstore_id
+        """,
+        (settings.EMBEDDING_MODEL_NAME, vectorstore_id or telegram_id),
+    )
+    return [
+        {
+            "vectorstore_id": row[0],
+            "file_name": row[1],
+            "description": row[2],
+            "telegram_id": row[3],
+            "document_count": row[4],
+            "embedding_model": row[5],
+        }
+        for row in cur.fetchall()
+    ]
+
+
+def _fetch_archived_ids(
+    cur, vectorstore_id: Optional[int], telegram_id: Optional[str]
+) -> List[int]:
+    scope = "v.vectorstore_id = %s" if vectorstore_id else "u.telegram_id = %s"
+    cur.execute(
+        f"""
+        SELECT v.vectorstore_id
+        FROM vectorstores v
+        JOIN users u ON u.user_id = v.user_id
+        WHERE {scope} AND v.storage_tier = 'archived'
+            AND v.deleted_at IS NULL AND u.deleted_at IS NULL
+        """,
+        (vectorstore_id or telegram_id,),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def _create_vectorstore(cur, telegram_id: str, vectorstore: Dict[str, Any]) -> int:
+    cur.execute(
+        """
+        INSERT INTO users (telegram_id) VALUES (%s)
+        ON CONFLICT (telegram_id) WHERE deleted_at IS NULL DO NOTHING
+        """,
+        (telegram_id,),
+    )
+    cur.execute(
+        "SELECT user_id FROM users WHERE telegram_id = %s AND deleted_at IS NULL",
+        (telegram_id,),
+    )
+    (user_id,) = cur.fetchone()
+    cur.execute(
+        """
+        INSERT INTO vectorstores (user_id, file_name, description, embedding_model)
+        VALUES (%s, %s, %s, %s)
+        RETURNING vectorstore_id
+        """,
+        (
+            user_id,
+            vectorstore["file_name"],
+            vectorstore["description"],
+            vectorstore["embedding_model"],
+        ),
+    )
+    return cur.fetchone()[0]
+
+
+def _copy_documents(cur, buffer: io.StringIO) -> None:
+    buffer.seek(0)
+    cur.copy_expert(
+        """
+        COPY documents (vectorstore_id, content, content_hash, doc_metadata, embedding)
+        FROM STDIN WITH (FORMAT csv)
+        """,
+        buffer,
+    )
+
+
+def _validate_manifest(manifest: Dict[str, Any]) -> None:
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(
+            f"Неподдерживаемая версия формата: {manifest.get('format_version')}"
+        )
+    if manifest["dimension"] != embedding_dimension():
+        raise SnapshotError(
+            f"Размерность эмбеддингов снапшота {manifest['dimension']} "
+            f"не совпадает с {embedding_dimension()}"
+        )
+    for vs in manifest["vectorstores"]:
+        # В снапшотах до пересчета эмбеддингов модель указана только в манифесте.
+        vs.setdefault("embedding_model", manifest.get("embedding_model"))
+        if not vs["embedding_model"]:
+            raise SnapshotError(
+                f"Для хранилища {vs['vectorstore_id']} не указана модель эмбеддингов"
+            )
+    for model_name in {vs["embedding_model"] for vs in manifest["vectorstores"]}:
+        # Запросы к хранилищу эмбеддятся его моделью, поэтому она должна
+        # загружаться в этом окружении.
+        try:
+            get_embedding_model(model_name)
+        except (ValueError, OSError) as e:
+            raise SnapshotError(
+                f"Модель эмбеддингов {model_name} недоступна: {e}"
+            ) from e
@@ -0,0 +1,82 @@
+from typing import List
+
+import numpy as np
+
+
+def update_summary(
+    cur, vectorstore_id: int, embeddings: List[List[float]], removed: bool = False
+) -> None:
+    """
+    Учитывает добавленные или удаленные документы в сводке хранилища.
+
+    Обновление выполняется в транзакции вызывающего кода, одним UPDATE
+    строки хранилища, поэтому параллельные вставки не теряют изменения.
+    Там же увеличивается content_version, по которому кеш ответов
+    отбрасывает ответы, полученные до изменения.
+
+    Args:
+        cur: Курсор открытой транзакции
+        vectorstore_id: ID хранилища
+        embeddings: Эмбеддинги добавленных или удаленных документов
+        removed: Документы удалены
+    """
+    if not len(embeddings):
+        return
+    vectors = np.asarray(embeddings, dtype=np.float64)
+    sign = -1 if removed else 1
+    cur.execute(
+        """
+        UPDATE vectorstores
+        SET document_count = document_count + %(count)s,
+            content_version = content_version + 1,
+            sq_norm_sum = CASE
+                WHEN document_count + %(count)s = 0 THEN 0
+                ELSE sq_norm_sum + %(sq_norm)s
+            END,
+            embedding_sum = CASE
+                WHEN document_count + %(count)s = 0 THEN NULL
+                WHEN embedding_sum IS NULL THEN %(delta)s::vector
+                ELSE embedding_sum + %(delta)s::vector
+            END
+        WHERE vectorstore_id = %(vectorstore_id)s
+        """,
+        {
+            "count": sign * len(vectors),
+            "sq_norm": sign * float(np.square(vectors).sum()),
+            "delta": (sign * vectors.sum(axis=0)).astype(np.float32),
+            "vectorstore_id": vectorstore_id,
+        },
+    )
+
+
+def refresh_summaries(cur, vectorstore_ids: List[int]) -> None:
+    """
+    Пересчитывает сводку хранилищ по их документам.
+
+    Используется после массовой загрузки в обход сервиса (COPY) и для
+    устранения накопленной погрешности сумм.
+
+    Args:
+        cur: Курсор открытой транзакции
+        vectorstore_ids: ID хранилищ
+    """
+    cur.execute(
+        """
+        UPDATE vectorstores v
+        SET document_count = coalesce(s.document_count, 0),
+            content_version = v.content_version + 1,
+            embedding_sum = s.embedding_sum,
+            sq_norm_sum = coalesce(s.sq_norm_sum, 0)
+        FROM unnest(%s::int[]) AS ids(vectorstore_id)
+        LEFT JOIN (
+            SELECT vectorstore_id, count(*) AS document_count,
+                sum(embedding) AS embedding_sum,
+                sum(vector_norm(embedding) ^ 2) AS sq_norm_sum
+            FROM documents
+            WHERE vectorstore_id = ANY(%s)
+            GROUP BY vectorstore_id
+        ) s ON s.vectorstore_id = ids.vectorstore_id
+        WHERE v.vectorstore_id = ids.vectorstore_id
+        """,
+        (vectorstore_ids, vectorstore_ids),
+    )
@@ -0,0 +1,339 @@
+"""
+Архивирование давно не используемых хранилищ.
+
+Хранилище, к которому не обращались дольше TIERING_IDLE_DAYS дней, переносится
+в таблицу vectorstore_archives: документы — сжатым zstd jsonl, эмбеддинги —
+сжатой матрицей float16. Строки documents удаляются, поэтому архивное хранилище
+не занимает место в ANN-индексе и shared buffers. Сводка эмбеддингов в строке
+хранилища сохраняется, и поиск по всем файлам продолжает его учитывать.
+
+При первом поиске хранилище восстанавливается прозрачно для пользователя.
+Эмбеддинги после восстановления имеют точность float16 (относительная
+погрешность порядка 1e-3), чего достаточно для поиска по косинусному сходству.
+"""
+import csv
+import io
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import zstandard
+
+from app.config import settings
+from app.models.models import Document
+from app.services.db import pooled_connection
+from app.services.metrics import metrics
+from app.services.summaries import refresh_summaries
+
+logger = logging.getLogger(__name__)
+
+COPY_BATCH_SIZE = 2000
+
+
+class TieringError(Exception):
+    """Архив хранилища поврежден и не может заменить документы."""
+
+
+def archive_vectorstore(
+    vectorstore_id: int,
+    idle_days: Optional[float] = None,
+    connection_config: Optional[Dict[str, Any]] = None,
+) -> bool:
+    """
+    Переносит документы хранилища в архив.
+
+    Args:
+        vectorstore_id: ID хранилища
+        idle_days: Архивировать, только если к хранилищу не обращались
+            столько дней; None — без проверки
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        True, если хранилище перенесено в архив
+    """
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    dimension = Document.embedding.type.dim
+    started = time.perf_counter()
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            # Блокировка не дает загрузкам и восстановлению пересечься
+            # с архивированием; обращение после выбора кандидата отменяет его.
+            cur.execute(
+                """
+                SELECT 1 FROM vectorstores
+                WHERE vectorstore_id = %s AND storage_tier = 'hot'
+                    AND deleted_at IS NULL
+                    AND (%s::float IS NULL
+                        OR last_accessed_at < now() - %s * interval '1 day')
+                FOR UPDATE
+                """,
+                (vectorstore_id, idle_days, idle_days or 0),
+            )
+            if cur.fetchone() is None:
+                conn.rollback()
+                return False
+
+        # У каждого потока свой контекст: compressobj() одного ZstdCompressor
+        # разделяют состояние и портят друг другу кадры.
+        documents = zstandard.ZstdCompressor().compressobj()
+        embeddings = zstandard.ZstdCompressor().compressobj()
+        documents_data, embeddings_data = [], []
+        count = 0
+        with conn.cursor(name="archive_documents") as cur:
+            cur.itersize = settings.EXPORT_FETCH_SIZE
+            cur.execute(
+                """
+                SELECT doc_id, content, content_hash, doc_metadata, created_at,
+                    embedding
+                FROM documents
+                WHERE vectorstore_id = %s
+                ORDER BY doc_id
+                """,
+                (vectorstore_id,),
+            )
+            for doc_id, content, content_hash, metadata, created_at, vector in cur:
+                line = {
+                    "doc_id": doc_id,
+                    "content": content,
+                    "content_hash": content_hash,
+                    "metadata": metadata,
+                    "created_at": created_at.isoformat() if created_at else None,
+                }
+                documents_data.append(
+                    documents.compress(
+                        (json.dumps(line, ensure_ascii=False) + "\n").encode()
+                    )
+                )
+                embeddings_data.append(
+                    embeddings.compress(np.asarray(vector, dtype=np.float16).tobytes())
+                )
+                count += 1
+        documents_data.append(documents.flush())
+        embeddings_data.append(embeddings.flush())
+        documents_blob = b"".join(documents_data)
+        embeddings_blob = b"".join(embeddings_data)
+        # Строки documents удаляются, поэтому архив проверяется до удаления.
+        _verify_archive(documents_blob, embeddings_blob, count, dimension)
+
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO vectorstore_archives
+                    (vectorstore_id, document_count, dimension, documents, embeddings)
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                (
+                    vectorstore_id,
+                    count,
+                    dimension,
+                    documents_blob,
+                    embeddings_blob,
+                ),
+            )
+            cur.execute(
+                "DELETE FROM documents WHERE vectorstore_id = %s", (vectorstore_id,)
+            )
+            cur.execute(
+                """
+                UPDATE vectorstores SET storage_tier = 'archived'
+                WHERE vectorstore_id = %s
+                """,
+                (vectorstore_id,),
+            )
+        conn.commit()
+
+    metrics.increment("tiering_archived_total")
+    logger.info(
+        f"Хранилище {vectorstore_id} перенесено в архив: документов {count} "
+        f"за {time.perf_counter() - started:.1f} с"
+    )
+    return True
+
+
+def archive_idle_vectorstores(
+    idle_days: Optional[float] = None,
+    limit: Optional[int] = None,
+    connection_config: Optional[Dict[str, Any]] = None,
+) -> List[int]:
+    """
+    Архивирует хранилища, к которым не обращались дольше idle_days дней.
+
+    Args:
+        idle_days: Срок без обращений, по умолчанию TIERING_IDLE_DAYS
+        limit: Максимальное количество хранилищ за запуск
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        Список ID архивированных хранилищ
+    """
+    idle_days = settings.TIERING_IDLE_DAYS if idle_days is None else idle_days
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT vectorstore_id FROM vectorstores
+                WHERE storage_tier = 'hot' AND deleted_at IS NULL
+                    AND last_accessed_at < now() - %s * interval '1 day'
+                ORDER BY last_accessed_at
+                LIMIT %s
+                """,
+                (idle_days, limit),
+            )
+            candidates = [row[0] for row in cur.fetchall()]
+        conn.commit()
+
+    archived = []
+    for vectorstore_id in candidates:
+        try:
+            if archive_vectorstore(vectorstore_id, idle_days, connection_config):
+                archived.append(vectorstore_id)
+        except Exception:
+            logger.exception(f"Не удалось архивировать хранилище {vectorstore_id}")
+    return archived
+
+
+def rehydrate_vectorstore(
+    vectorstore_id: int, connection_config: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Возвращает документы архивного хранилища в documents.
+
+    Одновременные вызовы для одного хранилища ждут друг друга на блокировке
+    строки хранилища; восстановление выполняет первый из них.
+
+    Args:
+        vectorstore_id: ID хранилища
+        connection_config: Конфигурация подключения к PostgreSQL
+
+    Returns:
+        True, если хранилище было в архиве (и теперь восстановлено)
+    """
+    connection_config = connection_config or settings.DATABASE_CONNECTION_CONFIG
+    started = time.perf_counter()
+    with pooled_connection(connection_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT storage_tier FROM vectorstores WHERE vectorstore_id = %s",
+                (vectorstore_id,),
+            )
+            row = cur.fetchone()
+            if row is None or row[0] != "archived":
+                conn.commit()
+                return False
+
+            cur.execute(
+                "SELECT storage_tier FROM vectorstores "
+                "WHERE vectorstore_id = %s FOR UPDATE",
+                (vectorstore_id,),
+            )
+            if cur.fetchone()[0] != "archived":
+                # Хранилище восстановил параллельный запрос.
+                conn.commit()
+                return True
+
+            cur.execute(
+                """
+                SELECT document_count, dimension, documents, embeddings
+                FROM vectorstore_archives WHERE vectorstore_id = %s
+                """,
+                (vectorstore_id,),
+            )
+            count, dimension, documents_data, embeddings_data = cur.fetchone()
+            vectors = _read_embeddings(bytes(embeddings_data), count, dimension)
+            reader = io.TextIOWrapper(
+                zstandard.ZstdDecompressor().stream_reader(
+                    io.BytesIO(bytes(documents_data))
+                ),
+                encoding="utf-8",
+            )
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row_index, line in enumerate(reader):
+                document = json.loads(line)
+                writer.writerow(
+                    [
+                        document["doc_id"],
+                        vectorstore_id,
+                        document["content"],
+                        document["content_hash"],
+                        json.dumps(document["metadata"]),
+                        document["created_at"],
+                        str(vectors[row_index].astype(np.float32).tolist()),
+                    ]
+                )
+                if (row_index + 1) % COPY_BATCH_SIZE == 0:
+                    _copy_documents(cur, buffer)
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+            if buffer.tell():
+                _copy_documents(cur, buffer)
+
+            refresh_summaries(cur, [vectorstore_id])
+            cur.execute(
+                "DELETE FROM vectorstore_archives WHERE vectorstore_id = %s",
+                (vectorstore_id,),
+            )
+            cur.execute(
+                """
+                UPDATE vectorstores
+                SET storage_tier = 'hot', last_accessed_at = now()
+                WHERE vectorstore_id = %s
+                """,
+                (vectorstore_id,),
+            )
+        conn.commit()
+
+    elapsed = time.perf_counter() - started
+    metrics.increment("tiering_rehydrated_total")
+    metrics.increment("tiering_rehydrate_seconds_total", elapsed)
+    logger.info(
+        f"Хранилище {vectorstore_id} восстановлено из архива: документов {count} "
+        f"за {elapsed:.1f} с"
+    )
+    return True
+
+
+def _read_embeddings(data: bytes, count: int, dimension: int) -> np.ndarray:
+    # Потоковые кадры zstd не содержат размер данных в заголовке.
+    raw = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    if len(raw) != count * dimension * np.dtype(np.float16).itemsize:
+        raise TieringError(
+            f"Размер матрицы эмбеддингов ({len(raw)} байт) не соответствует "
+            f"{count} x {dimension}"
+        )
+    return np.frombuffer(raw, dtype=np.float16).reshape(count, dimension)
+
+
+def _verify_archive(
+    documents_data: bytes, embeddings_data: bytes, count: int, dimension: int
+) -> None:
+    """
+    Проверяет, что архив распаковывается и содержит все документы.
+
+    Raises:
+        TieringError: Если количество строк или форма матрицы не совпадают
+    """
+    _read_embeddings(embeddings_data, count, dimension)
+    reader = io.TextIOWrapper(
+        zstandard.ZstdDecompressor().stream_reader(io.BytesIO(documents_data)),
+        encoding="utf-8",
+    )
+    lines = sum(1 for _ in reader)
+    if lines != count:
+        raise TieringError(f"В архиве документов {lines} строк вместо {count}")
+
+
+def _copy_documents(cur, buffer: io.StringIO) -> None:
+    buffer.seek(0)
+    cur.copy_expert(
+        """
+        COPY documents (doc_id, vectorstore_id, content, content_hash,
+            doc_metadata, created_at, embedding)
+        FROM STDIN WITH (FORMAT csv)
+        """,
+        buffer,
+    )
@@ -1,15 +1,74 @@
+import hashlib
 import json
-from typing import Any, Dict, List, Optional
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-import psycopg2
 from langchain.embeddings.base import Embeddings
-from pgvector.psycopg2 import register_vector
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from psycopg2.extras import execute_values
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.config import settings
-from app.models.models import Document as DBDocument
 from app.models.models import User, VectorStore
+from app.services.access_tracker import access_tracker
+from app.services.answer_cache import answer_cache
+from app.services.db import get_read_router, pgvector_version, pooled_connection
+from app.services.embeddings import embed_documents_bucketed
+from app.services.metadata_filter import build_metadata_filter
+from app.services.metrics import metrics
+from app.services.model_registry import get_embedding_model
+from app.services.summaries import update_summary
+from app.services.tiering import rehydrate_vectorstore
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_text(text: str) -> List[str]:
+    """
+    Разбивает текст на чанки размером CHUNK_SIZE с перекрытием CHUNK_OVERLAP.
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        Список чанков
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE, chunk_overlap=settings.CHUNK_OVERLAP
+    )
+    return splitter.split_text(text) or [text]
+
+
+def _diff_chunks(
+    existing: List[Tuple[int, str]], hashes: List[str]
+) -> Tuple[List[int], List[int]]:
+    """
+    Сравнивает хеши новых чанков с документами хранилища как мультимножества.
+
+    Args:
+        existing: Пары (doc_id, content_hash) документов хранилища
+        hashes: Хеши чанков новой версии
+
+    Returns:
+        Индексы чанков для вставки и doc_id документов для удаления
+    """
+    doc_ids_by_hash = defaultdict(list)
+    for doc_id, doc_hash in existing:
+        doc_ids_by_hash[doc_hash].append(doc_id)
+
+    to_insert = []
+    for index, chunk_hash in enumerate(hashes):
+        if doc_ids_by_hash[chunk_hash]:
+            doc_ids_by_hash[chunk_hash].pop()
+        else:
+            to_insert.append(index)
+
+    to_delete = [doc_id for doc_ids in doc_ids_by_hash.values() for doc_id in doc_ids]
+    return to_insert, to_delete
 
 
 class PostgresVectorStoreService:
@@ -17,6 +76,7 @@ class PostgresVectorStoreService:
         self,
         embedding_model: Embeddings,
         connection_config: Optional[Dict[str, Any]] = None,
+        replica_configs: Optional[List[Dict[str, Any]]] = None,
     ):
         """
         Инициализация сервиса векторного хранилища в PostgreSQL.
@@ -24,11 +84,44 @@ class PostgresVectorStoreService:
         Args:
             embedding_model: Модель для создания эмбеддингов
             connection_config: Конфигурация подключения к PostgreSQL
+            replica_configs: Конфигурации реплик для чтения,
+                по умолчанию из DB_REPLICA_URLS
         """
         self.connection_config = (
             connection_config or settings.DATABASE_CONNECTION_CONFIG
         )
         self.embedding_model = embedding_model
+        self.read_router = get_read_router(self.connection_config, replica_configs)
+
+    def model_for(self, model_name: Optional[str]) -> Embeddings:
+        """
+        Возвращает модель, которой посчитаны эмбеддинги хранилища.
+
+        Args:
+            model_name: Значение vectorstores.embedding_model
+
+        Returns:
+            Модель эмбеддингов
+        """
+        if model_name is None or model_name == settings.EMBEDDING_MODEL_NAME:
+            return self.embedding_model
+        return get_embedding_model(model_name)
+
+    def ensure_hot(self, vectorstore_id: int) -> bool:
+        """
+        Восстанавливает хранилище из архива, если оно было архивировано.
+
+        Args:
+            vectorstore_id: ID хранилища
+
+        Returns:
+            True, если хранилище было в архиве
+        """
+        if not rehydrate_vectorstore(vectorstore_id, self.connection_config):
+            return False
+        # Реплики могут еще не получить восстановленные документы.
+        self.read_router.mark_write(vectorstore_id)
+        return True
 
     def create_user(self, db: Session, telegram_id: str) -> User:
         """
@@ -58,7 +151,64 @@ class PostgresVectorStoreService:
         Returns:
             Объект User или None
         """
-        return db.query(User).filter(User.user_id == user_id).first()
+        return (
+            db.query(User)
+            .filter(User.user_id == user_id, User.deleted_at.is_(None))
+            .first()
+        )
+
+    async def acreate_user(self, db: AsyncSession, telegram_id: str) -> User:
+        """
+        Асинхронно создает нового пользователя.
+
+        Args:
+            db: Асинхронная сессия SQLAlchemy
+            telegram_id: Идентификатор пользователя Telegram
+
+        Returns:
+            Объект User
+        """
+        user = User(telegram_id=telegram_id)
+        db.add(user)
+        await db.commit()
+        await db.refresh(user)
+        return user
+
+    async def aget_user(self, db: AsyncSession, user_id: int) -> Optional[User]:
+        """
+        Асинхронно получает пользователя по ID.
+
+        Args:
+            db: Асинхронная сессия SQLAlchemy
+            user_id: ID пользователя
+
+        Returns:
+            Объект User или None
+        """
+        result = await db.execute(
+            select(User).where(User.user_id == user_id, User.deleted_at.is_(None))
+        )
+        return result.scalars().first()
+
+    async def aget_user_by_telegram_id(
+        self, db: AsyncSession, telegram_id: str
+    ) -> Optional[User]:
+        """
+        Асинхронно получает пользователя по telegram_id.
+
+        Args:
+            db: Асинхронная сессия SQLAlchemy
+            telegram_id: Идентификатор пользователя Telegram
+
+        Returns:
+            Объект User или None
+        """
+        result = await db.execute(
+            select(User).where(
+                User.telegram_id == telegram_id, User.deleted_at.is_(None)
+            )
+        )
+        return result.scalars().first()
 
     def create_vectorstore(
         self, db: Session, user_id: int, file_name: str
@@ -79,12 +229,69 @@ class PostgresVectorStoreService:
             user_id=user_id,
             file_name=file_name,
             description=f"Vectorstore for {file_name}",
+            embedding_model=settings.EMBEDDING_MODEL_NAME,
         )
         db.add(vectorstore)
         db.commit()
         db.refresh(vectorstore)
         return vectorstore
 
+    def create_vectorstore_with_texts(
+        self, user_id: int, file_name: str, texts: List[str]
+    ) -> Dict[str, Any]:
+        """
+        Создает векторное хранилище и добавляет в него документы в одной транзакции.
+
+        Эмбеддинги вычисляются до начала транзакции, чтобы не держать
+        блокировки во время работы модели. Если вставка документов не удалась,
+        хранилище тоже не создается.
+
+        Args:
+            user_id: ID пользователя
+            file_name: Имя файла векторного хранилища
+            texts: Чанки документа
+
+        Returns:
+            Словарь с информацией о созданном хранилище
+        """
+        embeddings = embed_documents_bucketed(self.embedding_model, texts)
+        description = f"Vectorstore for {file_name}"
+        with pooled_connection(self.connection_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO vectorstores
+                        (user_id, file_name, description, embedding_model)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING vectorstore_id, created_at
+                    """,
+                    (user_id, file_name, description, settings.EMBEDDING_MODEL_NAME),
+                )
+                vectorstore_id, created_at = cur.fetchone()
+                metadata = self.file_metadata(file_name, vectorstore_id)
+                self._insert_documents(
+                    cur,
+                    vectorstore_id,
+                    texts,
+                    [metadata for _ in texts],
+                    embeddings,
+                )
+            conn.commit()
+        self._after_write(vectorstore_id)
+
+        return {
+            "vectorstore_id": vectorstore_id,
+            "user_id": user_id,
+            "file_name": file_name,
+            "description": description,
+            "created_at": created_at,
+            "document_count": len(texts),
+        }
+
+    @staticmethod
+    def file_metadata(file_name: str, vectorstore_id: int) -> Dict[str, Any]:
+        return {"file_name": file_name, "id": vectorstore_id}
+
     def get_vectorstore(
         self, db: Session, vectorstore_id: int
     ) -> Optional[VectorStore]:
@@ -100,46 +307,100 @@ class PostgresVectorStoreService:
         """
         return (
             db.query(VectorStore)
-            .filter(VectorStore.vectorstore_id == vectorstore_id)
+            .filter(
+                VectorStore.vectorstore_id == vectorstore_id,
+                VectorStore.deleted_at.is_(None),
+            )
             .first()
         )
 
+    async def aget_vectorstore(
+        self, db: AsyncSession, vectorstore_id: int
+    ) -> Optional[VectorStore]:
+        """
+        Асинхронно получает хранилище по ID.
+
+        Args:
+            db: Асинхронная сессия SQLAlchemy
+            vectorstore_id: ID хранилища
+
+        Returns:
+            Объект VectorStore или None
+        """
+        result = await db.execute(
+            select(VectorStore).where(
+                VectorStore.vectorstore_id == vectorstore_id,
+                VectorStore.deleted_at.is_(None),
+            )
+        )
+        return result.scalars().first()
+
+    async def aget_vectorstore_by_file_name(
+        self, db: AsyncSession, user_id: int, file_name: str
+    ) -> Optional[VectorStore]:
+        """
+        Асинхронно получает хранилище пользователя по имени файла.
+
+        Args:
+            db: Асинхронная сессия SQLAlchemy
+            user_id: ID пользователя
+            file_name: Имя файла векторного хранилища
+
+        Returns:
+            Объект VectorStore или None
+        """
+        result = await db.execute(
+            select(VectorStore).where(
+                VectorStore.user_id == user_id,
+                VectorStore.file_name == file_name,
+                VectorStore.deleted_at.is_(None),
+            )
+        )
+        return result.scalars().first()
+
     def get_vectorstores_for_user(
-        self, db: Session, user_id: int
+        self, user_id: int, consistent: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Получает все векторные хранилища для указанного пользователя.
 
+        Запрос выполняется на реплике для чтения, если они настроены.
+
         Args:
-            db: Сессия SQLAlchemy
             user_id: ID пользователя
+            consistent: Читать с основного сервера
 
         Returns:
             Список словарей с информацией о хранилищах
         """
-        stores = []
-        vectorstores = (
-            db.query(VectorStore).filter(VectorStore.user_id == user_id).all()
-        )
 
-        for vs in vectorstores:
-            document_count = (
-                db.query(DBDocument)
-                .filter(DBDocument.vectorstore_id == vs.vectorstore_id)
-                .count()
-            )
-            stores.append(
+        def fetch(conn) -> List[Dict[str, Any]]:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT vectorstore_id, file_name, description,
+                        user_id, created_at, document_count
+                    FROM vectorstores
+                    WHERE user_id = %s AND deleted_at IS NULL
+                    ORDER BY vectorstore_id
+                    """,
+                    (user_id,),
+                )
+                rows = cur.fetchall()
+            conn.commit()
+            return [
                 {
-                    "vectorstore_id": vs.vectorstore_id,
-                    "name": vs.name,
-                    "description": vs.description,
-                    "user_id": vs.user_id,
-                    "created_at": vs.created_at,
-                    "document_count": document_count,
+                    "vectorstore_id": row[0],
+                    "file_name": row[1],
+                    "description": row[2],
+                    "user_id": row[3],
+                    "created_at": row[4],
+                    "document_count": row[5],
                 }
-            )
+                for row in rows
+            ]
 
-        return stores
+        return self.read_router.read(fetch, consistent=consistent)
 
     def add_texts(
         self,
@@ -161,83 +422,736 @@ class PostgresVectorStoreService:
         if metadatas is None:
             metadatas = [{} for _ in texts]
 
-        embeddings = self.embedding_model.embed_documents(texts)
-        conn = psycopg2.connect(**self.connection_config)
-        register_vector(conn)
-        try:
+        self.ensure_hot(vectorstore_id)
+        with pooled_connection(self.connection_config) as conn:
             with conn.cursor() as cur:
-                data = [
-                    (vectorstore_id, text, json.dumps(doc_metadata), embedding)
-                    for text, doc_metadata, embedding in zip(
-                        texts, metadatas, embeddings
+                model_name = self._fetch_embedding_model(cur, vectorstore_id)
+            conn.commit()
+
+            embeddings = embed_documents_bucketed(self.model_for(model_name), texts)
+            with conn.cursor() as cur:
+                # Блокировка не дает переключить хранилище на новую модель
+                # или архивировать его до конца вставки; если переключение
+                # успело произойти, эмбеддинги пересчитываются новой моделью.
+                locked_model_name = self._lock_hot_vectorstore(
+                    conn, cur, vectorstore_id, "FOR NO KEY UPDATE"
+                )
+                if locked_model_name != model_name:
+                    embeddings = embed_documents_bucketed(
+                        self.model_for(locked_model_name), texts
                     )
-                ]
+                doc_ids = self._insert_documents(
+                    cur, vectorstore_id, texts, metadatas, embeddings
+                )
+            conn.commit()
+        self._after_write(vectorstore_id)
+
+        return [str(doc_id) for doc_id in doc_ids]
+
+    def update_texts(
+        self,
+        vectorstore_id: int,
+        texts: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, int]:
+        """
+        Заменяет содержимое хранилища новой версией, пересчитывая эмбеддинги
+        только для изменившихся чанков.
+
+        Чанки сравниваются с документами хранилища по хешу содержимого.
+        Эмбеддинги новых чанков вычисляются до начала транзакции, после чего
+        вставка новых и удаление исчезнувших документов выполняются в одной
+        транзакции под блокировкой строки хранилища.
+
+        Args:
+            vectorstore_id: ID хранилища
+            texts: Чанки новой версии документа
+            metadatas: Метаданные для каждого чанка
+
+        Returns:
+            Количество добавленных, удаленных и неизмененных чанков
+        """
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+        hashes = [content_hash(text) for text in texts]
+
+        # Сравнение с архивным хранилищем без документов удалило бы все чанки.
+        self.ensure_hot(vectorstore_id)
+        with pooled_connection(self.connection_config) as conn:
+            with conn.cursor() as cur:
+                to_insert, _ = _diff_chunks(
+                    self._fetch_content_hashes(cur, vectorstore_id), hashes
+                )
+                model_name = self._fetch_embedding_model(cur, vectorstore_id)
+            conn.commit()
+
+            embeddings = self._embed_unique(
+                self.model_for(model_name), texts, hashes, to_insert, {}
+            )
+
+            with conn.cursor() as cur:
+                locked_model_name = self._lock_hot_vectorstore(
+                    conn, cur, vectorstore_id, "FOR UPDATE"
+                )
+                if locked_model_name != model_name:
+                    # Хранилище переключено на новую модель, посчитанные
+                    # эмбеддинги больше не подходят.
+                    embeddings = {}
+                # Повторное сравнение под блокировкой: между чтением и
+                # блокировкой хранилище мог изменить параллельный запрос.
+                to_insert, to_delete = _diff_chunks(
+                    self._fetch_content_hashes(cur, vectorstore_id), hashes
+                )
+                embeddings = self._embed_unique(
+                    self.model_for(locked_model_name),
+                    texts,
+                    hashes,
+                    to_insert,
+                    embeddings,
+                )
+
+                if to_delete:
+                    cur.execute(
+                        """
+                        DELETE FROM documents WHERE doc_id = ANY(%s)
+                        RETURNING embedding
+                        """,
+                        (to_delete,),
+                    )
+                    update_summary(
+                        cur,
+                        vectorstore_id,
+                        [row[0] for row in cur.fetchall()],
+                        removed=True,
+                    )
+                if to_insert:
+                    self._insert_documents(
+                        cur,
+                        vectorstore_id,
+                        [texts[i] for i in to_insert],
+                        [metadatas[i] for i in to_insert],
+                        [embeddings[hashes[i]] for i in to_insert],
+                    )
+            conn.commit()
+        self._after_write(vectorstore_id)
+
+        return {
+            "added": len(to_insert),
+            "removed": len(to_delete),
+            "unchanged": len(texts) - len(to_insert),
+        }
+
+    def delete_vectorstore(self, vectorstore_id: int) -> bool:
+        """
+        Помечает хранилище удаленным; документы удаляет purge_vectorstore.
+
+        Хранилище сразу перестает находиться в списках и поиске, а его имя
+        файла можно использовать снова.
 
-                query = """
-                INSERT INTO documents (vectorstore_id, content, doc_metadata, embedding)
-                VALUES %s
-                RETURNING doc_id
-                """
-                template = "(%s, %s, %s, %s)"
+        Args:
+            vectorstore_id: ID хранилища
+
+        Returns:
+            True, если хранилище было помечено этим вызовом
+        """
+        with pooled_connection(self.connection_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE vectorstores SET deleted_at = now()
+                    WHERE vectorstore_id = %s AND deleted_at IS NULL
+                    """,
+                    (vectorstore_id,),
+                )
+                deleted = cur.rowcount > 0
+            conn.commit()
+        self._after_write(vectorstore_id)
+        return deleted
+
+    def delete_user(self, user_id: int) -> List[int]:
+        """
+        Помечает пользователя и все его хранилища удаленными.
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            Список ID помеченных хранилищ
+        """
+        with pooled_connection(self.connection_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE users SET deleted_at = now()
+                    WHERE user_id = %s AND deleted_at IS NULL
+                    """,
+                    (user_id,),
+                )
+                cur.execute(
+                    """
+                    UPDATE vectorstores SET deleted_at = now()
+                    WHERE user_id = %s AND deleted_at IS NULL
+                    RETURNING vectorstore_id
+                    """,
+                    (user_id,),
+                )
+                vectorstore_ids = sorted(row[0] for row in cur.fetchall())
+            conn.commit()
+        for vectorstore_id in vectorstore_ids:
+            self._after_write(vectorstore_id)
+        return vectorstore_ids
+
+    def _after_write(self, vectorstore_id: int) -> None:
+        self.read_router.mark_write(vectorstore_id)
+        answer_cache.invalidate(vectorstore_id)
+
+    @staticmethod
+    def _embed_unique(
+        model: Embeddings,
+        texts: List[str],
+        hashes: List[str],
+        indexes: List[int],
+        known: Dict[str, List[float]],
+    ) -> Dict[str, List[float]]:
+        pending = {}
+        for index in indexes:
+            if hashes[index] not in known:
+                pending.setdefault(hashes[index], texts[index])
+        if not pending:
+            return known
+
+        vectors = embed_documents_bucketed(model, list(pending.values()))
+        return {**known, **dict(zip(pending.keys(), vectors))}
+
+    @staticmethod
+    def _fetch_embedding_model(cur, vectorstore_id: int, lock: str = "") -> str:
+        cur.execute(
+            f"SELECT embedding_model FROM vectorstores WHERE vectorstore_id = %s {lock}",
+            (vectorstore_id,),
+        )
+        row = cur.fetchone()
+        return (row[0] if row else None) or settings.EMBEDDING_MODEL_NAME
+
+    def _lock_hot_vectorstore(self, conn, cur, vectorstore_id: int, lock: str) -> str:
+        # Архивирование берет ту же блокировку строки, поэтому хранилище,
+        # которое под ней не в архиве, останется в documents до конца
+        # транзакции. Если архивирование успело пройти после ensure_hot,
+        # блокировка снимается, чтобы восстановление могло ее взять.
+        while True:
+            cur.execute(
+                f"""
+                SELECT embedding_model, storage_tier FROM vectorstores
+                WHERE vectorstore_id = %s {lock}
+                """,
+                (vectorstore_id,),
+            )
+            row = cur.fetchone()
+            if row is None or row[1] != "archived":
+                return (row[0] if row else None) or settings.EMBEDDING_MODEL_NAME
+            conn.rollback()
+            self.ensure_hot(vectorstore_id)
+
+    @staticmethod
+    def _fetch_content_hashes(cur, vectorstore_id: int) -> List[Tuple[int, str]]:
+        cur.execute(
+            "SELECT doc_id, content_hash FROM documents WHERE vectorstore_id = %s",
+            (vectorstore_id,),
+        )
+        return cur.fetchall()
+
+    @staticmethod
+    def _insert_documents(
+        cur,
+        vectorstore_id: int,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+    ) -> List[int]:
+        data = [
+            (
+                vectorstore_id,
+                text,
+                content_hash(text),
+                json.dumps(doc_metadata),
+                embedding,
+            )
+            for text, doc_metadata, embedding in zip(texts, metadatas, embeddings)
+        ]
+
+        query = """
+        INSERT INTO documents (vectorstore_id, content, content_hash, doc_metadata, embedding)
+        VALUES %s
+        RETURNING doc_id
+        """
+        template = "(%s, %s, %s, %s, %s)"
+
+        doc_ids = execute_values(cur, query, data, template, fetch=True)
+        update_summary(cur, vectorstore_id, embeddings)
+        return [row[0] for row in doc_ids]
+
+    def iter_documents(
+        self,
+        vectorstore_id: int,
+        include_embeddings: bool = False,
+        fetch_size: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Последовательно читает документы хранилища через серверный курсор.
+
+        Строки забираются с сервера порциями по fetch_size, поэтому память
+        не зависит от размера хранилища. Соединение занято, пока итератор
+        не исчерпан или не закрыт.
 
-                doc_ids = execute_values(cur, query, data, template, fetch=True)
-                conn.commit()
+        Args:
+            vectorstore_id: ID хранилища
+            include_embeddings: Возвращать ли эмбеддинги
+            fetch_size: Размер порции, по умолчанию EXPORT_FETCH_SIZE
 
-                return [str(id[0]) for id in doc_ids]
-        finally:
-            conn.close()
+        Yields:
+            Словари с полями документа
+        """
+        columns = "doc_id, content, doc_metadata, created_at"
+        if include_embeddings:
+            columns += ", embedding"
+
+        self.ensure_hot(vectorstore_id)
+        with pooled_connection(self.connection_config) as conn:
+            with conn.cursor(name=f"export_vectorstore_{vectorstore_id}") as cur:
+                cur.itersize = fetch_size or settings.EXPORT_FETCH_SIZE
+                cur.execute(
+                    f"""
+                    SELECT {columns}
+                    FROM documents
+                    WHERE vectorstore_id = %s
+                    ORDER BY doc_id
+                    """,
+                    (vectorstore_id,),
+                )
+                for row in cur:
+                    document = {
+                        "doc_id": row[0],
+                        "content": row[1],
+                        "metadata": row[2],
+                        "created_at": row[3],
+                    }
+                    if include_embeddings:
+                        document["embedding"] = row[4]
+                    yield document
+            conn.commit()
 
     def similarity_search(
         self,
         vectorstore_id: int,
         query: str,
         k: int = 4,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        consistent: bool = False,
     ) -> List[Dict[str, Any]]:
         """
         Выполняет поиск по сходству в векторном хранилище.
 
+        Запрос кодируется моделью, которой посчитаны эмбеддинги хранилища.
+
         Args:
             vectorstore_id: ID хранилища
             query: Текст запроса
             k: Количество результатов для возврата
+            metadata_filter: Фильтр по метаданным документов
+            consistent: Читать с основного сервера, чтобы увидеть
+                только что добавленные документы
 
         Returns:
             Список результатов поиска
         """
-        query_embedding = self.embedding_model.embed_query(query)
-        conn = psycopg2.connect(**self.connection_config)
-        register_vector(conn)
-        try:
+
+        def fetch_model_name(conn) -> str:
+            with conn.cursor() as cur:
+                model_name = self._fetch_embedding_model(cur, vectorstore_id)
+            conn.commit()
+            return model_name
+
+        model_name = self.read_router.read(fetch_model_name, vectorstore_id, consistent)
+        return self.similarity_search_by_vector(
+            vectorstore_id,
+            self.model_for(model_name).embed_query(query),
+            k,
+            metadata_filter,
+            consistent,
+        )
+
+    def similarity_search_by_vector(
+        self,
+        vectorstore_id: int,
+        query_embedding: List[float],
+        k: int = 4,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        consistent: bool = False,
+        include_embeddings: bool = False,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Выполняет поиск по сходству с готовым эмбеддингом запроса.
+
+        Фильтр по метаданным выполняется в SQL. Для HNSW-индекса включается
+        итеративное сканирование (pgvector >= 0.8), чтобы фильтрация по
+        хранилищу и метаданным не сокращала количество найденных документов.
+        Поиск выполняется на реплике для чтения, если они настроены и
+        в хранилище недавно не писали. Архивное хранилище восстанавливается
+        при первом поиске: у него нет документов, поэтому проверка уровня
+        хранения выполняется только при пустом результате.
+
+        Args:
+            vectorstore_id: ID хранилища
+            query_embedding: Эмбеддинг запроса
+            k: Количество результатов для возврата
+            metadata_filter: Фильтр по метаданным документов
+            consistent: Читать с основного сервера
+            include_embeddings: Возвращать эмбеддинги найденных документов
+            timeout: Ограничение времени запроса к БД в секундах
+                (statement_timeout); при превышении PostgreSQL отменяет запрос
+                с psycopg2.errors.QueryCanceled
+
+        Returns:
+            Список результатов поиска
+        """
+        results, _ = self.similarity_search_with_version(
+            vectorstore_id,
+            query_embedding,
+            k,
+            metadata_filter,
+            consistent,
+            include_embeddings,
+            timeout,
+        )
+        return results
+
+    def similarity_search_with_version(
+        self,
+        vectorstore_id: int,
+        query_embedding: List[float],
+        k: int = 4,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        consistent: bool = False,
+        include_embeddings: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Выполняет similarity_search_by_vector и возвращает версию содержимого
+        хранилища, прочитанную на том же сервере перед поиском.
+
+        Найденные документы не старше этой версии даже на отстающей реплике,
+        поэтому ответ, построенный по ним, можно кешировать под ней.
+
+        Returns:
+            Список результатов поиска и версия содержимого хранилища
+        """
+
+        def search(conn) -> Tuple[List[Dict[str, Any]], int]:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT content_version FROM vectorstores WHERE vectorstore_id = %s",
+                    (vectorstore_id,),
+                )
+                row = cur.fetchone()
+            results = self._search_documents(
+                conn,
+                [vectorstore_id],
+                query_embedding,
+                k,
+                metadata_filter,
+                include_embeddings,
+                timeout,
+            )
+            return results, row[0] if row else 0
+
+        results, version = self.read_router.read(search, vectorstore_id, consistent)
+        if not results and self.ensure_hot(vectorstore_id):
+            results, version = self.read_router.read(search, vectorstore_id, True)
+        access_tracker.touch([vectorstore_id], self.connection_config)
+        return results, version
+
+    def route_vectorstores(
+        self,
+        user_id: int,
+        query_embedding: List[float],
+        consistent: bool = False,
+        embedding_model: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Оценивает, в каких хранилищах пользователя вероятнее найти документы,
+        близкие к запросу, не читая эмбеддинги документов.
+
+        Для нормированного эмбеддинга документа x из хранилища с центроидом c
+        q·x = q·c + q·(x - c) <= q·c + |x - c|, поэтому оценка хранилища —
+        сходство запроса с центроидом плюс среднеквадратичный радиус хранилища.
+        Оценка считается по сводке в строке хранилища, стоимость не зависит
+        от количества документов.
+
+        Args:
+            user_id: ID пользователя
+            query_embedding: Эмбеддинг запроса
+            consistent: Читать с основного сервера
+            embedding_model: Оценивать только хранилища, посчитанные этой
+                моделью (эмбеддинг запроса должен быть посчитан ею же)
+
+        Returns:
+            Непустые хранилища пользователя по убыванию оценки
+        """
+        where = "user_id = %s AND document_count > 0 AND deleted_at IS NULL"
+        params = [user_id]
+        if embedding_model is not None:
+            where += " AND coalesce(embedding_model, %s) = %s"
+            params += [settings.EMBEDDING_MODEL_NAME, embedding_model]
+
+        def fetch(conn) -> List[Dict[str, Any]]:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT vectorstore_id, file_name, document_count,
+                        centroid_similarity, spread, embedding_model, storage_tier
+                    FROM (
+                        SELECT vectorstore_id, file_name, document_count,
+                            embedding_model, storage_tier,
+                            -(embedding_sum <#> %s::vector) / document_count
+                                AS centroid_similarity,
+                            sqrt(greatest(
+                                sq_norm_sum / document_count
+                                - (vector_norm(embedding_sum) / document_count) ^ 2,
+                                0
+                            )) AS spread
+                        FROM vectorstores
+                        WHERE {where}
+                    ) s
+                    ORDER BY centroid_similarity + spread DESC, vectorstore_id
+                    """,
+                    (query_embedding, *params),
+                )
+                rows = cur.fetchall()
+            conn.commit()
+            return [
+                {
+                    "vectorstore_id": row[0],
+                    "file_name": row[1],
+                    "document_count": row[2],
+                    "centroid_similarity": row[3],
+                    "spread": row[4],
+                    "score": row[3] + row[4],
+                    "embedding_model": row[5] or settings.EMBEDDING_MODEL_NAME,
+                    "storage_tier": row[6],
+                }
+                for row in rows
+            ]
+
+        return self.read_router.read(fetch, consistent=consistent)
+
+    def search_user_vectorstores(
+        self,
+        user_id: int,
+        query: str,
+        k: int = 4,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        consistent: bool = False,
+        exhaustive: bool = False,
+        top_m: Optional[int] = None,
+        include_embeddings: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Ищет по всем файлам пользователя, просматривая только самые
+        перспективные хранилища.
+
+        Если у пользователя больше top_m непустых хранилищ, поиск выполняется
+        в top_m лучших по оценке route_vectorstores. Если там нашлось меньше
+        k документов, поиск повторяется по всем хранилищам, кроме архивных:
+        их восстанавливает только попадание в top_m. Пока хранилища
+        пользователя переводятся на новую модель эмбеддингов, запрос кодируется
+        каждой из используемых моделей, и каждое хранилище сравнивается
+        с эмбеддингом своей модели.
+
+        Args:
+            user_id: ID пользователя
+            query: Текст запроса
+            k: Количество результатов для возврата
+            metadata_filter: Фильтр по метаданным документов
+            consistent: Читать с основного сервера
+            exhaustive: Искать во всех хранилищах без выбора
+            top_m: Количество просматриваемых хранилищ, по умолчанию ROUTING_TOP_M
+            include_embeddings: Возвращать эмбеддинги найденных документов
+
+        Returns:
+            Список результатов поиска с vectorstore_id и file_name
+        """
+        top_m = settings.ROUTING_TOP_M if top_m is None else top_m
+        if metadata_filter:
+            # Ошибка в фильтре должна проявиться до вычисления эмбеддинга.
+            build_metadata_filter(metadata_filter)
+        query_embeddings = {
+            model_name: self.model_for(model_name).embed_query(query)
+            for model_name in self._user_embedding_models(user_id, consistent)
+        }
+        stores = []
+        for model_name, query_embedding in query_embeddings.items():
+            stores += self.route_vectorstores(
+                user_id, query_embedding, consistent, model_name
+            )
+        if not stores:
+            return []
+        stores.sort(key=lambda store: (-store["score"], store["vectorstore_id"]))
+        file_names = {store["vectorstore_id"]: store["file_name"] for store in stores}
+        models = {store["vectorstore_id"]: store["embedding_model"] for store in stores}
+        archived = {
+            store["vectorstore_id"]
+            for store in stores
+            if store["storage_tier"] == "archived"
+        }
+
+        def search(vectorstore_ids: List[int]) -> List[Dict[str, Any]]:
+            metrics.increment(
+                "routing_vectorstores_searched_total", len(vectorstore_ids)
+            )
+            # Сводка архивных хранилищ сохраняется, поэтому они участвуют
+            # в выборе и восстанавливаются, только если попали в поиск.
+            fresh = False
+            for vectorstore_id in vectorstore_ids:
+                if vectorstore_id in archived:
+                    fresh |= self.ensure_hot(vectorstore_id)
+                    archived.discard(vectorstore_id)
+            access_tracker.touch(vectorstore_ids, self.connection_config)
+            by_model = defaultdict(list)
+            for vectorstore_id in vectorstore_ids:
+                by_model[models[vectorstore_id]].append(vectorstore_id)
+
+            results = []
+            for model_name, ids in by_model.items():
+                results += self.read_router.read(
+                    lambda conn, ids=ids, model_name=model_name: self._search_documents(
+                        conn,
+                        ids,
+                        query_embeddings[model_name],
+                        k,
+                        metadata_filter,
+                        include_embeddings,
+                    ),
+                    consistent=consistent or fresh,
+                )
+            results.sort(key=lambda result: -result["similarity"])
+            return results[:k]
+
+        metrics.increment("routing_searches_total")
+        metrics.increment("routing_vectorstores_total", len(stores))
+        all_ids = list(file_names)
+        if exhaustive or top_m <= 0 or len(stores) <= top_m:
+            results = search(all_ids)
+        else:
+            results = search(all_ids[:top_m])
+            if len(results) < k:
+                # Восстановление всех архивных хранилищ пользователя ради
+                # добора результатов стоило бы дороже самого поиска.
+                metrics.increment("routing_fallbacks_total")
+                hot_ids = [
+                    vectorstore_id
+                    for vectorstore_id in all_ids
+                    if vectorstore_id not in archived
+                ]
+                results = search(hot_ids)
+
+        for result in results:
+            result["file_name"] = file_names[result["vectorstore_id"]]
+        return results
+
+    def _user_embedding_models(self, user_id: int, consistent: bool) -> List[str]:
+        def fetch(conn) -> List[str]:
             with conn.cursor() as cur:
                 cur.execute(
                     """
-                    SELECT doc_id, content, doc_metadata,
-                        1 - (embedding <=> %s::vector) as similarity
+                    SELECT DISTINCT coalesce(embedding_model, %s)
+                    FROM vectorstores
+                    WHERE user_id = %s AND document_count > 0
+                        AND deleted_at IS NULL
+                    """,
+                    (settings.EMBEDDING_MODEL_NAME, user_id),
+                )
+                rows = cur.fetchall()
+            conn.commit()
+            return [row[0] for row in rows]
+
+        return self.read_router.read(fetch, consistent=consistent)
+
+    def _search_documents(
+        self,
+        conn,
+        vectorstore_ids: List[int],
+        query_embedding: List[float],
+        k: int,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        where, filter_params = "TRUE", []
+        if metadata_filter:
+            where, filter_params = build_metadata_filter(metadata_filter)
+
+        if len(vectorstore_ids) == 1:
+            scope, scope_param = "vectorstore_id = %s", vectorstore_ids[0]
+        else:
+            scope, scope_param = "vectorstore_id = ANY(%s)", vectorstore_ids
+        embedding_column = ", embedding" if include_embeddings else ""
+
+        with conn.cursor() as cur:
+            self._configure_ann_search(conn, cur, timeout)
+            cur.execute(
+                f"""
+                WITH candidates AS MATERIALIZED (
+                    SELECT doc_id, vectorstore_id, content, doc_metadata
+                        {embedding_column},
+                        embedding <=> %s::vector AS distance
                     FROM documents
-                    WHERE vectorstore_id = %s
-                    ORDER BY embedding <=> %s::vector
+                    WHERE {scope} AND {where}
+                    ORDER BY distance
                     LIMIT %s
-                    """,
-                    (query_embedding, vectorstore_id, query_embedding, k),
                 )
+                SELECT doc_id, vectorstore_id, content, doc_metadata,
+                    1 - distance AS similarity {embedding_column}
+                FROM candidates
+                ORDER BY distance
+                """,
+                (query_embedding, scope_param, *filter_params, k),
+            )
 
-                results = []
-                for doc_id, content, metadata_str, similarity in cur.fetchall():
-                    metadata = (
-                        metadata_str
-                        if isinstance(metadata_str, dict)
-                        else json.loads(metadata_str)
-                    )
+            results = []
+            for row in cur.fetchall():
+                # doc_metadata разбирается драйвером (см. VectorConnection).
+                doc_id, vectorstore_id, content, metadata, similarity = row[:5]
+                result = {
+                    "doc_id": doc_id,
+                    "vectorstore_id": vectorstore_id,
+                    "content": content,
+                    "metadata": metadata,
+                    "similarity": similarity,
+                }
+                if include_embeddings:
+                    result["embedding"] = row[5]
+                results.append(result)
 
-                    results.append(
-                        {
-                            "doc_id": doc_id,
-                            "content": content,
-                            "metadata": metadata,
-                            "similarity": similarity,
-                        }
-                    )
+        conn.commit()
+        return results
 
-                return results
-        finally:
-            conn.close()
+    @staticmethod
+    def _configure_ann_search(conn, cur, timeout: Optional[float] = None) -> None:
+        # Параметры действуют только до конца текущей транзакции.
+        cur.execute(
+            """
+            SELECT set_config('hnsw.ef_search', %s, true),
+                set_config('ivfflat.probes', %s, true)
+            """,
+            (str(settings.HNSW_EF_SEARCH), str(settings.IVFFLAT_PROBES)),
+        )
+        if timeout is not None:
+            cur.execute(
+                "SELECT set_config('statement_timeout', %s, true)",
+                (str(max(1, int(timeout * 1000))),),
+            )
+        if settings.HNSW_ITERATIVE_SCAN and pgvector_version(conn) >= (0, 8, 0):
+            cur.execute(
+                "SELECT set_config('hnsw.iterative_scan', %s, true)",
+                (settings.HNSW_ITERATIVE_SCAN,),
+            )
@@ -9,7 +9,14 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.
 from app.main import app  # noqa: E402
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def client():
-    """Фикстура для создания тестового клиента"""
-    return TestClient(app)
+    """
+    Фикстура для создания тестового клиента.
+
+    Пул асинхронного движка привязан к циклу событий, в котором открыты его
+    соединения. Без контекста TestClient запускает новый цикл на каждый запрос,
+    поэтому все тесты используют один клиент с общим циклом.
+    """
+    with TestClient(app) as client:
+        yield client
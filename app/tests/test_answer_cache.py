@@ -0,0 +1,80 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.services.answer_cache import SemanticAnswerCache  # noqa: E402
+
+
+def make_cache(**kwargs):
+    """Создает кеш с небольшими параметрами для тестов"""
+    params = {"max_entries": 8, "ttl": 60, "threshold": 0.95}
+    params.update(kwargs)
+    return SemanticAnswerCache(**params)
+
+
+def test_answer_cache_hit():
+    """Тест попадания в кеш по близкому запросу к той же версии хранилища"""
+    cache = make_cache()
+    cache.put(1, 3, [1.0, 0.0], b"answer")
+
+    assert cache.get(1, 3, [1.0, 0.01]) == b"answer"
+
+
+def test_answer_cache_miss():
+    """Тест промаха для другого хранилища, фильтра или модели"""
+    cache = make_cache()
+    cache.put(1, 3, [1.0, 0.0], b"answer", {"page": 1}, "model-a")
+
+    assert cache.get(2, 3, [1.0, 0.0], {"page": 1}, "model-a") is None
+    assert cache.get(1, 3, [1.0, 0.0], {"page": 2}, "model-a") is None
+    assert cache.get(1, 3, [1.0, 0.0], {"page": 1}, "model-b") is None
+    assert cache.get(1, 3, [1.0, 0.0], {"page": 1}, "model-a") == b"answer"
+
+
+def test_answer_cache_threshold():
+    """Тест порога косинусного сходства"""
+    cache = make_cache(threshold=0.9)
+    cache.put(1, 0, [1.0, 0.0], b"answer")
+
+    # cos = 0.8 ниже порога
+    assert cache.get(1, 0, [0.8, 0.6]) is None
+    # cos ~ 0.995 выше порога, длина вектора не важна
+    assert cache.get(1, 0, [10.0, 1.0]) == b"answer"
+
+
+def test_answer_cache_version_invalidation():
+    """Тест: ответы прежней версии хранилища не находятся и без invalidate"""
+    cache = make_cache()
+    cache.put(1, 3, [1.0, 0.0], b"old")
+
+    # Версию увеличила запись другого процесса, локальный invalidate не вызывался
+    assert cache.get(1, 4, [1.0, 0.0]) is None
+
+    cache.put(1, 4, [1.0, 0.0], b"new")
+    assert cache.get(1, 4, [1.0, 0.0]) == b"new"
+
+
+def test_answer_cache_invalidate():
+    """Тест удаления ответов по хранилищу в текущем процессе"""
+    cache = make_cache()
+    cache.put(1, 3, [1.0, 0.0], b"first")
+    cache.put(2, 3, [1.0, 0.0], b"second")
+
+    cache.invalidate(1)
+
+    assert cache.get(1, 3, [1.0, 0.0]) is None
+    assert cache.get(2, 3, [1.0, 0.0]) == b"second"
+
+
+def test_answer_cache_eviction_and_ttl():
+    """Тест вытеснения по размеру и истечения срока записей"""
+    cache = make_cache(max_entries=1)
+    cache.put(1, 0, [1.0, 0.0], b"first")
+    cache.put(1, 0, [0.0, 1.0], b"second")
+    assert cache.get(1, 0, [1.0, 0.0]) is None
+    assert cache.get(1, 0, [0.0, 1.0]) == b"second"
+
+    cache = make_cache(ttl=0)
+    cache.put(1, 0, [1.0, 0.0], b"answer")
+    assert cache.get(1, 0, [1.0, 0.0]) is None
@@ -0,0 +1,90 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.services.context_packing import (  # noqa: E402
+    pack_context,
+    prune_near_duplicates,
+)
+from app.services.embeddings import DeterministicFakeEmbeddings  # noqa: E402
+
+
+def candidate(content, embedding, similarity=0.9):
+    """Создает результат поиска с эмбеддингом"""
+    return {"content": content, "embedding": embedding, "similarity": similarity}
+
+
+def test_prune_near_duplicates():
+    """Тест удаления кандидатов, почти совпадающих с более релевантными"""
+    candidates = [
+        candidate("a", [1.0, 0.0]),
+        candidate("a'", [0.99, 0.05]),
+        candidate("b", [0.0, 1.0]),
+        candidate("zero", [0.0, 0.0]),
+    ]
+
+    kept = prune_near_duplicates(candidates, 0.95)
+
+    assert [c["content"] for c in kept] == ["a", "b", "zero"]
+
+
+def test_prune_near_duplicates_short_lists():
+    """Тест списков из нуля и одного кандидата"""
+    assert prune_near_duplicates([], 0.95) == []
+    single = [candidate("a", [1.0, 0.0])]
+    assert prune_near_duplicates(single, 0.95) == single
+
+
+def test_pack_context_budget():
+    """Тест укладки кандидатов в бюджет токенов по убыванию сходства"""
+    model = DeterministicFakeEmbeddings(size=8)
+    candidates = [
+        candidate("one two three four", [1.0, 0.0, 0.0]),
+        candidate("one two three four five six seven eight", [0.0, 1.0, 0.0]),
+        candidate("one", [0.0, 0.0, 1.0]),
+    ]
+
+    packed, stats = pack_context(model, candidates, 10, 0.95)
+
+    # Оценка по словам: 6, 10 и 3 токена; второй кандидат не помещается.
+    assert [c["content"] for c in packed] == ["one two three four", "one"]
+    assert stats == {
+        "tokens_before": 19,
+        "tokens_after": 9,
+        "duplicates_removed": 0,
+        "over_budget": 1,
+    }
+
+
+def test_pack_context_keeps_first_candidate_over_budget():
+    """Тест: самый релевантный кандидат остается, даже если превышает бюджет"""
+    model = DeterministicFakeEmbeddings(size=8)
+    candidates = [candidate("one two three four five", [1.0, 0.0])]
+
+    packed, stats = pack_context(model, candidates, 1, 0.95)
+
+    assert packed == candidates
+    assert stats["over_budget"] == 0
+
+
+def test_pack_context_empty():
+    """Тест пустого результата поиска с токенизатором HuggingFace"""
+
+    def tokenizer(texts, **kwargs):
+        # Быстрый токенизатор падает на пустом батче.
+        texts[0]
+        return {"input_ids": [[0] * len(text.split()) for text in texts]}
+
+    model = SimpleNamespace(_client=SimpleNamespace(tokenizer=tokenizer))
+
+    packed, stats = pack_context(model, [], 100, 0.95)
+
+    assert packed == []
+    assert stats == {
+        "tokens_before": 0,
+        "tokens_after": 0,
+        "duplicates_removed": 0,
+        "over_budget": 0,
+    }
@@ -1,12 +1,17 @@
+import base64
+import json
 import os
 import random
 import string
 import sys
 
+import msgpack
+import numpy as np
 from fastapi.testclient import TestClient
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
+from app.config import settings  # noqa: E402
 from app.main import app  # noqa: E402
 
 client = TestClient(app)
@@ -84,3 +89,258 @@ def test_create_vectorstore(client):
     assert data["file_name"] == "test_file.txt"
     assert "vectorstore_id" in data
     assert data["user_id"] == user_id
+
+
+def test_read_metrics(client):
+    """Тест получения метрик процесса"""
+    response = client.get("/api/v1/service/metrics")
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert "counters" in data
+    assert "gauges" in data
+
+
+def test_update_vectorstore(client):
+    """Тест обновления векторного хранилища новой версией файла"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/",
+        json={"file_name": "test_file.txt", "text": "First version"},
+    )
+    assert response.status_code == 201, response.text
+    vectorstore_id = response.json()["vectorstore_id"]
+
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/update_vectorstore/",
+        json={"file_name": "test_file.txt", "text": "Second version"},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["vectorstore_id"] == vectorstore_id
+    assert data["added"] == 1
+    assert data["removed"] == 1
+
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/update_vectorstore/",
+        json={"file_name": "test_file.txt", "text": "Second version"},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["added"] == 0
+    assert data["removed"] == 0
+    assert data["unchanged"] == 1
+
+
+def test_create_duplicate_vectorstore(client):
+    """Тест создания векторного хранилища с уже существующим file_name"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    vs_payload = {"file_name": "test_file.txt", "text": "Test content"}
+
+    response1 = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/", json=vs_payload
+    )
+    assert response1.status_code == 201, response1.text
+
+    response2 = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/", json=vs_payload
+    )
+    assert response2.status_code == 400, response2.text
+
+
+def test_read_load(client):
+    """Тест получения загрузки ограничителей"""
+    response = client.get("/api/v1/service/load")
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["ingestion"]["waiting"] >= 0
+    assert data["query"]["waiting"] >= 0
+
+
+def test_rag_query_invalid_metadata_filter(client):
+    """Тест RAG-запроса с некорректным фильтром по метаданным"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/",
+        json={"file_name": "test_file.txt", "text": "Test content"},
+    )
+
+    response = client.post(
+        f"/api/v1/vectorstores/{telegram_id}/rag_query/",
+        json={
+            "query": "test",
+            "file_name": "test_file.txt",
+            "metadata_filter": {"page": {"$unknown": 1}},
+        },
+    )
+    assert response.status_code == 400, response.text
+
+
+def test_export_vectorstore(client):
+    """Тест потоковой выгрузки документов хранилища"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/",
+        json={"file_name": "test_file.txt", "text": "Test content"},
+    )
+    vectorstore_id = response.json()["vectorstore_id"]
+
+    response = client.get(
+        f"/api/v1/vectorstores/{vectorstore_id}/export",
+        params={"include_embeddings": True},
+    )
+    assert response.status_code == 200, response.text
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["content"] == "Test content"
+    assert lines[0]["metadata"]["file_name"] == "test_file.txt"
+    assert len(base64.b64decode(lines[0]["embedding"])) == 1024 * 4
+
+
+def test_read_memory(client):
+    """Тест получения потребления памяти воркера"""
+    response = client.get("/api/v1/service/memory")
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["pid"] > 0
+    assert data["rss"] > 0
+
+
+def test_search_user_vectorstores(client):
+    """Тест поиска по всем файлам пользователя"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    for file_name, text in [
+        ("cats.txt", "Cats are small domestic animals"),
+        ("rockets.txt", "Rockets use liquid fuel to reach orbit"),
+    ]:
+        response = client.post(
+            f"/api/v1/users/{telegram_id}/create_vectorstore/",
+            json={"file_name": file_name, "text": text},
+        )
+        assert response.status_code == 201, response.text
+
+    response = client.post(
+        f"/api/v1/vectorstores/{telegram_id}/search/",
+        json={"query": "domestic cats", "k": 2},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert len(data) == 2
+    assert {result["file_name"] for result in data} == {"cats.txt", "rockets.txt"}
+
+
+def test_search_user_vectorstores_msgpack(client):
+    """Тест поиска по всем файлам пользователя с ответом в MessagePack"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/",
+        json={"file_name": "cats.txt", "text": "Cats are small domestic animals"},
+    )
+    assert response.status_code == 201, response.text
+
+    response = client.post(
+        f"/api/v1/vectorstores/{telegram_id}/search/",
+        json={"query": "domestic cats", "k": 1, "include_embeddings": True},
+        headers={"Accept": "application/x-msgpack"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-msgpack"
+    data = msgpack.unpackb(response.content)
+    assert data[0]["file_name"] == "cats.txt"
+    assert np.frombuffer(data[0]["embedding"], dtype="<f4").shape == (1024,)
+
+
+def test_list_vectorstores(client):
+    """Тест получения списка векторных хранилищ пользователя"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/",
+        json={"file_name": "test_file.txt", "text": "Test content"},
+    )
+    assert response.status_code == 201, response.text
+    vectorstore_id = response.json()["vectorstore_id"]
+
+    response = client.get(
+        f"/api/v1/users/{telegram_id}/vectorstores",
+        params={"consistent_read": True},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [vs["vectorstore_id"] for vs in data] == [vectorstore_id]
+    assert data[0]["file_name"] == "test_file.txt"
+
+    response = client.get(f"/api/v1/users/{random_telegram_id()}/vectorstores")
+    assert response.status_code == 404, response.text
+
+
+def test_delete_vectorstore(client):
+    """Тест удаления векторного хранилища"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    vs_payload = {"file_name": "test_file.txt", "text": "Test content"}
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/", json=vs_payload
+    )
+    assert response.status_code == 201, response.text
+    vectorstore_id = response.json()["vectorstore_id"]
+
+    response = client.delete(f"/api/v1/users/{telegram_id}/vectorstores/test_file.txt")
+    assert response.status_code == 202, response.text
+    assert response.json()["vectorstore_ids"] == [vectorstore_id]
+
+    response = client.get(f"/api/v1/vectorstores/{vectorstore_id}/export")
+    assert response.status_code == 404, response.text
+
+    # Имя файла освобождается сразу после удаления
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/", json=vs_payload
+    )
+    assert response.status_code == 201, response.text
+
+
+def test_delete_user(client):
+    """Тест удаления пользователя вместе с хранилищами"""
+    telegram_id = random_telegram_id()
+    response = client.post(
+        "/api/v1/users/create_user/", json={"telegram_id": telegram_id}
+    )
+    assert response.status_code == 201, response.text
+    user_id = response.json()["user_id"]
+    client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/",
+        json={"file_name": "test_file.txt", "text": "Test content"},
+    )
+
+    response = client.delete(f"/api/v1/users/{telegram_id}")
+    assert response.status_code == 202, response.text
+    assert len(response.json()["vectorstore_ids"]) == 1
+
+    response = client.get(f"/api/v1/users/{user_id}")
+    assert response.status_code == 404, response.text
+
+
+def test_list_profiles(client, monkeypatch):
+    """Тест получения списка профилей медленных запросов"""
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "")
+    response = client.get(
+        "/api/v1/service/profiles", headers={"X-Admin-Token": "anything"}
+    )
+    assert response.status_code == 403, response.text
+
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+    response = client.get("/api/v1/service/profiles", headers={"X-Admin-Token": "x"})
+    assert response.status_code == 403, response.text
+
+    headers = {"X-Admin-Token": "secret"}
+    response = client.get("/api/v1/service/profiles", headers=headers)
+    assert response.status_code == 200, response.text
+    assert isinstance(response.json(), list)
+
+    response = client.get("/api/v1/service/profiles/missing.folded", headers=headers)
+    assert response.status_code == 404, response.text
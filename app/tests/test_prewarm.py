@@ -0,0 +1,93 @@
+import os
+import random
+import string
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.config import settings  # noqa: E402
+from app.services import prewarm as prewarm_module  # noqa: E402
+from app.services.db import pooled_connection  # noqa: E402
+from app.services.prewarm import PREWARM_LOCK_KEY, prewarm, prewarm_all  # noqa: E402
+
+
+def random_telegram_id():
+    """Генерирует случайный telegram_id для тестов"""
+    return "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+
+def create_vectorstore(client):
+    """Создает пользователя и хранилище, возвращает ID хранилища"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/",
+        json={"file_name": "test_file.txt", "text": "Test content"},
+    )
+    assert response.status_code == 201, response.text
+    return response.json()["vectorstore_id"]
+
+
+def test_prewarm_recent_vectorstore(client):
+    """Тест прогрева недавно созданного хранилища"""
+    vectorstore_id = create_vectorstore(client)
+
+    result = prewarm(budget_mb=1024, limit=1000, strategy="recent")
+
+    assert vectorstore_id in result["vectorstore_ids"]
+    assert result["bytes"] > 0
+
+
+def test_prewarm_skips_vectorstores_over_budget(client):
+    """Тест: хранилища, не помещающиеся в бюджет, не читаются"""
+    create_vectorstore(client)
+
+    result = prewarm(budget_mb=1 / 1024 / 1024, limit=1000, strategy="recent")
+
+    # Бюджет в один байт не вмещает ни одного хранилища.
+    assert result["vectorstore_ids"] == []
+    assert result["skipped_vectorstore_ids"]
+    assert result["bytes"] <= 1
+
+
+def test_prewarm_skips_locked_target():
+    """Тест: сервер, который уже прогревает другой процесс, пропускается"""
+    with pooled_connection(settings.DATABASE_CONNECTION_CONFIG) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (PREWARM_LOCK_KEY,))
+        conn.commit()
+        try:
+            # prewarm берет другое соединение пула, то есть другую сессию.
+            assert prewarm(budget_mb=1) is None
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (PREWARM_LOCK_KEY,))
+            conn.commit()
+
+
+def test_prewarm_all_targets(monkeypatch):
+    """Тест прогрева основного сервера и каждой реплики"""
+    monkeypatch.setattr(
+        settings,
+        "DB_REPLICA_URLS",
+        "postgresql://replica-1/db, postgresql://replica-2/db",
+    )
+    calls = []
+
+    def fake_prewarm(budget_mb, limit, strategy, connection_config, target):
+        calls.append((connection_config, target))
+        if target == "реплика 0":
+            raise ConnectionError("реплика недоступна")
+        return {"target": target}
+
+    monkeypatch.setattr(prewarm_module, "prewarm", fake_prewarm)
+
+    results = prewarm_all(budget_mb=16, limit=5, strategy="recent")
+
+    assert [config for config, _ in calls] == [
+        settings.DATABASE_CONNECTION_CONFIG,
+        {"dsn": "postgresql://replica-1/db"},
+        {"dsn": "postgresql://replica-2/db"},
+    ]
+    # Недоступная реплика не мешает прогреву следующей.
+    assert results == [{"target": "основной сервер"}, None, {"target": "реплика 1"}]
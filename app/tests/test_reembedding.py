@@ -0,0 +1,143 @@
+import os
+import random
+import string
+import sys
+from typing import List
+
+from langchain.embeddings.base import Embeddings
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.api.dependencies import get_vectorstore_service  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.services import reembedding  # noqa: E402
+from app.services.db import pooled_connection  # noqa: E402
+from app.services.embeddings import DeterministicFakeEmbeddings  # noqa: E402
+
+NEW_MODEL = "test/reembedding-model"
+
+
+class ConstantEmbeddings(Embeddings):
+    """Модель, возвращающая один и тот же вектор для любого текста"""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [[1.0] + [0.0] * 1023 for _ in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def random_telegram_id():
+    """Генерирует случайный telegram_id для тестов"""
+    return "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+
+def create_vectorstore(client, text):
+    """Создает пользователя и хранилище, возвращает ID хранилища"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/",
+        json={"file_name": "test_file.txt", "text": text},
+    )
+    assert response.status_code == 201, response.text
+    return response.json()["vectorstore_id"]
+
+
+def fetch_one(query, params):
+    """Выполняет запрос к основному серверу и возвращает первую строку"""
+    with pooled_connection(settings.DATABASE_CONNECTION_CONFIG) as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            row = cur.fetchone()
+        conn.commit()
+    return row
+
+
+def test_model_for(monkeypatch):
+    """Тест выбора модели по vectorstores.embedding_model"""
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL_TYPE", "fake")
+    service = get_vectorstore_service()
+
+    assert service.model_for(None) is service.embedding_model
+    assert service.model_for(settings.EMBEDDING_MODEL_NAME) is service.embedding_model
+    other = service.model_for("test/model-for")
+    assert isinstance(other, DeterministicFakeEmbeddings)
+    assert service.model_for("test/model-for") is other
+
+
+def test_reembedding_shadow_table_and_cutover(client):
+    """Тест: эмбеддинги пишутся в теневую таблицу и переносятся при переключении"""
+    text = "Первый абзац документа. " * 200
+    vectorstore_id = create_vectorstore(client, text)
+    document_count = fetch_one(
+        "SELECT document_count FROM vectorstores WHERE vectorstore_id = %s",
+        (vectorstore_id,),
+    )[0]
+    assert document_count > 1
+    model = ConstantEmbeddings()
+
+    # Один батч: новые эмбеддинги только в теневой таблице, поиск не затронут.
+    with pooled_connection(settings.DATABASE_CONNECTION_CONFIG) as conn:
+        with conn.cursor() as cur:
+            reembedding._start_job(cur, vectorstore_id, NEW_MODEL)
+            written = reembedding._reembed_batch(
+                cur, vectorstore_id, NEW_MODEL, model, 1
+            )
+        conn.commit()
+    assert written == 1
+    shadow, changed = fetch_one(
+        """
+        SELECT
+            (SELECT count(*) FROM document_embeddings_shadow
+             WHERE vectorstore_id = %s),
+            (SELECT count(*) FROM documents
+             WHERE vectorstore_id = %s AND embedding = %s::vector)
+        """,
+        (vectorstore_id, vectorstore_id, model.embed_query("")),
+    )
+    assert (shadow, changed) == (1, 0)
+
+    job = reembedding.reembed_vectorstore(
+        vectorstore_id, NEW_MODEL, model, batch_size=2, throttle_ms=0
+    )
+
+    assert job["status"] == "complete"
+    assert job["embedding_model"] == NEW_MODEL
+    assert job["documents_done"] == document_count
+    shadow, changed = fetch_one(
+        """
+        SELECT
+            (SELECT count(*) FROM document_embeddings_shadow
+             WHERE vectorstore_id = %s),
+            (SELECT count(*) FROM documents
+             WHERE vectorstore_id = %s AND embedding = %s::vector)
+        """,
+        (vectorstore_id, vectorstore_id, model.embed_query("")),
+    )
+    assert (shadow, changed) == (0, document_count)
+
+
+def test_reembed_all_picks_up_new_vectorstores(client, monkeypatch):
+    """Тест: хранилища, созданные во время пересчета, тоже переводятся"""
+    first_id = create_vectorstore(client, "Test content")
+    created: List[int] = []
+    calls: List[int] = []
+
+    def fake_reembed_vectorstore(vectorstore_id, *args):
+        calls.append(vectorstore_id)
+        if not created:
+            created.append(create_vectorstore(client, "Test content"))
+        if vectorstore_id == first_id:
+            raise reembedding.ReembeddingError("ошибка пересчета")
+        return {"vectorstore_id": vectorstore_id}
+
+    monkeypatch.setattr(reembedding, "load_model", lambda name: ConstantEmbeddings())
+    monkeypatch.setattr(reembedding, "reembed_vectorstore", fake_reembed_vectorstore)
+
+    jobs = reembedding.reembed_all(NEW_MODEL + "-all")
+
+    assert created[0] in calls
+    # Хранилище с ошибкой выбирается один раз и не попадает в результат.
+    assert calls.count(first_id) == 1
+    assert first_id not in [job["vectorstore_id"] for job in jobs]
@@ -0,0 +1,208 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.services import resilience  # noqa: E402
+from app.services.metrics import metrics  # noqa: E402
+from app.services.resilience import (  # noqa: E402
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CircuitBreaker,
+    CircuitOpen,
+    Deadline,
+    retry_with_backoff,
+)
+
+
+class TemporaryError(Exception):
+    """Ошибка, после которой обращение можно повторить"""
+
+
+class FakeClock:
+    """Управляемые часы для проверки reset_timeout"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Подменяет time.monotonic в модуле resilience"""
+    fake = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", fake)
+    return fake
+
+
+def circuit_state_gauge(name):
+    """Значение gauge-метрики состояния цепи"""
+    return metrics.snapshot()["gauges"][f"circuit_{name}_state"]
+
+
+def test_circuit_breaker_opens_after_failures(clock):
+    """Тест: цепь размыкается после failure_threshold отказов подряд"""
+    breaker = CircuitBreaker("test_open", failure_threshold=2, reset_timeout=10)
+
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_CLOSED
+    breaker.allow()
+    breaker.record_success()
+    breaker.allow()
+    breaker.record_failure()
+    # Успех сбрасывает счетчик, поэтому цепь все еще замкнута.
+    assert breaker.state == CIRCUIT_CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    assert circuit_state_gauge("test_open") == 2
+    clock.now += 4
+    with pytest.raises(CircuitOpen) as exc_info:
+        breaker.allow()
+    assert exc_info.value.retry_after == 6
+
+
+def test_circuit_breaker_half_open_probe(clock):
+    """Тест переходов: разомкнута -> полуоткрыта -> разомкнута -> замкнута"""
+    breaker = CircuitBreaker("test_probe", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+
+    clock.now += 10
+    breaker.allow()
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert circuit_state_gauge("test_probe") == 1
+    # Пока выполняется пробный запрос, остальные отклоняются.
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    clock.now += 10
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.failures == 0
+    assert circuit_state_gauge("test_probe") == 0
+    breaker.allow()
+
+
+def test_circuit_breaker_stale_probe(clock):
+    """Тест: пробный запрос без record_* не блокирует цепь дольше reset_timeout"""
+    breaker = CircuitBreaker("test_stale", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.allow()
+
+    clock.now += 10
+    breaker.allow()
+    assert breaker.state == CIRCUIT_HALF_OPEN
+
+
+def test_retry_with_backoff_succeeds_after_retries():
+    """Тест повторов до успешной попытки"""
+    calls = []
+
+    async def fn():
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise TemporaryError()
+        return "ok"
+
+    result = asyncio.run(
+        retry_with_backoff(
+            fn,
+            Deadline(5),
+            attempts=3,
+            base_delay=0.001,
+            max_delay=0.01,
+            retryable=(TemporaryError,),
+            name="test",
+        )
+    )
+
+    assert result == "ok"
+    assert len(calls) == 3
+
+
+def test_retry_with_backoff_stops_after_attempts():
+    """Тест: после attempts попыток исключение пробрасывается"""
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        raise TemporaryError()
+
+    with pytest.raises(TemporaryError):
+        asyncio.run(
+            retry_with_backoff(
+                fn,
+                Deadline(5),
+                attempts=2,
+                base_delay=0.001,
+                max_delay=0.01,
+                retryable=(TemporaryError,),
+                name="test",
+            )
+        )
+    assert len(calls) == 2
+
+
+def test_retry_with_backoff_respects_deadline(monkeypatch):
+    """Тест: пауза, не укладывающаяся в оставшийся срок, не выполняется"""
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        raise TemporaryError()
+
+    started = time.monotonic()
+    with pytest.raises(TemporaryError):
+        asyncio.run(
+            retry_with_backoff(
+                fn,
+                Deadline(0.5),
+                attempts=5,
+                base_delay=1,
+                max_delay=1,
+                retryable=(TemporaryError,),
+                name="test",
+            )
+        )
+    assert len(calls) == 1
+    assert time.monotonic() - started < 0.5
+
+
+def test_retry_with_backoff_does_not_retry_other_errors():
+    """Тест: неповторяемые ошибки пробрасываются сразу"""
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        asyncio.run(
+            retry_with_backoff(
+                fn,
+                Deadline(5),
+                attempts=3,
+                base_delay=0.001,
+                max_delay=0.01,
+                retryable=(TemporaryError,),
+                name="test",
+            )
+        )
+    assert len(calls) == 1
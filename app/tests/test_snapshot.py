@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.config import settings  # noqa: E402
+from app.services.snapshot import (  # noqa: E402
+    SNAPSHOT_FORMAT_VERSION,
+    SnapshotError,
+    _validate_manifest,
+    embedding_dimension,
+)
+
+
+def make_manifest(vectorstores, **kwargs):
+    """Создает манифест снапшота с текущей размерностью"""
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "dimension": embedding_dimension(),
+        "vectorstores": vectorstores,
+    }
+    manifest.update(kwargs)
+    return manifest
+
+
+def test_validate_manifest_per_vectorstore_model(monkeypatch):
+    """Тест: модель берется из хранилища, для старых снапшотов — из манифеста"""
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL_TYPE", "fake")
+    manifest = make_manifest(
+        [
+            {"vectorstore_id": 1},
+            {"vectorstore_id": 2, "embedding_model": "test/snapshot-model"},
+        ],
+        embedding_model="test/previous-model",
+    )
+
+    _validate_manifest(manifest)
+
+    assert [vs["embedding_model"] for vs in manifest["vectorstores"]] == [
+        "test/previous-model",
+        "test/snapshot-model",
+    ]
+
+
+def test_validate_manifest_rejects_unavailable_model(monkeypatch):
+    """Тест: хранилище с моделью, которую нельзя загрузить, не восстанавливается"""
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL_TYPE", "embedding_server")
+    manifest = make_manifest(
+        [
+            {"vectorstore_id": 1, "embedding_model": settings.EMBEDDING_MODEL_NAME},
+            {"vectorstore_id": 2, "embedding_model": "test/unavailable-model"},
+        ],
+        embedding_model=settings.EMBEDDING_MODEL_NAME,
+    )
+
+    with pytest.raises(SnapshotError, match="test/unavailable-model"):
+        _validate_manifest(manifest)
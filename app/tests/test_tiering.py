@@ -0,0 +1,171 @@
+import os
+import random
+import string
+import sys
+
+import numpy as np
+import pytest
+import zstandard
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.api.dependencies import get_vectorstore_service  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.services.db import pooled_connection  # noqa: E402
+from app.services.tiering import (  # noqa: E402
+    TieringError,
+    _verify_archive,
+    archive_vectorstore,
+)
+from app.services.vectorstore import split_text  # noqa: E402
+
+TEXT = "Кошки любят спать на солнце. " * 60 + "Собаки любят гулять в парке. " * 60
+
+
+def random_telegram_id():
+    """Генерирует случайный telegram_id для тестов"""
+    return "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+
+def storage_state(vectorstore_id):
+    """Возвращает уровень хранения и количество строк в documents"""
+    with pooled_connection(settings.DATABASE_CONNECTION_CONFIG) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT storage_tier,
+                    (SELECT count(*) FROM documents WHERE vectorstore_id = %s)
+                FROM vectorstores WHERE vectorstore_id = %s
+                """,
+                (vectorstore_id, vectorstore_id),
+            )
+            row = cur.fetchone()
+        conn.commit()
+    return row
+
+
+def test_archive_search_rehydrate_upload(client):
+    """Тест: архивирование, поиск с восстановлением и повторная загрузка файла"""
+    telegram_id = random_telegram_id()
+    client.post("/api/v1/users/create_user/", json={"telegram_id": telegram_id})
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/create_vectorstore/",
+        json={"file_name": "test_file.txt", "text": TEXT},
+    )
+    assert response.status_code == 201, response.text
+    vectorstore_id = response.json()["vectorstore_id"]
+    document_count = response.json()["document_count"]
+    service = get_vectorstore_service()
+
+    assert archive_vectorstore(
+        vectorstore_id, connection_config=service.connection_config
+    )
+    assert storage_state(vectorstore_id) == ("archived", 0)
+
+    # Поиск восстанавливает хранилище и находит документы.
+    results = service.similarity_search(vectorstore_id, "кошки", k=3, consistent=True)
+    assert results
+    assert storage_state(vectorstore_id) == ("hot", document_count)
+
+    # Повторная загрузка того же файла в архивное хранилище ничего не меняет.
+    assert archive_vectorstore(
+        vectorstore_id, connection_config=service.connection_config
+    )
+    response = client.post(
+        f"/api/v1/users/{telegram_id}/update_vectorstore/",
+        json={"file_name": "test_file.txt", "text": TEXT},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert (data["added"], data["removed"]) == (0, 0)
+    assert storage_state(vectorstore_id) == ("hot", document_count)
+
+
+def test_upload_rechecks_tier_under_lock(client):
+    """Тест: хранилище, архивированное после ensure_hot, восстанавливается"""
+    response = client.post(
+        "/api/v1/users/create_user/", json={"telegram_id": random_telegram_id()}
+    )
+    assert response.status_code == 201, response.text
+    user_id = response.json()["user_id"]
+    service = get_vectorstore_service()
+    texts = split_text(TEXT)
+    vectorstore_id = service.create_vectorstore_with_texts(
+        user_id, "test_file.txt", texts
+    )["vectorstore_id"]
+    assert archive_vectorstore(
+        vectorstore_id, connection_config=service.connection_config
+    )
+
+    # Первый вызов ensure_hot ничего не делает, как если бы архивирование
+    # произошло сразу после него.
+    ensure_hot = service.ensure_hot
+    calls = []
+
+    def ensure_hot_after_first_call(vectorstore_id):
+        calls.append(vectorstore_id)
+        return len(calls) > 1 and ensure_hot(vectorstore_id)
+
+    service.ensure_hot = ensure_hot_after_first_call
+
+    result = service.update_texts(vectorstore_id, texts)
+    assert (result["added"], result["removed"]) == (0, 0)
+    assert len(calls) == 2
+
+    doc_ids = service.add_texts(vectorstore_id, ["Новый абзац про птиц."])
+    assert len(doc_ids) == 1
+    assert storage_state(vectorstore_id) == ("hot", len(texts) + 1)
+
+
+def test_search_fallback_skips_archived_vectorstores(client):
+    """Тест: добор результатов по всем файлам не восстанавливает архивные хранилища"""
+    telegram_id = random_telegram_id()
+    response = client.post(
+        "/api/v1/users/create_user/", json={"telegram_id": telegram_id}
+    )
+    user_id = response.json()["user_id"]
+    vectorstore_ids = []
+    for file_name, text in [
+        ("cats.txt", "Кошки любят спать на солнце."),
+        ("dogs.txt", "Собаки любят гулять в парке."),
+    ]:
+        response = client.post(
+            f"/api/v1/users/{telegram_id}/create_vectorstore/",
+            json={"file_name": file_name, "text": text},
+        )
+        assert response.status_code == 201, response.text
+        vectorstore_ids.append(response.json()["vectorstore_id"])
+    cats_id, dogs_id = vectorstore_ids
+    service = get_vectorstore_service()
+    assert archive_vectorstore(dogs_id, connection_config=service.connection_config)
+
+    # В top_m = 1 попадает только cats.txt, и результатов меньше k.
+    results = service.search_user_vectorstores(
+        user_id, "Кошки любят спать на солнце.", k=10, consistent=True, top_m=1
+    )
+
+    assert [result["vectorstore_id"] for result in results] == [cats_id]
+    assert storage_state(dogs_id) == ("archived", 0)
+
+
+def compress_archive(documents, embeddings):
+    """Сжимает документ и вектор, чередуя потоки, как archive_vectorstore"""
+    documents_data = [documents.compress(b'{"doc_id": 1}\n')]
+    embeddings_data = [embeddings.compress(np.ones(4, dtype=np.float16).tobytes())]
+    documents_data.append(documents.flush())
+    embeddings_data.append(embeddings.flush())
+    return b"".join(documents_data), b"".join(embeddings_data)
+
+
+def test_verify_archive_rejects_shared_compressor():
+    """Тест: архив из двух потоков одного ZstdCompressor не проходит проверку"""
+    compressor = zstandard.ZstdCompressor()
+    archive = compress_archive(compressor.compressobj(), compressor.compressobj())
+    with pytest.raises(TieringError):
+        _verify_archive(*archive, 1, 4)
+
+    archive = compress_archive(
+        zstandard.ZstdCompressor().compressobj(),
+        zstandard.ZstdCompressor().compressobj(),
+    )
+    _verify_archive(*archive, 1, 4)
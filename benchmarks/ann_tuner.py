@@ -0,0 +1,349 @@
+"""
+Подбор параметров ANN-индекса по полноте (recall@k) и задержке поиска.
+
+Загружает корпус во временную базу через add_texts, считает точные
+ближайшие соседи в NumPy и для каждой комбинации параметров строит индекс
+(HNSW: m, ef_construction; IVFFlat: lists), после чего прогоняет запросы через
+similarity_search_by_vector с разными ef_search / probes. В отчете —
+recall@k, p50/p95 задержки, время построения и размер индекса, а также
+самая быстрая по p95 конфигурация с полнотой не ниже целевой.
+
+Пример:
+    python -m benchmarks.ann_tuner --documents 20000 --target-recall 0.95
+    python -m benchmarks.ann_tuner --corpus docs.txt --model sentence_transformers
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import psycopg2
+
+from app.config import settings
+from benchmarks.common import LatencyStats, disposable_database
+from benchmarks.load_test import Corpus
+
+INDEX_NAME = "ix_ann_tuner"
+
+
+@dataclass
+class AnnResult:
+    index: str
+    build_params: Dict[str, int]
+    search_param: str
+    search_value: int
+    recall: float
+    p50_ms: float
+    p95_ms: float
+    build_seconds: float
+    index_mb: float
+    index_used: bool
+
+
+def parse_ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def load_texts(args, corpus: Corpus) -> Tuple[List[str], List[str]]:
+    if args.corpus:
+        with open(args.corpus) as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = [
+            corpus.text(min_words=50, max_words=200) for _ in range(args.documents)
+        ]
+
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = [corpus.query() for _ in range(args.query_count)]
+    return texts, queries
+
+
+def exact_neighbors(
+    embeddings: np.ndarray, queries: np.ndarray, k: int
+) -> List[Set[int]]:
+    """
+    Точные k ближайших соседей по косинусному расстоянию.
+
+    Args:
+        embeddings: Матрица эмбеддингов документов
+        queries: Матрица эмбеддингов запросов
+        k: Количество соседей
+
+    Returns:
+        Индексы строк embeddings для каждого запроса
+    """
+    documents = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    similarities = queries @ documents.T
+    k = min(k, len(documents))
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+
+def build_index(
+    conn, index: str, params: Dict[str, int], maintenance_work_mem: str
+) -> Tuple[float, float]:
+    """
+    Строит индекс на documents.embedding.
+
+    Returns:
+        Время построения в секундах и размер индекса в МБ
+    """
+    with_clause = ", ".join(f"{name} = {int(value)}" for name, value in params.items())
+    with conn.cursor() as cur:
+        cur.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+        cur.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+        started = time.perf_counter()
+        cur.execute(
+            f"""
+            CREATE INDEX {INDEX_NAME} ON documents
+            USING {index} (embedding vector_cosine_ops)
+            WITH ({with_clause})
+            """
+        )
+        build_seconds = time.perf_counter() - started
+        cur.execute("ANALYZE documents")
+        cur.execute("SELECT pg_relation_size(%s::regclass)", (INDEX_NAME,))
+        size = cur.fetchone()[0]
+    return build_seconds, size / 1024 / 1024
+
+
+def index_used(conn, vectorstore_id: int, query: List[float], k: int) -> bool:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            EXPLAIN (FORMAT JSON)
+            SELECT doc_id FROM documents
+            WHERE vectorstore_id = %s
+            ORDER BY embedding <=> %s::vector
+            LIMIT %s
+            """,
+            (vectorstore_id, str(query), k),
+        )
+        plan = json.dumps(cur.fetchone()[0])
+    return INDEX_NAME in plan
+
+
+def measure(
+    service,
+    vectorstore_id: int,
+    query_embeddings: List[List[float]],
+    truth: List[Set[int]],
+    doc_rows: Dict[int, int],
+    k: int,
+) -> Tuple[float, LatencyStats]:
+    latencies, hits = [], 0
+    started = time.perf_counter()
+    for embedding, expected in zip(query_embeddings, truth):
+        query_started = time.perf_counter()
+        results = service.similarity_search_by_vector(vectorstore_id, embedding, k)
+        latencies.append(time.perf_counter() - query_started)
+        hits += len({doc_rows[r["doc_id"]] for r in results} & expected)
+    stats = LatencyStats.from_samples(latencies, 0, time.perf_counter() - started)
+    return hits / (len(truth) * k), stats
+
+
+def sweep(args, service, vectorstore_id, query_embeddings, truth, doc_rows):
+    configurations = []
+    for m in parse_ints(args.hnsw_m):
+        for ef_construction in parse_ints(args.hnsw_ef_construction):
+            configurations.append(
+                (
+                    "hnsw",
+                    {"m": m, "ef_construction": ef_construction},
+                    "ef_search",
+                    parse_ints(args.hnsw_ef_search),
+                )
+            )
+    lists_values = parse_ints(args.ivfflat_lists) or [
+        max(1, len(doc_rows) // 1000),
+        max(1, int(np.sqrt(len(doc_rows)))),
+    ]
+    for lists in sorted(set(lists_values)):
+        configurations.append(
+            ("ivfflat", {"lists": lists}, "probes", parse_ints(args.ivfflat_probes))
+        )
+
+    conn = psycopg2.connect(**settings.DATABASE_CONNECTION_CONFIG)
+    conn.autocommit = True
+    results: List[AnnResult] = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DROP INDEX IF EXISTS ix_documents_embedding_hnsw")
+
+        for index, build_params, search_param, search_values in configurations:
+            build_seconds, index_mb = build_index(
+                conn, index, build_params, args.maintenance_work_mem
+            )
+            used = index_used(conn, vectorstore_id, query_embeddings[0], args.k)
+            if not used:
+                logging.warning(
+                    f"Планировщик не использует индекс {index} {build_params}: "
+                    "корпус слишком мал, результаты соответствуют полному перебору"
+                )
+            for value in search_values:
+                if index == "hnsw":
+                    settings.HNSW_EF_SEARCH = value
+                else:
+                    settings.IVFFLAT_PROBES = value
+                recall, stats = measure(
+                    service, vectorstore_id, query_embeddings, truth, doc_rows, args.k
+                )
+                result = AnnResult(
+                    index=index,
+                    build_params=build_params,
+                    search_param=search_param,
+                    search_value=value,
+                    recall=recall,
+                    p50_ms=stats.p50_ms,
+                    p95_ms=stats.p95_ms,
+                    build_seconds=build_seconds,
+                    index_mb=index_mb,
+                    index_used=used,
+                )
+                results.append(result)
+                print(format_row(result), flush=True)
+    finally:
+        conn.close()
+    return results
+
+
+def format_row(result: AnnResult) -> str:
+    params = ",".join(f"{name}={value}" for name, value in result.build_params.items())
+    return (
+        f"{result.index:<8}{params:<24}"
+        f"{result.search_param + '=' + str(result.search_value):<16}"
+        f"{result.recall:>8.3f}{result.p50_ms:>10.2f}{result.p95_ms:>10.2f}"
+        f"{result.build_seconds:>10.1f}{result.index_mb:>10.1f}"
+        f"{'' if result.index_used else '  seqscan'}"
+    )
+
+
+def recommend(results: List[AnnResult], target_recall: float) -> Optional[AnnResult]:
+    candidates = [r for r in results if r.index_used and r.recall >= target_recall]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda r: (r.p95_ms, r.build_seconds, r.index_mb))
+
+
+def run(args) -> List[AnnResult]:
+    # Модули приложения импортируются после подмены настроек,
+    # так как движок БД и модель создаются при импорте.
+    from app.api.dependencies import SessionLocal, get_vectorstore_service
+
+    corpus = Corpus(args.seed)
+    texts, queries = load_texts(args, corpus)
+    service = get_vectorstore_service()
+
+    db = SessionLocal()
+    try:
+        user = service.create_user(db, f"ann_tuner_{args.seed}")
+        vectorstore_id = service.create_vectorstore(
+            db, user.user_id, "ann_tuner.txt"
+        ).vectorstore_id
+    finally:
+        db.close()
+
+    started = time.perf_counter()
+    batch = args.batch_size
+    for offset in range(0, len(texts), batch):
+        end = offset + batch
+        service.add_texts(vectorstore_id, texts[offset:end])
+    logging.warning(
+        f"Загружено {len(texts)} документов за {time.perf_counter() - started:.1f} с"
+    )
+
+    doc_ids, embeddings = [], []
+    for document in service.iter_documents(vectorstore_id, include_embeddings=True):
+        doc_ids.append(document["doc_id"])
+        embeddings.append(document["embedding"])
+    doc_rows = {doc_id: row for row, doc_id in enumerate(doc_ids)}
+    query_embeddings = [service.embedding_model.embed_query(q) for q in queries]
+    truth = exact_neighbors(
+        np.asarray(embeddings, dtype=np.float32),
+        np.asarray(query_embeddings, dtype=np.float32),
+        args.k,
+    )
+
+    print(
+        f"{'index':<8}{'build':<24}{'search':<16}"
+        f"{'recall':>8}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'MB':>10}"
+    )
+    return sweep(args, service, vectorstore_id, query_embeddings, truth, doc_rows)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--corpus", help="Файл с документами, по одному на строку")
+    parser.add_argument("--queries", help="Файл с запросами, по одному на строку")
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--query-count", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--k", type=int, default=settings.K_RESULTS)
+    parser.add_argument(
+        "--model",
+        choices=["fake", "sentence_transformers"],
+        default="fake",
+        help="Модель эмбеддингов; fake не требует загрузки весов",
+    )
+    parser.add_argument("--hnsw-m", default="8,16,32")
+    parser.add_argument("--hnsw-ef-construction", default="64,128")
+    parser.add_argument("--hnsw-ef-search", default="10,20,40,80,160")
+    parser.add_argument(
+        "--ivfflat-lists",
+        default="",
+        help="По умолчанию n/1000 и sqrt(n) для n документов",
+    )
+    parser.add_argument("--ivfflat-probes", default="1,2,4,8,16,32")
+    parser.add_argument("--maintenance-work-mem", default="512MB")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--output", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    settings.EMBEDDING_MODEL_TYPE = args.model
+    with disposable_database(prefix="ann_tuner"):
+        results = run(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([asdict(result) for result in results], f, indent=2)
+            f.write("\n")
+
+    best = recommend(results, args.target_recall)
+    if best is None:
+        print(
+            f"Ни одна конфигурация не достигла recall@{args.k} >= {args.target_recall}"
+        )
+        return 1
+
+    print(f"\nРекомендация для recall@{args.k} >= {args.target_recall}:")
+    print(format_row(best))
+    if best.index == "hnsw":
+        print(
+            f"  индекс: USING hnsw (embedding vector_cosine_ops) "
+            f"WITH (m = {best.build_params['m']}, "
+            f"ef_construction = {best.build_params['ef_construction']})"
+        )
+        print(f"  HNSW_EF_SEARCH={best.search_value}")
+    else:
+        print(
+            f"  индекс: USING ivfflat (embedding vector_cosine_ops) "
+            f"WITH (lists = {best.build_params['lists']})"
+        )
+        print(f"  IVFFLAT_PROBES={best.search_value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
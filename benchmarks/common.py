@@ -0,0 +1,170 @@
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import psycopg2
+from psycopg2 import sql
+
+from alembic import command
+from alembic.config import Config
+from app.config import settings
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+@contextmanager
+def disposable_database(prefix: str = "bench") -> Iterator[str]:
+    """
+    Создает временную базу данных на сервере из настроек, применяет миграции
+    и удаляет базу по завершении.
+
+    На время работы `settings.DB_NAME` указывает на временную базу, поэтому
+    модули приложения нужно импортировать уже внутри контекста.
+
+    Args:
+        prefix: Префикс имени временной базы
+
+    Yields:
+        Имя созданной базы данных
+    """
+    db_name = f"{prefix}_{uuid.uuid4().hex[:8]}"
+    original_db_name = settings.DB_NAME
+    admin_config = {**settings.DATABASE_CONNECTION_CONFIG, "database": "postgres"}
+
+    admin_conn = psycopg2.connect(**admin_config)
+    admin_conn.autocommit = True
+    try:
+        with admin_conn.cursor() as cur:
+            cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(db_name)))
+
+        settings.DB_NAME = db_name
+        conn = psycopg2.connect(**settings.DATABASE_CONNECTION_CONFIG)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        finally:
+            conn.close()
+
+        alembic_config = Config(os.path.join(REPO_ROOT, "alembic.ini"))
+        alembic_config.set_main_option(
+            "script_location", os.path.join(REPO_ROOT, "alembic")
+        )
+        command.upgrade(alembic_config, "head")
+
+        yield db_name
+    finally:
+        settings.DB_NAME = original_db_name
+        with admin_conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(
+                    sql.Identifier(db_name)
+                )
+            )
+        admin_conn.close()
+
+
+@dataclass
+class LatencyStats:
+    count: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    rps: float
+
+    @classmethod
+    def from_samples(
+        cls, latencies: List[float], errors: int, wall_time: float
+    ) -> "LatencyStats":
+        """
+        Args:
+            latencies: Длительности успешных запросов в секундах
+            errors: Количество неуспешных запросов
+            wall_time: Общее время прогона в секундах
+        """
+        samples = np.asarray(latencies or [0.0]) * 1000
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return cls(
+            count=len(latencies),
+            errors=errors,
+            p50_ms=float(p50),
+            p95_ms=float(p95),
+            p99_ms=float(p99),
+            rps=len(latencies) / wall_time if wall_time > 0 else 0.0,
+        )
+
+
+def format_report(results: Dict[str, LatencyStats]) -> str:
+    lines = [
+        f"{'scenario':<20}{'count':>8}{'errors':>8}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}"
+    ]
+    for name, stats in results.items():
+        lines.append(
+            f"{name:<20}{stats.count:>8}{stats.errors:>8}"
+            f"{stats.p50_ms:>10.1f}{stats.p95_ms:>10.1f}{stats.p99_ms:>10.1f}"
+            f"{stats.rps:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def load_baseline(path: str, profile: str) -> Optional[Dict[str, LatencyStats]]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        profiles = json.load(f)
+    if profile not in profiles:
+        return None
+    return {name: LatencyStats(**data) for name, data in profiles[profile].items()}
+
+
+def save_baseline(path: str, profile: str, results: Dict[str, LatencyStats]) -> None:
+    profiles = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            profiles = json.load(f)
+    profiles[profile] = {name: asdict(stats) for name, stats in results.items()}
+    with open(path, "w") as f:
+        json.dump(profiles, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare_with_baseline(
+    results: Dict[str, LatencyStats],
+    baseline: Dict[str, LatencyStats],
+    tolerance: float,
+) -> List[str]:
+    """
+    Сравнивает результаты прогона с сохраненным baseline.
+
+    Args:
+        results: Результаты текущего прогона
+        baseline: Сохраненные результаты
+        tolerance: Допустимое относительное ухудшение (0.2 = 20%)
+
+    Returns:
+        Список описаний регрессий; пустой, если регрессий нет
+    """
+    regressions = []
+    for name, stats in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if stats.errors > expected.errors:
+            regressions.append(
+                f"{name}: ошибок {stats.errors}, в baseline {expected.errors}"
+            )
+        if stats.p95_ms > expected.p95_ms * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {stats.p95_ms:.1f} ms, в baseline {expected.p95_ms:.1f} ms"
+            )
+        if stats.rps < expected.rps * (1 - tolerance):
+            regressions.append(
+                f"{name}: {stats.rps:.1f} req/s, в baseline {expected.rps:.1f} req/s"
+            )
+    return regressions
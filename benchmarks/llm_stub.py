@@ -0,0 +1,86 @@
+"""
+Локальная заглушка LLM-сервиса для нагрузочного тестирования.
+
+Повторяет контракт `POST /api/rag/process` сервиса llm-nginx: принимает
+payload из `rag_query` и через заданную задержку возвращает фиксированный ответ.
+
+Запуск отдельно:
+    python -m benchmarks.llm_stub --port 8081 --delay-ms 50
+"""
+import argparse
+import asyncio
+import socket
+import threading
+import time
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import FastAPI
+
+RAG_PROCESS_PATH = "/api/rag/process"
+
+
+def create_app(delay_ms: float = 0.0) -> FastAPI:
+    stub = FastAPI(title="LLM stub")
+
+    @stub.post(RAG_PROCESS_PATH)
+    async def process(payload: Dict[str, Any]):
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+        return {
+            "status": "ok",
+            "answer": f"stub answer for: {payload.get('query', '')}",
+            "candidates_count": len(payload.get("candidates", [])),
+        }
+
+    return stub
+
+
+class LLMStubServer:
+    """Запускает заглушку в фоновом потоке на свободном локальном порту."""
+
+    def __init__(self, delay_ms: float = 0.0, host: str = "127.0.0.1"):
+        self.host = host
+        self.port = _free_port(host)
+        self._server = uvicorn.Server(
+            uvicorn.Config(
+                create_app(delay_ms),
+                host=host,
+                port=self.port,
+                log_level="warning",
+                lifespan="off",
+            )
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}{RAG_PROCESS_PATH}"
+
+    def __enter__(self) -> "LLMStubServer":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Заглушка LLM-сервиса не запустилась")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.delay_ms), host=args.host, port=args.port)
@@ -0,0 +1,244 @@
+"""
+Офлайн нагрузочный тест сервиса векторных хранилищ.
+
+Поднимает временную базу данных, подменяет модель эмбеддингов
+детерминированной заглушкой, а LLM-сервис — локальной заглушкой, и
+прогоняет сценарии create_vectorstore, add_texts, similarity_search и
+rag_query с заданной конкурентностью. Результаты сравниваются с baseline,
+при регрессии процесс завершается с кодом 1, а если baseline для профиля
+нет — с кодом 2 (сравнение можно отключить флагом --no-baseline).
+
+Пример:
+    python -m benchmarks.load_test --concurrency 8 --requests 200
+    python -m benchmarks.load_test --update-baseline
+    python -m benchmarks.load_test --no-baseline
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+from app.config import settings
+from benchmarks.common import (
+    LatencyStats,
+    compare_with_baseline,
+    disposable_database,
+    format_report,
+    load_baseline,
+    save_baseline,
+)
+from benchmarks.llm_stub import LLMStubServer
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+
+class Corpus:
+    """Генератор детерминированных синтетических текстов."""
+
+    def __init__(self, seed: int, vocabulary_size: int = 2000):
+        self.rng = random.Random(seed)
+        alphabet = "abcdefghijklmnopqrstuvwxyz"
+        self.vocabulary = [
+            "".join(self.rng.choices(alphabet, k=self.rng.randint(3, 10)))
+            for _ in range(vocabulary_size)
+        ]
+
+    def text(self, min_words: int = 50, max_words: int = 400) -> str:
+        count = self.rng.randint(min_words, max_words)
+        return " ".join(self.rng.choices(self.vocabulary, k=count))
+
+    def query(self) -> str:
+        return self.text(min_words=3, max_words=12)
+
+
+async def drive(
+    call: Callable[[int], Awaitable[None]], total: int, concurrency: int
+) -> LatencyStats:
+    """
+    Выполняет `total` вызовов `call(i)` не более чем в `concurrency` потоков.
+
+    Args:
+        call: Асинхронная функция одного запроса; исключение считается ошибкой
+        total: Общее количество запросов
+        concurrency: Количество одновременно выполняемых запросов
+
+    Returns:
+        Статистика задержек и пропускной способности
+    """
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                await call(i)
+            except Exception as e:
+                errors += 1
+                logging.debug(f"Ошибка запроса {i}: {e}")
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return LatencyStats.from_samples(latencies, errors, time.perf_counter() - started)
+
+
+async def run_scenarios(args) -> Dict[str, LatencyStats]:
+    # Модули приложения импортируются после подмены настроек,
+    # так как движок БД и модель создаются при импорте.
+    from app.api.dependencies import SessionLocal, get_vectorstore_service
+    from app.main import app
+
+    corpus = Corpus(args.seed)
+    service = get_vectorstore_service()
+    telegram_id = f"bench_{args.seed}"
+    db = SessionLocal()
+    try:
+        service.create_user(db, telegram_id)
+    finally:
+        db.close()
+
+    results: Dict[str, LatencyStats] = {}
+    file_names: List[str] = []
+    vectorstore_ids: List[int] = []
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+
+        async def create_vectorstore(i: int):
+            file_name = f"bench_{i}.txt"
+            response = await client.post(
+                f"/api/v1/users/{telegram_id}/create_vectorstore/",
+                json={"file_name": file_name, "text": corpus.text()},
+            )
+            response.raise_for_status()
+            file_names.append(file_name)
+            vectorstore_ids.append(response.json()["vectorstore_id"])
+
+        results["create_vectorstore"] = await drive(
+            create_vectorstore, args.requests, args.concurrency
+        )
+        if not vectorstore_ids:
+            raise RuntimeError("Не удалось создать ни одного векторного хранилища")
+
+        async def add_texts(i: int):
+            texts = [corpus.text() for _ in range(args.batch_size)]
+            await asyncio.to_thread(
+                service.add_texts, vectorstore_ids[i % len(vectorstore_ids)], texts
+            )
+
+        results["add_texts"] = await drive(add_texts, args.requests, args.concurrency)
+
+        async def similarity_search(i: int):
+            await asyncio.to_thread(
+                service.similarity_search,
+                vectorstore_ids[i % len(vectorstore_ids)],
+                corpus.query(),
+                settings.K_RESULTS,
+            )
+
+        results["similarity_search"] = await drive(
+            similarity_search, args.requests, args.concurrency
+        )
+
+        async def rag_query(i: int):
+            response = await client.post(
+                f"/api/v1/vectorstores/{telegram_id}/rag_query/",
+                json={
+                    "query": corpus.query(),
+                    "file_name": file_names[i % len(file_names)],
+                },
+            )
+            response.raise_for_status()
+
+        results["rag_query"] = await drive(rag_query, args.requests, args.concurrency)
+
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument(
+        "--batch-size", type=int, default=16, help="Текстов в одном add_texts"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--embedding-latency-ms",
+        type=float,
+        default=0.0,
+        help="Искусственная задержка заглушки эмбеддингов на один текст",
+    )
+    parser.add_argument("--llm-delay-ms", type=float, default=20.0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Имя профиля в файле baseline (по умолчанию c<concurrency>)",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--no-baseline",
+        action="store_true",
+        help="Только вывести отчет, не сравнивая с baseline",
+    )
+    args = parser.parse_args()
+    profile = args.profile or f"c{args.concurrency}"
+
+    baseline = None
+    if not (args.update_baseline or args.no_baseline):
+        # Без baseline регрессию обнаружить нельзя, поэтому это ошибка,
+        # а не молчаливый пропуск сравнения.
+        baseline = load_baseline(args.baseline, profile)
+        if baseline is None:
+            print(
+                f"Baseline '{profile}' не найден в {args.baseline}: сохраните его "
+                "через --update-baseline или запустите с --no-baseline"
+            )
+            return 2
+
+    logging.basicConfig(level=logging.WARNING)
+    settings.EMBEDDING_MODEL_TYPE = "fake"
+    settings.FAKE_EMBEDDING_LATENCY_MS = args.embedding_latency_ms
+
+    with LLMStubServer(delay_ms=args.llm_delay_ms) as llm_stub:
+        settings.LLM_SERVICE_URL = llm_stub.url
+        with disposable_database():
+            results = asyncio.run(run_scenarios(args))
+
+    print(format_report(results))
+
+    if args.update_baseline:
+        save_baseline(args.baseline, profile, results)
+        print(f"Baseline '{profile}' сохранен в {args.baseline}")
+        return 0
+    if args.no_baseline:
+        return 0
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("РЕГРЕССИЯ ПРОИЗВОДИТЕЛЬНОСТИ:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print(f"Регрессий относительно baseline '{profile}' нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())